@@ -0,0 +1,59 @@
+"""Deterministic synthetic datasets shaped like the MooVitamix API resources.
+
+The rows come from the vectorized generator of the fake API, so the dataset served
+over HTTP during the extract benchmark and the DTOs fed to the transform and load
+benchmarks are the same. Rows are only built when a slice is requested, so a 10M
+listen events dataset stays small in memory.
+"""
+
+import math
+from typing import Iterator, List
+
+from src.moovitamix_etl.extract.dtos.listen_history import ListenHistoryDto
+from src.moovitamix_etl.extract.dtos.track_dto import TrackDto
+from src.moovitamix_etl.extract.dtos.user_dto import UserDto
+from src.moovitamix_fastapi.vectorized_fake_data import VectorizedFakeDataGenerator
+
+
+class SyntheticDataset:
+    """Tracks, users and listen history generated deterministically from a seed.
+
+    As in the fake API, every user has one listen history entry holding
+    `items_per_user` track ids, so the dataset holds `listen_events` listen events
+    (rounded up to a whole number of users).
+
+    Args:
+        listen_events (int): number of listen events to generate.
+        seed (int, optional): random seed. Defaults to 42.
+        items_per_user (int, optional): tracks listened per user. Defaults to 5.
+        tracks_per_user (float, optional): number of tracks relative to users. Defaults to 0.5.
+    """
+
+    def __init__(self, listen_events: int, seed: int = 42, items_per_user: int = 5, tracks_per_user: float = 0.5):
+        self.listen_events = listen_events
+        self.seed = seed
+        self.items_per_user = items_per_user
+        self.n_users = max(1, math.ceil(listen_events / items_per_user))
+        self.n_tracks = max(items_per_user, int(self.n_users * tracks_per_user))
+
+        generator = VectorizedFakeDataGenerator(
+            self.n_users,
+            seed=seed,
+            items_per_user=items_per_user,
+            n_tracks=self.n_tracks
+        )
+        self.tracks, self.users, self.listen_history = generator.generate_fake_data()
+
+    def iter_dtos(self, resource: str, batch_size: int = 10000) -> Iterator[List]:
+        """Iterate over a resource as batches of Data Transfer Objects"""
+        rows, dto_class = {
+            "tracks": (self.tracks, TrackDto),
+            "users": (self.users, UserDto),
+            "listen_history": (self.listen_history, ListenHistoryDto),
+        }[resource]
+        for start in range(0, len(rows), batch_size):
+            yield [dto_class.from_dict(row) for row in rows[start:start + batch_size]]
+
+    def dtos(self, resource: str) -> List:
+        """Every row of a resource as Data Transfer Objects"""
+        return [dto for batch in self.iter_dtos(resource) for dto in batch]
@@ -0,0 +1,281 @@
+"""Benchmark the ETL stages on synthetic datasets of growing size.
+
+For each scale, a dataset of N listen events is generated deterministically, then:
+
+- extract: every page is pulled with `Extractor` from the fake FastAPI app, served
+  in-process by uvicorn with the synthetic dataset;
+- transform: `DataTransformer.transform_all` runs on the dataset DTOs;
+- load: `DataLoader.load_all` writes the result to SQLite (default) or to the
+  database given by --db-url;
+- parallel: `ParallelTransformer.transform_dtos` runs twice on the dataset DTOs,
+  starting its process pool then reusing it, and `DataLoader.load_tables` writes
+  its Arrow tables. The speedups over the serial transform (and load) are reported.
+
+Each scale runs in its own process so that peak memory is measured independently.
+Results are appended as JSON lines to the output file, to be compared across versions.
+
+Usage:
+    python -m benchmarks.run_benchmarks --scales 10000 100000 1000000
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Generator, List, Optional
+
+import uvicorn
+
+from benchmarks.datasets import SyntheticDataset
+from src.moovitamix_etl.extract.extractor import Extractor
+from src.moovitamix_etl.load.data_loader import DataLoader
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.metrics import PipelineMetrics
+from src.moovitamix_etl.transform.data_transformer import DataTransformer
+from src.moovitamix_etl.transform.parallel_transformer import ParallelTransformer
+
+ROOT = Path(__file__).resolve().parent.parent
+FAKE_API_FOLDER = ROOT / "src" / "moovitamix_fastapi"
+DEFAULT_OUTPUT = ROOT / "benchmarks" / "results.jsonl"
+STAGES = ("extract", "transform", "load", "parallel")
+
+
+def _version() -> str:
+    """Git revision of the benchmarked code"""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve_dataset(dataset: SyntheticDataset) -> Generator[str, None, None]:
+    """Serve the dataset with the fake API app in a background thread, yield its URL"""
+    if str(FAKE_API_FOLDER) not in sys.path:
+        sys.path.insert(0, str(FAKE_API_FOLDER))
+    # Plain sequences are paginated on purpose, not SQLAlchemy queries
+    warnings.filterwarnings("ignore", message='Package "sqlalchemy" is installed')
+    fake_api = importlib.import_module("main")
+    # The endpoints paginate these module globals, which only need len() and slicing
+    fake_api.tracks = dataset.tracks
+    fake_api.users = dataset.users
+    fake_api.listen_history = dataset.listen_history
+    fake_api.data_version = f"synthetic-{dataset.seed}-{dataset.listen_events}"
+
+    with serve_app(fake_api.app, name="fake-api") as api_url:
+        yield api_url
+
+
+@contextmanager
+def serve_app(app, name: str = "app") -> Generator[str, None, None]:
+    """Serve an ASGI app with uvicorn in a background thread, yield its URL once started"""
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name=name, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"{name} failed to start")
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def run_scale(
+    listen_events: int,
+    seed: int,
+    stages: List[str],
+    db_url: Optional[str],
+    reset_db: bool,
+    transform_workers: int = 2
+) -> dict:
+    """Benchmark every requested stage on one dataset and return the results"""
+    metrics = PipelineMetrics()
+
+    with metrics.stage("generate") as stage:
+        dataset = SyntheticDataset(listen_events, seed=seed)
+        stage.add_rows(len(dataset.tracks) + len(dataset.users) + len(dataset.listen_history))
+
+    if "extract" in stages:
+        with serve_dataset(dataset) as api_url:
+            extractor = Extractor(api_url=api_url, metrics=metrics)
+            with metrics.stage("extract") as stage:
+                for _, _, dtos in extractor.iter_all_resources(size=100):
+                    stage.add_rows(len(dtos))
+
+    if "transform" in stages or "load" in stages:
+        tracks_dtos = dataset.dtos("tracks")
+        users_dtos = dataset.dtos("users")
+        history_dtos = dataset.dtos("listen_history")
+        with metrics.stage("transform") as stage:
+            tracks, users, listen_history, genres = DataTransformer().transform_all(
+                tracks_dtos, users_dtos, history_dtos
+            )
+            stage.add_rows(len(tracks) + len(users) + len(listen_history) + len(genres))
+        del tracks_dtos, users_dtos, history_dtos
+
+    if "load" in stages:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_config = DatabaseConfig(url=db_url or f"sqlite:///{tmp}/benchmark.db")
+            if db_url and reset_db:
+                db_config.drop_database()
+            db_config.init_database()
+            loader = DataLoader(db_config=db_config, metrics=metrics)
+            with metrics.stage("load") as stage:
+                loader.load_all(tracks, users, listen_history, genres)
+                stage.add_rows(len(tracks) + len(users) + len(listen_history) + len(genres))
+            db_config.dispose_engine()
+
+    if "parallel" in stages:
+        run_parallel(dataset, metrics, transform_workers, db_url, reset_db)
+
+    metrics.finish(success=True)
+    report = metrics.to_dict()
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "version": _version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "listen_events": listen_events,
+        "seed": seed,
+        "database": (db_url or "sqlite").split(":")[0],
+        "duration_seconds": report["duration_seconds"],
+        "process_peak_rss_bytes": report["process_peak_rss_bytes"],
+        "stages": report["stages"],
+        "speedups": speedups(report["stages"]),
+        "http_requests": report["http_requests"],
+    }
+
+
+def run_parallel(
+    dataset: SyntheticDataset,
+    metrics: PipelineMetrics,
+    workers: int,
+    db_url: Optional[str],
+    reset_db: bool
+) -> None:
+    """Transform the dataset with a process pool, cold then warm, and load its Arrow tables"""
+    dtos = [dataset.dtos(resource) for resource in ("tracks", "users", "listen_history")]
+    transformer = ParallelTransformer(workers=workers)
+    try:
+        # The first call pays for the start of the worker processes, the next ones reuse them
+        for name in ("transform.pool_start", "transform.parallel"):
+            with metrics.stage(name) as stage:
+                tables = transformer.transform_dtos(*dtos)
+                stage.add_rows(sum(table.num_rows for table in tables.values()))
+    finally:
+        transformer.close()
+    del dtos
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_config = DatabaseConfig(url=db_url or f"sqlite:///{tmp}/benchmark_tables.db")
+        if db_url and reset_db:
+            db_config.drop_database()
+        db_config.init_database()
+        loader = DataLoader(db_config=db_config, metrics=metrics)
+        with metrics.stage("load.tables") as stage:
+            loader.load_tables(tables)
+            stage.add_rows(sum(table.num_rows for table in tables.values()))
+        db_config.dispose_engine()
+
+
+def speedups(stages: dict) -> dict:
+    """Wall time of the serial transform (and load) over the parallel one, for the stages run"""
+    def wall_time(*names):
+        return sum(stages[name]["wall_time_seconds"] for name in names)
+
+    result = {}
+    if {"transform", "transform.parallel"} <= set(stages):
+        result["transform"] = wall_time("transform") / wall_time("transform.parallel")
+    if {"transform", "load", "transform.parallel", "load.tables"} <= set(stages):
+        result["transform_load"] = wall_time("transform", "load") / wall_time("transform.parallel", "load.tables")
+    return result
+
+
+def append_result(result: dict, output: Path) -> None:
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "a") as f:
+        f.write(json.dumps(result) + "\n")
+
+
+def print_summary(result: dict) -> None:
+    print(f"\n== {result['listen_events']:,} listen events ({result['version']}) ==")
+    for name, stage in result["stages"].items():
+        print(
+            f"{name:<22} {stage['wall_time_seconds']:>10.3f} s "
+            f"{stage['rows_per_second']:>14,.0f} rows/s "
+            f"{stage['peak_rss_delta_bytes'] / 1024 / 1024:>10.1f} MiB peak RSS growth"
+        )
+    print(f"process peak RSS {result['process_peak_rss_bytes'] / 1024 / 1024:>10.1f} MiB")
+    for name, speedup in result["speedups"].items():
+        print(f"speedup {name:<14} {speedup:>10.2f} x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MoovitaMix ETL benchmarks")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10_000, 100_000],
+                        help="Number of listen events of each dataset (default: 10000 100000)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed of the datasets (default: 42)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES),
+                        help="Stages to benchmark (default: all)")
+    parser.add_argument("--db-url", type=str, default=None,
+                        help="SQLAlchemy URL of the load database (default: a temporary SQLite file)")
+    parser.add_argument("--reset-db", action="store_true",
+                        help="Drop and recreate the tables of --db-url before loading")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT,
+                        help=f"JSON lines file the results are appended to (default: {DEFAULT_OUTPUT})")
+    parser.add_argument("--transform-workers", type=int, default=2,
+                        help="Worker processes of the parallel stage (default: 2)")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Run every scale in this process instead of one process per scale")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    for scale in args.scales:
+        if args.in_process or len(args.scales) == 1:
+            result = run_scale(scale, args.seed, args.stages, args.db_url, args.reset_db, args.transform_workers)
+            append_result(result, args.output)
+            print_summary(result)
+        else:
+            command = [
+                sys.executable, "-m", "benchmarks.run_benchmarks",
+                "--scales", str(scale),
+                "--seed", str(args.seed),
+                "--stages", *args.stages,
+                "--output", str(args.output),
+                "--transform-workers", str(args.transform_workers),
+            ]
+            if args.db_url:
+                command += ["--db-url", args.db_url]
+            if args.reset_db:
+                command.append("--reset-db")
+            subprocess.run(command, cwd=ROOT, env=dict(os.environ), check=True)
+
+
+if __name__ == "__main__":
+    main()
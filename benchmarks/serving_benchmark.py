@@ -0,0 +1,143 @@
+"""Benchmark the latency of the recommendations API under concurrent load.
+
+A synthetic dataset is loaded into SQLite with its aggregates, interaction matrix
+and track similarities, then the serving app is started in-process by uvicorn and
+`--clients` threads send `--requests` requests, spread over the users and tracks
+of the dataset. The p50, p95 and p99 latencies are measured on a cold cache (no
+warmup, everything computed on the first request) and on a warm cache.
+
+Usage:
+    python -m benchmarks.serving_benchmark --listen-events 100000 --clients 16 --requests 5000
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import requests
+
+from benchmarks.datasets import SyntheticDataset
+from benchmarks.run_benchmarks import ROOT, _version, serve_app
+from src.moovitamix_etl.export.interaction_matrix import InteractionMatrixExporter, load_matrix
+from src.moovitamix_etl.export.similarity import SimilarityBuilder
+from src.moovitamix_etl.load.data_loader import DataLoader
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.transform.data_transformer import DataTransformer
+from src.moovitamix_serving.app import create_app
+
+DEFAULT_OUTPUT = ROOT / "benchmarks" / "serving_results.jsonl"
+
+
+def prepare_database(dataset: SyntheticDataset, folder: str) -> DatabaseConfig:
+    """Load the dataset with its aggregates and similarities into a SQLite database"""
+    db_config = DatabaseConfig(url=f"sqlite:///{folder}/serving.db")
+    db_config.init_database()
+    tracks, users, listen_history, genres = DataTransformer().transform_all(
+        dataset.dtos("tracks"), dataset.dtos("users"), dataset.dtos("listen_history")
+    )
+    DataLoader(db_config=db_config, core=True, aggregates=True).load_all(tracks, users, listen_history, genres)
+    matrix_dir = os.path.join(folder, "matrix")
+    InteractionMatrixExporter(db_config, matrix_dir).export()
+    SimilarityBuilder(db_config).build(load_matrix(matrix_dir))
+    return db_config
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    values = np.array(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def run_load(api_url: str, paths: List[str], clients: int) -> Dict[str, float]:
+    """Send every request from `clients` threads, each with its own connection, and time them"""
+    def worker(chunk: List[str]) -> List[float]:
+        latencies = []
+        with requests.Session() as session:
+            for path in chunk:
+                start = time.perf_counter()
+                response = session.get(api_url + path)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code not in (200, 404):
+                    response.raise_for_status()
+        return latencies
+
+    chunks = [paths[index::clients] for index in range(clients)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = [latency for chunk in pool.map(worker, chunks) for latency in chunk]
+    elapsed = time.perf_counter() - start
+    return dict(percentiles(latencies), requests=len(latencies), requests_per_second=round(len(latencies) / elapsed, 1))
+
+
+def request_paths(dataset: SyntheticDataset, count: int, seed: int) -> List[str]:
+    """Recommendations of random users and similar tracks of random tracks, half each"""
+    rng = random.Random(seed)
+    users = [user["id"] for user in dataset.users[:]]
+    tracks = [track["id"] for track in dataset.tracks[:]]
+    return [
+        f"/recommendations/users/{rng.choice(users)}?n=10" if index % 2 == 0
+        else f"/recommendations/tracks/{rng.choice(tracks)}/similar?n=10"
+        for index in range(count)
+    ]
+
+
+def run_benchmark(listen_events: int, seed: int, clients: int, count: int, cache_size: Optional[int] = None) -> dict:
+    """Latencies on a cold and on a warm cache"""
+    dataset = SyntheticDataset(listen_events, seed=seed)
+    paths = request_paths(dataset, count, seed)
+    result = {
+        "version": _version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "listen_events": listen_events,
+        "clients": clients,
+    }
+    with tempfile.TemporaryDirectory() as folder:
+        db_config = prepare_database(dataset, folder)
+        app = create_app(db_config, cache_size=cache_size, warmup_users=0, warmup_tracks=0)
+        with serve_app(app, name="serving") as api_url:
+            result["cold"] = run_load(api_url, paths, clients)
+            result["warm"] = run_load(api_url, paths, clients)
+            result["cache"] = requests.get(f"{api_url}/health").json()["cache"]
+        db_config.dispose_engine()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MoovitaMix recommendations API latency benchmark")
+    parser.add_argument("--listen-events", type=int, default=20_000, help="Size of the dataset (default: 20000)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed of the dataset and requests (default: 42)")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients (default: 8)")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per phase (default: 2000)")
+    parser.add_argument("--cache-size", type=int, default=None, help="Lists kept in the cache (default: 100000)")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT,
+                        help=f"JSON lines file the results are appended to (default: {DEFAULT_OUTPUT})")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    result = run_benchmark(args.listen_events, args.seed, args.clients, args.requests, args.cache_size)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "a") as f:
+        f.write(json.dumps(result) + "\n")
+    for phase in ("cold", "warm"):
+        stats = result[phase]
+        print(
+            f"{phase:>5}: p50 {stats['p50_ms']:>8.2f} ms  p95 {stats['p95_ms']:>8.2f} ms  "
+            f"p99 {stats['p99_ms']:>8.2f} ms  {stats['requests_per_second']:>8.1f} req/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict
+
+# Where --resume looks for the checkpoint when no file is given
+DEFAULT_CHECKPOINT_FILE = os.path.join("checkpoints", "etl_checkpoint.json")
+
+
+class Checkpoint:
+    """Progress of a streaming run, persisted so that a failed run can be resumed.
+
+    For each resource, the checkpoint records the last page handed over by the
+    extract stage and the last page whose load batch was committed. A resumed run
+    starts each resource right after its last committed page: the pages extracted
+    but not committed yet are extracted again.
+
+    Only these page counters are kept: the source ids of the tracks and users
+    matched to an existing row with another id are in the `id_aliases` table,
+    through which the loader resolves them on resume.
+
+    Args:
+        path (str): JSON file holding the checkpoint.
+        page_size (int): page size of the run; a run can only be resumed with the same one.
+    """
+
+    def __init__(self, path: str, page_size: int):
+        self.path = path
+        self.page_size = page_size
+        self.resources: Dict[str, Dict[str, int]] = {}
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, page_size: int) -> "Checkpoint":
+        """Read the checkpoint left by a previous run, or start a new one if there is none
+
+        Raises:
+            ValueError: the previous run used another page size, so its pages do not line up
+        """
+        checkpoint = cls(path, page_size)
+        if not os.path.exists(path):
+            return checkpoint
+        with open(path) as f:
+            state = json.load(f)
+        if state['page_size'] != page_size:
+            raise ValueError(
+                f"Cannot resume with a page size of {page_size}: "
+                f"the checkpoint {path} was written with {state['page_size']}"
+            )
+        checkpoint.resources = state['resources']
+        return checkpoint
+
+    def save(self) -> None:
+        """Write the checkpoint to a temporary file then rename it, so it is never half written"""
+        with self._lock:
+            state = {'page_size': self.page_size, 'resources': self.resources}
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+
+    def remove(self) -> None:
+        """Delete the checkpoint once the run completed"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def last_loaded(self, resource: str) -> int:
+        """Last page of a resource committed to the database, 0 if none"""
+        return self.resources.get(resource, {}).get('load', 0)
+
+    def start_pages(self) -> Dict[str, int]:
+        """First page to extract for each resource"""
+        return {resource: progress.get('load', 0) + 1 for resource, progress in self.resources.items()}
+
+    def mark_extracted(self, resource: str, page: int) -> None:
+        with self._lock:
+            self.resources.setdefault(resource, {})['extract'] = page
+        self.save()
+
+    def mark_loaded(self, resource: str, page: int) -> None:
+        """Record a committed load batch"""
+        with self._lock:
+            self.resources.setdefault(resource, {})['load'] = page
+        self.save()
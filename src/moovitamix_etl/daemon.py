@@ -0,0 +1,163 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from src.moovitamix_etl.metrics import METRIC_PREFIX
+
+
+class EtlDaemon:
+    """Run a pipeline on a schedule in a long-lived process.
+
+    The pipeline keeps its HTTP session, database engine, genres and id mappings
+    warm between runs (see `ETLPipeline(keep_warm=True)`), so a scheduled run only
+    pays for the data that changed. A small HTTP server exposes `/health`, a JSON
+    status answering 503 while the last run failed, and `/metrics`, the Prometheus
+    metrics of the last run along with the daemon's own.
+
+    Args:
+        pipeline (ETLPipeline): the pipeline to run, created with `keep_warm=True`.
+        schedule: an `IntervalSchedule` or `CronSchedule`.
+        host (str, optional): address of the health endpoint. Defaults to "127.0.0.1".
+        port (int, optional): port of the health endpoint, 0 for any free port. Defaults to 8001.
+        run_on_start (bool, optional): run once when starting, then follow the schedule. Defaults to False.
+    """
+
+    def __init__(self, pipeline, schedule, host: str = "127.0.0.1", port: int = 8001, run_on_start: bool = False):
+        self.pipeline = pipeline
+        self.schedule = schedule
+        self.run_on_start = run_on_start
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_success: Optional[bool] = None
+        self.last_run_id: Optional[str] = None
+        self.last_finished_at: Optional[datetime] = None
+        self.next_run_at: Optional[datetime] = None
+        self.started_at = time.time()
+        self.logger = logging.getLogger(__name__)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._last_metrics: Optional[str] = None
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server_thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        daemon = self
+
+        class HealthHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/health":
+                    status, body = daemon.health()
+                    self._reply(status, "application/json", json.dumps(body).encode())
+                elif self.path == "/metrics":
+                    self._reply(200, "text/plain; version=0.0.4", daemon.prometheus().encode())
+                else:
+                    self._reply(404, "text/plain", b"Not Found")
+
+            def _reply(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                daemon.logger.debug(format % args)
+
+        return HealthHandler
+
+    def health(self):
+        """HTTP status and JSON body of the health endpoint"""
+        with self._lock:
+            failing = self.last_success is False
+            body = {
+                "status": "failing" if failing else "ok",
+                "runs": self.runs,
+                "failures": self.failures,
+                "consecutive_failures": self.consecutive_failures,
+                "last_run_id": self.last_run_id,
+                "last_success": self.last_success,
+                "last_finished_at": self.last_finished_at.isoformat() if self.last_finished_at else None,
+                "next_run_at": self.next_run_at.isoformat() if self.next_run_at else None,
+                "uptime_seconds": round(time.time() - self.started_at, 3),
+            }
+        return (503 if failing else 200), body
+
+    def prometheus(self) -> str:
+        """Metrics of the daemon, followed by the ones of the last run"""
+        p = METRIC_PREFIX
+        with self._lock:
+            next_run = self.next_run_at.timestamp() if self.next_run_at else 0
+            lines = [
+                f"# TYPE {p}_daemon_runs_total counter",
+                f"{p}_daemon_runs_total {self.runs}",
+                f"# TYPE {p}_daemon_failures_total counter",
+                f"{p}_daemon_failures_total {self.failures}",
+                f"# TYPE {p}_daemon_next_run_timestamp_seconds gauge",
+                f"{p}_daemon_next_run_timestamp_seconds {next_run:.3f}",
+            ]
+            last_metrics = self._last_metrics or ""
+        return "\n".join(lines) + "\n" + last_metrics
+
+    def run_once(self) -> bool:
+        """Run the pipeline now and record its outcome; errors are logged, not raised"""
+        success = False
+        try:
+            success = bool(self.pipeline.run())
+        except Exception as e:
+            self.logger.error(f"Scheduled run failed: {str(e)}")
+        with self._lock:
+            self.runs += 1
+            self.last_success = success
+            self.last_run_id = self.pipeline.metrics.run_id
+            self.last_finished_at = datetime.now()
+            if success:
+                self.consecutive_failures = 0
+            else:
+                self.failures += 1
+                self.consecutive_failures += 1
+            self._last_metrics = self.pipeline.metrics.to_prometheus()
+        return success
+
+    def start_server(self) -> None:
+        """Serve the health endpoint in a background thread"""
+        self._server_thread = threading.Thread(target=self.server.serve_forever, name="health", daemon=True)
+        self._server_thread.start()
+        self.logger.info(f"Health and metrics endpoint on {self.address}/health and {self.address}/metrics")
+
+    def serve(self) -> None:
+        """Run the pipeline on schedule until `stop` is called"""
+        self.start_server()
+        try:
+            scheduled = datetime.now()
+            if self.run_on_start and not self._stop.is_set():
+                self.run_once()
+            while not self._stop.is_set():
+                # Intervals count from the previous start; runs missed while busy are skipped
+                scheduled = self.schedule.next_after(scheduled)
+                if scheduled < datetime.now():
+                    scheduled = self.schedule.next_after(datetime.now())
+                with self._lock:
+                    self.next_run_at = scheduled
+                self.logger.info(f"Next run at {self.next_run_at:%Y-%m-%d %H:%M:%S}")
+                delay = (self.next_run_at - datetime.now()).total_seconds()
+                if self._stop.wait(max(0.0, delay)):
+                    break
+                self.run_once()
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+            self.logger.info("Daemon stopped")
+
+    def stop(self) -> None:
+        """Stop after the current run, if any"""
+        self._stop.set()
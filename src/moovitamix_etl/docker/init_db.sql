@@ -17,7 +17,8 @@ CREATE TABLE IF NOT EXISTS tracks (
     duration VARCHAR(50) NOT NULL,
     album VARCHAR(255),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_tracks_name_artist (name, artist)
 );
 
 -- Create users table
@@ -37,6 +38,7 @@ CREATE TABLE IF NOT EXISTS listen_history (
     user_id INT NOT NULL,
     track_id INT NOT NULL,
     listened_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_listen_history_user_listened (user_id, listened_at, id),
     FOREIGN KEY (user_id) REFERENCES users(id),
     FOREIGN KEY (track_id) REFERENCES tracks(id)
 );
@@ -46,6 +48,7 @@ CREATE TABLE IF NOT EXISTS track_genres (
     track_id INT,
     genre_id INT,
     PRIMARY KEY (track_id, genre_id),
+    INDEX ix_track_genres_genre (genre_id, track_id),
     FOREIGN KEY (track_id) REFERENCES tracks(id),
     FOREIGN KEY (genre_id) REFERENCES genres(id)
 );
@@ -57,4 +60,66 @@ CREATE TABLE IF NOT EXISTS user_favorite_genres (
     PRIMARY KEY (user_id, genre_id),
     FOREIGN KEY (user_id) REFERENCES users(id),
     FOREIGN KEY (genre_id) REFERENCES genres(id)
-);
\ No newline at end of file
+);
+
+-- Source ids of tracks and users loaded into an existing row with the same natural key
+CREATE TABLE IF NOT EXISTS id_aliases (
+    resource VARCHAR(32) NOT NULL,
+    source_id INT NOT NULL,
+    target_id INT NOT NULL,
+    PRIMARY KEY (resource, source_id)
+);
+
+-- Listen events of users or tracks not loaded yet, with their source ids (--park-orphans)
+CREATE TABLE IF NOT EXISTS parked_listen_events (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    track_id INT NOT NULL,
+    listened_at TIMESTAMP NULL,
+    parked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Named values kept by the pipeline, e.g. the generation marker of the database
+CREATE TABLE IF NOT EXISTS etl_state (
+    name VARCHAR(64) PRIMARY KEY,
+    value VARCHAR(255) NOT NULL
+);
+
+-- Aggregates maintained from the listen history by the pipeline (--aggregates)
+CREATE TABLE IF NOT EXISTS user_track_plays (
+    user_id INT,
+    track_id INT,
+    play_count INT NOT NULL,
+    last_listened_at TIMESTAMP NULL,
+    PRIMARY KEY (user_id, track_id),
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    FOREIGN KEY (track_id) REFERENCES tracks(id)
+);
+
+CREATE TABLE IF NOT EXISTS user_genre_plays (
+    user_id INT,
+    genre_id INT,
+    play_count INT NOT NULL,
+    PRIMARY KEY (user_id, genre_id),
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    FOREIGN KEY (genre_id) REFERENCES genres(id)
+);
+
+CREATE TABLE IF NOT EXISTS daily_track_plays (
+    day DATE,
+    track_id INT,
+    play_count INT NOT NULL,
+    PRIMARY KEY (day, track_id),
+    FOREIGN KEY (track_id) REFERENCES tracks(id)
+);
+
+-- Top-K similar tracks of each track, from the exported interaction matrix (--similarity)
+CREATE TABLE IF NOT EXISTS track_similarity (
+    track_id INT,
+    similar_track_id INT,
+    score FLOAT NOT NULL,
+    position INT NOT NULL,
+    PRIMARY KEY (track_id, similar_track_id),
+    FOREIGN KEY (track_id) REFERENCES tracks(id),
+    FOREIGN KEY (similar_track_id) REFERENCES tracks(id)
+);
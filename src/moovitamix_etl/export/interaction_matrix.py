@@ -0,0 +1,257 @@
+import itertools
+import json
+import logging
+import os
+import shutil
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import ListenHistory
+
+# Arrays of an exported matrix: CSR structure, then dense index -> database id of the rows and columns
+ARRAYS = ('indptr', 'indices', 'data', 'user_ids', 'track_ids')
+
+# Chunks of (row, column, count) triplets coalesced together once this many are pending
+MERGE_EVERY = 16
+
+# Subfolders of the exported segments, numbered by export
+SEGMENT_PREFIX = 'segment_'
+
+
+class DenseIndex:
+    """Dense indexes 0..n-1 given to database ids, new ids taking the next indexes"""
+
+    def __init__(self, ids: Optional[np.ndarray] = None):
+        self.ids = np.asarray(ids if ids is not None else [], dtype=np.int64)
+        self._order = np.argsort(self.ids, kind='stable')
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def lookup(self, ids: np.ndarray) -> np.ndarray:
+        """Dense index of each database id, indexing the ones not seen yet"""
+        unique, inverse = np.unique(ids, return_inverse=True)
+        dense = np.full(len(unique), -1, dtype=np.int64)
+        if len(self.ids):
+            positions = np.searchsorted(self.ids, unique, sorter=self._order).clip(max=len(self.ids) - 1)
+            candidates = self._order[positions]
+            found = self.ids[candidates] == unique
+            dense[found] = candidates[found]
+        new = dense < 0
+        if new.any():
+            dense[new] = np.arange(len(self.ids), len(self.ids) + np.count_nonzero(new))
+            self.ids = np.concatenate([self.ids, unique[new]])
+            self._order = np.argsort(self.ids, kind='stable')
+        return dense[inverse]
+
+
+def coalesce(rows: np.ndarray, cols: np.ndarray, data: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sort (row, column, value) triplets and sum the values of duplicate cells"""
+    if not len(rows):
+        return rows, cols, data
+    order = np.lexsort((cols, rows))
+    rows, cols, data = rows[order], cols[order], data[order]
+    starts = np.flatnonzero(np.concatenate([[True], (np.diff(rows) != 0) | (np.diff(cols) != 0)]))
+    return rows[starts], cols[starts], np.add.reduceat(data, starts)
+
+
+def _csr(rows: np.ndarray, cols: np.ndarray, data: np.ndarray, user_ids: np.ndarray, track_ids: np.ndarray) -> Dict[str, np.ndarray]:
+    """Arrays of the CSR matrix of coalesced (row, column, count) triplets"""
+    indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(user_ids)), out=indptr[1:])
+    return {
+        'indptr': indptr,
+        'indices': cols.astype(np.int32),
+        'data': data.astype(np.int32),
+        'user_ids': user_ids,
+        'track_ids': track_ids,
+    }
+
+
+def _triplets(arrays: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(row, column, count) triplets of a CSR matrix"""
+    rows = np.repeat(np.arange(len(arrays['indptr']) - 1, dtype=np.int64), np.diff(arrays['indptr']))
+    return rows, arrays['indices'].astype(np.int64), arrays['data'].astype(np.int64)
+
+
+def _load_segment(path: str, fmt: str, names: Tuple[str, ...] = ARRAYS) -> Dict[str, np.ndarray]:
+    if fmt == 'npz':
+        with np.load(os.path.join(path, 'matrix.npz')) as arrays:
+            return {name: arrays[name] for name in names}
+    return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in names}
+
+
+def load_matrix(folder: str) -> Dict[str, np.ndarray]:
+    """Arrays of an exported matrix, memory-mapped when exported as raw `.npy` files
+
+    A matrix made of several segments (appended since the last compaction) is
+    merged in memory; a compacted one is returned as stored.
+
+    Returns:
+        Dict[str, np.ndarray]: `indptr`, `indices` and `data` of the CSR matrix, with
+            `user_ids` and `track_ids` giving the database id of each row and column.
+    """
+    with open(os.path.join(folder, 'manifest.json')) as f:
+        manifest = json.load(f)
+    segments = [_load_segment(os.path.join(folder, segment['path']), manifest['format']) for segment in manifest['segments']]
+    if len(segments) == 1:
+        return segments[0]
+    # Later segments hold the rows and columns of the earlier ones, then their own
+    rows, cols, data = coalesce(*(np.concatenate(arrays) for arrays in zip(*map(_triplets, segments))))
+    return _csr(rows, cols, data, np.array(segments[-1]['user_ids']), np.array(segments[-1]['track_ids']))
+
+
+class InteractionMatrixExporter:
+    """Export the listen history as a CSR user x track matrix of play counts
+
+    The events are streamed from the database `batch_size` at a time, their user and
+    track ids remapped to dense row and column indexes, and the play counts of each
+    chunk summed before being merged. The matrix is written as numpy arrays only:
+    `indptr` (int64), `indices` (int32 column indexes) and `data` (int32 play counts),
+    the layout of `scipy.sparse.csr_matrix((data, indices, indptr))`, along with the
+    remapping tables `user_ids` and `track_ids`.
+
+    Each export adds the events loaded since the previous one, whatever their listen
+    time: the manifest records the last `listen_history.id` exported, as the
+    aggregates watermark does. Existing row and column indexes are kept, new users
+    and tracks appended.
+
+    The events of an export are written as a delta segment, so appending costs the
+    new events (and the id tables) rather than the whole matrix; once `compact_every`
+    segments accumulated, they are merged into one. Every segment is written to its
+    own subfolder before the manifest is replaced to list it, so an interrupted
+    export leaves the previous matrix intact.
+
+    Args:
+        db_config (DatabaseConfig): database holding the listen history.
+        folder (str): directory of the exported matrix.
+        fmt (str, optional): "npy" for raw arrays which `load_matrix` memory-maps, or
+            "npz" for a single archive. Defaults to "npy".
+        batch_size (int, optional): events read per chunk. Defaults to 100000.
+        compact_every (int, optional): number of segments merged into one. Defaults to 8.
+    """
+
+    def __init__(
+        self,
+        db_config: DatabaseConfig,
+        folder: str,
+        fmt: str = 'npy',
+        batch_size: int = 100000,
+        compact_every: int = 8
+    ):
+        if fmt not in ('npy', 'npz'):
+            raise ValueError(f"Unknown matrix format: {fmt}")
+        self.db_config = db_config
+        self.folder = folder
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.compact_every = compact_every
+        self.logger = logging.getLogger(__name__)
+
+    def _read_manifest(self) -> Optional[dict]:
+        path = os.path.join(self.folder, 'manifest.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def export(self) -> int:
+        """Add the listen events loaded since the previous export
+
+        Returns:
+            int: number of listen events added to the matrix.
+        """
+        manifest = self._read_manifest()
+        low = manifest['last_id'] if manifest else 0
+        with self.db_config.engine.connect() as conn:
+            high = conn.execute(select(func.max(ListenHistory.id))).scalar() or 0
+        if manifest and high <= low:
+            self.logger.info(f"Interaction matrix already up to listen event {low}")
+            return 0
+
+        if manifest:
+            ids = _load_segment(
+                os.path.join(self.folder, manifest['segments'][-1]['path']), manifest['format'], ('user_ids', 'track_ids')
+            )
+            users, tracks = DenseIndex(ids['user_ids']), DenseIndex(ids['track_ids'])
+        else:
+            manifest = {'format': self.fmt, 'version': 0, 'last_id': 0, 'events': 0, 'segments': []}
+            users, tracks = DenseIndex(), DenseIndex()
+
+        statement = select(ListenHistory.user_id, ListenHistory.track_id).where(ListenHistory.id.between(low + 1, high))
+        pending, events = [], 0
+        results = self.db_config.stream_query(statement, batch_size=self.batch_size)
+        while True:
+            batch = list(itertools.islice(results, self.batch_size))
+            if not batch:
+                break
+            pairs = np.array(batch, dtype=np.int64)
+            pending.append(coalesce(users.lookup(pairs[:, 0]), tracks.lookup(pairs[:, 1]), np.ones(len(pairs), np.int64)))
+            events += len(pairs)
+            # Bound the memory of the pending chunks by the size of the delta
+            if len(pending) >= MERGE_EVERY:
+                pending = [self._merge(pending)]
+
+        arrays = _csr(*self._merge(pending), users.ids, tracks.ids)
+        manifest = self._write_segment(arrays, manifest, manifest['segments'], events)
+        manifest.update(last_id=high, events=manifest['events'] + events)
+        self._write_manifest(manifest)
+        self.logger.info(
+            f"Exported {events} listen events up to id {high}: {len(users)} users x {len(tracks)} tracks, "
+            f"{len(arrays['data'])} non-zero in segment {len(manifest['segments'])}"
+        )
+        if len(manifest['segments']) >= self.compact_every:
+            self.compact()
+        return events
+
+    def compact(self) -> None:
+        """Merge the segments of the matrix into one, rewriting the whole matrix"""
+        manifest = self._read_manifest()
+        if manifest is None or len(manifest['segments']) < 2:
+            return
+        arrays = load_matrix(self.folder)
+        events = sum(segment['events'] for segment in manifest['segments'])
+        self._write_manifest(self._write_segment(arrays, manifest, [], events))
+        self.logger.info(f"Compacted the interaction matrix: {len(arrays['data'])} non-zero")
+
+    @staticmethod
+    def _merge(parts: List[Tuple[np.ndarray, np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if not parts:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        return coalesce(*(np.concatenate(arrays) for arrays in zip(*parts)))
+
+    def _write_segment(self, arrays: Dict[str, np.ndarray], manifest: dict, kept: List[dict], events: int) -> dict:
+        """Write the arrays to the subfolder of a new segment, return the manifest listing it after `kept`"""
+        version = manifest['version'] + 1
+        path = f"{SEGMENT_PREFIX}{version:06d}"
+        folder = os.path.join(self.folder, path)
+        # Left by an export interrupted before its manifest was written
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+        if manifest['format'] == 'npz':
+            np.savez(os.path.join(folder, 'matrix.npz'), **arrays)
+        else:
+            for name, array in arrays.items():
+                np.save(os.path.join(folder, f"{name}.npy"), array)
+        segment = {'path': path, 'nnz': int(len(arrays['data'])), 'events': events}
+        return dict(
+            manifest,
+            version=version,
+            shape=[len(arrays['user_ids']), len(arrays['track_ids'])],
+            segments=kept + [segment]
+        )
+
+    def _write_manifest(self, manifest: dict) -> None:
+        """Switch to the segments of the manifest, then remove the others"""
+        tmp_path = os.path.join(self.folder, 'manifest.tmp.json')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.folder, 'manifest.json'))
+        listed = {segment['path'] for segment in manifest['segments']}
+        for name in os.listdir(self.folder):
+            if name.startswith(SEGMENT_PREFIX) and name not in listed:
+                shutil.rmtree(os.path.join(self.folder, name))
@@ -0,0 +1,145 @@
+import logging
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+from sqlalchemy import delete, insert
+
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import TrackSimilarity
+
+# Estimated bytes of working memory per co-occurring (track, track) pair of a block
+BYTES_PER_PAIR = 64
+
+METRICS = ('cosine', 'jaccard')
+
+
+def concatenated_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenation of `arange(start, start + length)` for each start and length"""
+    ends = np.cumsum(lengths)
+    offsets = np.repeat(starts - (ends - lengths), lengths)
+    return offsets + np.arange(ends[-1] if len(ends) else 0)
+
+
+def to_csc(indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, n_cols: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Column pointers, row indexes and values of a CSR matrix, column by column"""
+    rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    colptr = np.zeros(n_cols + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=n_cols), out=colptr[1:])
+    return colptr, rows[order], np.asarray(data)[order]
+
+
+class SimilarityBuilder:
+    """Top-K most similar tracks of each track, from the users listening to both
+
+    The co-occurrences `X^T X` of the user x track matrix exported by
+    `InteractionMatrixExporter` are computed by blocks of tracks: for each track of a
+    block, the tracks of every user who listened to it. Blocks are sized so that their
+    (track, track) pairs fit in `memory_mb`, a single track whose listeners listened to
+    more tracks than that making a block on its own.
+
+    Args:
+        db_config (DatabaseConfig): database receiving the `track_similarity` rows.
+        metric (str, optional): "cosine" of the play count columns, or "jaccard" of the
+            sets of listeners. Defaults to "cosine".
+        top_k (int, optional): similar tracks kept per track. Defaults to 20.
+        memory_mb (float, optional): working memory of a block. Defaults to 256.
+        batch_size (int, optional): rows per insert batch. Defaults to 10000.
+    """
+
+    def __init__(
+        self,
+        db_config: DatabaseConfig,
+        metric: str = 'cosine',
+        top_k: int = 20,
+        memory_mb: float = 256,
+        batch_size: int = 10000
+    ):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown similarity metric: {metric}")
+        self.db_config = db_config
+        self.metric = metric
+        self.top_k = top_k
+        self.max_pairs = max(1, int(memory_mb * 1024 * 1024) // BYTES_PER_PAIR)
+        self.batch_size = batch_size
+        self.logger = logging.getLogger(__name__)
+
+    def iter_blocks(self, arrays: Dict[str, np.ndarray]) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """Top-K of the tracks of each block, as (track index, similar track index, score, position) arrays"""
+        indptr, indices = np.asarray(arrays['indptr']), np.asarray(arrays['indices']).astype(np.int64)
+        data = np.asarray(arrays['data'], dtype=np.float64)
+        if self.metric == 'jaccard':
+            data = np.ones_like(data)
+        n_cols = len(arrays['track_ids'])
+        colptr, csc_rows, csc_data = to_csc(indptr, indices, data, n_cols)
+        # Cosine divides by the norms of the columns, Jaccard by the sizes of the listener sets
+        column_weights = np.bincount(indices, weights=data * data, minlength=n_cols)
+        norms = np.sqrt(column_weights) if self.metric == 'cosine' else column_weights
+
+        # Pairs generated by each track: the tracks of all its listeners
+        degrees = np.diff(indptr)
+        costs = np.zeros(n_cols + 1, dtype=np.int64)
+        np.cumsum(np.bincount(indices, weights=degrees[csc_rows], minlength=n_cols).astype(np.int64), out=costs[1:])
+
+        first = 0
+        while first < n_cols:
+            last = max(first + 1, int(np.searchsorted(costs, costs[first] + self.max_pairs, side='right')) - 1)
+            yield self._block(first, last, indptr, indices, data, colptr, csc_rows, csc_data, norms, n_cols)
+            first = last
+
+    def _block(self, first, last, indptr, indices, data, colptr, csc_rows, csc_data, norms, n_cols):
+        """Top-K similar tracks of the tracks `first` to `last` excluded"""
+        entries = slice(colptr[first], colptr[last])
+        users, values = csc_rows[entries], csc_data[entries]
+        tracks = np.repeat(np.arange(first, last, dtype=np.int64), np.diff(colptr[first:last + 1]))
+        degrees = indptr[users + 1] - indptr[users]
+        positions = concatenated_ranges(indptr[users], degrees)
+        track = np.repeat(tracks, degrees)
+        other = indices[positions]
+        products = np.repeat(values, degrees) * data[positions]
+        keep = other != track
+        keys = (track[keep] - first) * n_cols + other[keep]
+        keys, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=products[keep])
+        track, other = keys // n_cols + first, keys % n_cols
+
+        if self.metric == 'cosine':
+            scores = sums / (norms[track] * norms[other])
+        else:
+            scores = sums / (norms[track] + norms[other] - sums)
+
+        # Best scores first within each track, ties broken by track index
+        order = np.lexsort((other, -scores, track))
+        track, other, scores = track[order], other[order], scores[order]
+        starts = np.flatnonzero(np.concatenate([[True], np.diff(track) != 0])) if len(track) else np.zeros(0, np.int64)
+        ranks = np.arange(len(track)) - np.repeat(starts, np.diff(np.append(starts, len(track))))
+        top = ranks < self.top_k
+        return track[top], other[top], scores[top], ranks[top] + 1
+
+    def build(self, arrays: Dict[str, np.ndarray]) -> int:
+        """Replace the content of `track_similarity` with the top-K of every track
+
+        Args:
+            arrays (Dict[str, np.ndarray]): an exported matrix, see `load_matrix`.
+
+        Returns:
+            int: number of rows written.
+        """
+        track_ids = np.asarray(arrays['track_ids'])
+        table = TrackSimilarity.__table__
+        written = blocks = 0
+        with self.db_config.engine.begin() as conn:
+            conn.execute(delete(table))
+            for track, other, scores, ranks in self.iter_blocks(arrays):
+                rows = [
+                    {'track_id': track_id, 'similar_track_id': similar_id, 'score': score, 'position': position}
+                    for track_id, similar_id, score, position in zip(
+                        track_ids[track].tolist(), track_ids[other].tolist(), scores.tolist(), ranks.tolist()
+                    )
+                ]
+                for start in range(0, len(rows), self.batch_size):
+                    conn.execute(insert(table), rows[start:start + self.batch_size])
+                written += len(rows)
+                blocks += 1
+        self.logger.info(f"Wrote {written} {self.metric} similarities of {len(track_ids)} tracks in {blocks} blocks")
+        return written
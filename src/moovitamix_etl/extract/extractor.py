@@ -1,24 +1,161 @@
-from typing import List
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+import json
+import logging
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 
 from moovitamix_etl.extract.dtos.track_dto import TrackDto
 from moovitamix_etl.extract.dtos.user_dto import UserDto
 from moovitamix_etl.extract.dtos.listen_history import ListenHistoryDto
+from src.moovitamix_etl.extract.resilience import AdaptiveLimiter, RetryPolicy
+from src.moovitamix_etl.extract.response_cache import ResponseCache
+from src.moovitamix_etl.metrics import PipelineMetrics
+
+# pyarrow is only imported by the runs extracting Arrow tables
+if TYPE_CHECKING:
+    import pyarrow as pa
 
 
 
 
 class Extractor:
 
-    def __init__(self, api_url: str = "http://127.0.0.1:8000"):
+    # Resource name -> (endpoint, DTO class), in the order they must be loaded
+    RESOURCES = {
+        'tracks': ('/tracks', TrackDto),
+        'users': ('/users', UserDto),
+        'listen_history': ('/listen_history', ListenHistoryDto),
+    }
+
+    def __init__(
+        self,
+        api_url: str = "http://127.0.0.1:8000",
+        metrics: Optional[PipelineMetrics] = None,
+        cache: Optional[ResponseCache] = None,
+        timeout: Tuple[float, float] = (3.05, 30.0),
+        retry: Optional[RetryPolicy] = None,
+        max_concurrency: int = 1,
+        limiter: Optional[AdaptiveLimiter] = None
+    ):
+        """
+        Args:
+            api_url (str, optional): base URL of the API. Defaults to "http://127.0.0.1:8000".
+            metrics (PipelineMetrics, optional): where request latencies are recorded.
+            cache (ResponseCache, optional): on-disk cache revalidated with If-None-Match. Pages
+                enter it once their load is acknowledged, see `acknowledge`.
+            timeout (Tuple[float, float], optional): connect and read timeouts, in seconds. Defaults to (3.05, 30).
+            retry (RetryPolicy, optional): retries on timeouts, 429 and 5xx. Defaults to RetryPolicy().
+            max_concurrency (int, optional): max pages of a resource requested in parallel. Defaults to 1.
+            limiter (AdaptiveLimiter, optional): adapts the requests in flight to the API health,
+                defaults to an AdaptiveLimiter bounded by `max_concurrency`.
+        """
         self.base_url = api_url.rstrip("/")
         self.session = requests.Session()
+        self.metrics = metrics or PipelineMetrics()
+        self.cache = cache
+        # (endpoint, page) -> (url, etag, body) of the fetched pages not loaded yet
+        self._unacknowledged: Dict[Tuple[str, int], Tuple[str, str, dict]] = {}
+        self._unacknowledged_lock = threading.Lock()
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        self.max_concurrency = max(1, max_concurrency)
+        self.limiter = limiter or AdaptiveLimiter(max_limit=self.max_concurrency)
+        self.logger = logging.getLogger(__name__)
+        # One pooled connection per concurrent request
+        adapter = HTTPAdapter(pool_maxsize=max(10, self.max_concurrency))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
-    def _get_request(self, endpoint, size, page) -> List[dict]:
+    def _send(self, url: str, endpoint: str, headers: Optional[dict] = None, stream: bool = False) -> requests.Response:
+        """GET a URL, retrying timeouts, connection errors, 429 and 5xx with jittered backoff
+
+        Raises:
+            requests.RequestException: the error of the last attempt once retries are exhausted
+        """
+        attempt = 0
+        while True:
+            response, error = None, None
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, headers=headers, stream=stream, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            finally:
+                elapsed = time.perf_counter() - start
+                retryable = response is None or response.status_code in self.retry.statuses
+                self.limiter.release(elapsed, overloaded=retryable)
+            
+            failed = response is None or response.status_code >= 400
+            self.metrics.observe_request(endpoint, elapsed, failed=failed)
+            if not retryable or attempt >= self.retry.max_retries:
+                if error is not None:
+                    raise error
+                response.raise_for_status()
+                return response
+            
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            delay = self.retry.delay(attempt, retry_after)
+            if response is not None:
+                response.close()
+            self.metrics.increment('http_retries')
+            self.logger.warning(
+                f"Retrying {url} in {delay:.2f}s after {error or response.status_code} "
+                f"(retry {attempt + 1}/{self.retry.max_retries})"
+            )
+            time.sleep(delay)
+            attempt += 1
+
+    def _fetch(self, endpoint, size, page) -> Tuple[dict, bool]:
+        """Get a page, revalidating the cached copy when there is one
+
+        Returns:
+            Tuple[dict, bool]: the decoded body and whether it changed since it was cached
+        """
         url = f"{self.base_url}/{endpoint.lstrip('/')}?page={page}&size={size}"
-        response = self.session.get(url)
-        response.raise_for_status()
-        return response.json()
+        cached = self.cache.get(url) if self.cache is not None else None
+        headers = {'If-None-Match': cached.etag} if cached else None
+        response = self._send(url, endpoint, headers=headers)
+
+        if response.status_code == 304 and cached:
+            self.metrics.increment('http_not_modified')
+            return cached.data, False
+        data = response.json()
+        etag = response.headers.get('ETag')
+        # Cached once loaded: a page cached before would be skipped as unchanged by the next runs
+        if self.cache is not None and etag:
+            with self._unacknowledged_lock:
+                self._unacknowledged[(endpoint, page)] = (url, etag, data)
+        return data, True
+
+    def acknowledge(self, resource: str, page: int) -> None:
+        """Cache a fetched page of a resource once its load committed"""
+        endpoint, _ = self.RESOURCES[resource]
+        with self._unacknowledged_lock:
+            entry = self._unacknowledged.pop((endpoint, page), None)
+        if entry is not None:
+            self.cache.put(*entry)
+
+    def acknowledge_all(self) -> None:
+        """Cache every fetched page, once the run loading them committed"""
+        with self._unacknowledged_lock:
+            entries, self._unacknowledged = list(self._unacknowledged.values()), {}
+        for entry in entries:
+            self.cache.put(*entry)
+
+    def discard_unacknowledged(self) -> None:
+        """Forget the pages fetched by a run whose load failed, so they are loaded again"""
+        with self._unacknowledged_lock:
+            self._unacknowledged = {}
+
+    def _get_request(self, endpoint, size, page) -> List[dict]:
+        return self._fetch(endpoint, size, page)[0]
     
     def get_tracks(self, size=100, page = 1) -> List[TrackDto]:
         """Get all tracks for a given range
@@ -71,4 +208,232 @@ class Extractor:
         Returns:
             tuple[List[TrackDto] , List[UserDto], List[ListenHistoryDto]]: Every resources we can fetch from the API as a tuple
         """
-        return self.get_tracks(), self.get_users(), self.get_listen_histories()
\ No newline at end of file
+        return self.get_tracks(), self.get_users(), self.get_listen_histories()
+
+    def iter_pages(
+        self,
+        resource: str,
+        size: int = 100,
+        start_page: int = 1,
+        changed_only: bool = False,
+        end_page: Optional[int] = None
+    ) -> Iterator[Tuple[int, list]]:
+        """Iterate over every page of a resource, one request at a time
+
+        Args:
+            resource (str): one of the keys of `Extractor.RESOURCES`.
+            size (int, optional): max number of documents per page. Defaults to 100.
+            start_page (int, optional): the first page to retrieve. Defaults to 1.
+            end_page (int, optional): the last page to retrieve. Defaults to the last page.
+            changed_only (bool, optional): skip the pages the API answered with 304 Not
+                Modified, which requires a cache. Only the pages acknowledged as loaded
+                are cached, so the others are never skipped. Defaults to False.
+
+        Yields:
+            Tuple[int, list]: the page number and its documents as Data Transfer Objects
+        """
+        endpoint, dto_class = self.RESOURCES[resource]
+        for page, data, changed in self._iter_page_data(endpoint, size, start_page, end_page):
+            if not data['items']:
+                return
+            if changed or not changed_only:
+                yield page, [dto_class.from_dict(item) for item in data['items']]
+
+    def _iter_page_data(
+        self,
+        endpoint: str,
+        size: int,
+        start_page: int,
+        end_page: Optional[int] = None
+    ) -> Iterator[Tuple[int, dict, bool]]:
+        """Fetch the pages of an endpoint in order, up to `max_concurrency` at a time
+
+        The first page tells how many pages there are; the following ones are then
+        requested ahead of the consumer, the limiter deciding how many actually are
+        in flight.
+        """
+        if end_page is not None and start_page > end_page:
+            return
+        page = start_page
+        data, changed = self._fetch(endpoint, size, page)
+        yield page, data, changed
+        pages = data.get('pages')
+        if end_page is not None:
+            pages = end_page if pages is None else min(pages, end_page)
+        
+        if self.max_concurrency == 1 or pages is None:
+            while data['items'] and (pages is None or page < pages):
+                page += 1
+                data, changed = self._fetch(endpoint, size, page)
+                yield page, data, changed
+            return
+        
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="extract") as pool:
+            pending = deque()
+            next_page = page + 1
+            try:
+                while pending or next_page <= pages:
+                    while next_page <= pages and len(pending) < 2 * self.max_concurrency:
+                        pending.append((next_page, pool.submit(self._fetch, endpoint, size, next_page)))
+                        next_page += 1
+                    page, future = pending.popleft()
+                    data, changed = future.result()
+                    yield page, data, changed
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    def page_count(self, resource: str, size: int = 100) -> int:
+        """Number of pages of a resource for a given page size
+
+        Args:
+            resource (str): one of the keys of `Extractor.RESOURCES`.
+            size (int, optional): max number of documents per page. Defaults to 100.
+
+        Returns:
+            int: the number of pages
+        """
+        endpoint, _ = self.RESOURCES[resource]
+        data, _ = self._fetch(endpoint, size, 1)
+        if data.get('pages') is not None:
+            return data['pages']
+        return -(-data['total'] // size)
+
+    def iter_all_resources(
+        self,
+        size: int = 100,
+        changed_only: bool = False,
+        start_pages: Optional[Dict[str, int]] = None
+    ) -> Iterator[Tuple[str, int, list]]:
+        """Iterate over the pages of every resource, in loading order
+
+        Args:
+            size (int, optional): max number of documents per page. Defaults to 100.
+            changed_only (bool, optional): skip the pages not modified since they were cached. Defaults to False.
+            start_pages (Dict[str, int], optional): first page per resource, e.g. when resuming. Defaults to page 1.
+
+        Yields:
+            Tuple[str, int, list]: the resource name, the page number and its documents
+        """
+        start_pages = start_pages or {}
+        for resource in self.RESOURCES:
+            start_page = start_pages.get(resource, 1)
+            for page, dtos in self.iter_pages(resource, size=size, start_page=start_page, changed_only=changed_only):
+                yield resource, page, dtos
+
+    def iter_export(self, resource: str, batch_size: int = 1000, compress: bool = True) -> Iterator[Tuple[int, list]]:
+        """Iterate over a whole resource read from its bulk export endpoint
+
+        The resource is pulled as one long-lived streamed NDJSON response instead of
+        one request per page, and parsed incrementally.
+
+        Args:
+            resource (str): one of the keys of `Extractor.RESOURCES`.
+            batch_size (int, optional): number of documents per yielded batch. Defaults to 1000.
+            compress (bool, optional): ask for a gzip compressed response. Defaults to True.
+
+        Yields:
+            Tuple[int, list]: the batch number and its documents as Data Transfer Objects
+        """
+        _, dto_class = self.RESOURCES[resource]
+        batch, number = [], 1
+        for line in self._iter_export_lines(resource, compress):
+            batch.append(dto_class.from_dict(json.loads(line)))
+            if len(batch) >= batch_size:
+                yield number, batch
+                batch, number = [], number + 1
+        if batch:
+            yield number, batch
+
+    def _iter_export_lines(self, resource: str, compress: bool = True) -> Iterator[bytes]:
+        """Non empty NDJSON lines of the bulk export of a resource, as they are received"""
+        endpoint, _ = self.RESOURCES[resource]
+        url = f"{self.base_url}/{endpoint.lstrip('/')}/export"
+        headers = {'Accept-Encoding': 'gzip' if compress else 'identity'}
+        
+        # Latency until the response headers, the body is streamed afterwards
+        response = self._send(url, f"{endpoint}/export", headers=headers, stream=True)
+        
+        with response:
+            for line in response.iter_lines(chunk_size=64 * 1024):
+                if line:
+                    yield line
+
+    def iter_all_exports(self, batch_size: int = 1000) -> Iterator[Tuple[str, int, list]]:
+        """Iterate over every resource read from the bulk export endpoints, in loading order
+
+        Args:
+            batch_size (int, optional): number of documents per yielded batch. Defaults to 1000.
+
+        Yields:
+            Tuple[str, int, list]: the resource name, the batch number and its documents
+        """
+        for resource in self.RESOURCES:
+            for number, dtos in self.iter_export(resource, batch_size=batch_size):
+                yield resource, number, dtos
+
+    def get_all_exports(self) -> tuple[List[TrackDto], List[UserDto], List[ListenHistoryDto]]:
+        """Retrieve every document of every resource from the bulk export endpoints
+
+        Returns:
+            tuple[List[TrackDto] , List[UserDto], List[ListenHistoryDto]]: Every resources we can fetch from the API as a tuple
+        """
+        return tuple(
+            [dto for _, dtos in self.iter_export(resource) for dto in dtos]
+            for resource in self.RESOURCES
+        )
+
+    def iter_tables(self, resource: str, size: int = 100, bulk_export: bool = False) -> Iterator[pa.Table]:
+        """Iterate over every document of a resource as Arrow tables, without building DTOs
+
+        Args:
+            resource (str): one of the keys of `Extractor.RESOURCES`.
+            size (int, optional): documents per page, or per table with `bulk_export`. Defaults to 100.
+            bulk_export (bool, optional): read the bulk export endpoint instead of the pages. Defaults to False.
+
+        Yields:
+            pa.Table: the documents of a page or batch, with the schema `columnar.SOURCE_SCHEMAS[resource]`
+        """
+        import pyarrow as pa
+        import pyarrow.json
+        from src.moovitamix_etl.transform.columnar import SOURCE_SCHEMAS, source_table
+        
+        if not bulk_export:
+            endpoint, _ = self.RESOURCES[resource]
+            for _, data, _ in self._iter_page_data(endpoint, size, 1):
+                if not data['items']:
+                    return
+                yield source_table(resource, data['items'])
+            return
+        
+        # NDJSON batches are parsed by the Arrow JSON reader, timestamps included
+        options = pyarrow.json.ParseOptions(explicit_schema=SOURCE_SCHEMAS[resource], unexpected_field_behavior='ignore')
+        lines = []
+        for line in self._iter_export_lines(resource):
+            lines.append(line)
+            if len(lines) >= size:
+                yield pyarrow.json.read_json(pa.py_buffer(b"\n".join(lines)), parse_options=options)
+                lines = []
+        if lines:
+            yield pyarrow.json.read_json(pa.py_buffer(b"\n".join(lines)), parse_options=options)
+
+    def get_all_tables(self, size: int = 100, bulk_export: bool = False) -> Dict[str, pa.Table]:
+        """Retrieve every document of every resource as one Arrow table per resource
+
+        Args:
+            size (int, optional): documents per page, or per parsed batch with `bulk_export`. Defaults to 100.
+            bulk_export (bool, optional): read the bulk export endpoints instead of the pages. Defaults to False.
+
+        Returns:
+            Dict[str, pa.Table]: the table of each resource, in loading order
+        """
+        import pyarrow as pa
+        from src.moovitamix_etl.transform.columnar import SOURCE_SCHEMAS
+        
+        return {
+            resource: pa.concat_tables([
+                SOURCE_SCHEMAS[resource].empty_table(),
+                *self.iter_tables(resource, size=size, bulk_export=bulk_export)
+            ])
+            for resource in self.RESOURCES
+        }
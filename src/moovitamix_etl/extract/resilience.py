@@ -0,0 +1,90 @@
+import random
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+@dataclass
+class RetryPolicy:
+    """When and how long to wait before sending a failed request again
+
+    Delays grow exponentially with the attempt number and are drawn uniformly below
+    that bound ("full jitter"), so that clients failing together do not retry
+    together. A Retry-After sent by the API is a lower bound of the delay.
+
+    Args:
+        max_retries (int, optional): retries after the first attempt. Defaults to 5.
+        backoff_base (float, optional): bound of the first delay, in seconds. Defaults to 0.5.
+        backoff_max (float, optional): bound of every delay, in seconds. Defaults to 30.
+        statuses (Tuple[int, ...], optional): HTTP statuses worth retrying.
+    """
+    max_retries: int = 5
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+    statuses: Tuple[int, ...] = (429, 500, 502, 503, 504)
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Seconds to wait before the retry following attempt number `attempt` (from 0)"""
+        backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        requested = parse_retry_after(retry_after)
+        return backoff if requested is None else max(requested, backoff)
+
+
+class AdaptiveLimiter:
+    """Limit the requests in flight, adapting the limit to how the API copes (AIMD)
+
+    Every fast and successful request raises the limit by 1/limit, about one more
+    request in flight per round trip. A slow, throttled or failed request halves it.
+    The limit thus settles just below the point where the API starts to suffer.
+
+    Args:
+        max_limit (int, optional): upper bound of requests in flight. Defaults to 8.
+        min_limit (int, optional): lower bound of requests in flight. Defaults to 1.
+        target_latency (float, optional): latency above which a request counts as slow, in seconds. Defaults to 2.
+        decrease_ratio (float, optional): factor applied to the limit on a slow or failed request. Defaults to 0.5.
+    """
+
+    def __init__(self, max_limit: int = 8, min_limit: int = 1, target_latency: float = 2.0, decrease_ratio: float = 0.5):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.target_latency = target_latency
+        self.decrease_ratio = decrease_ratio
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """Wait for a free slot"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, overloaded: bool = False) -> None:
+        """Free a slot and adapt the limit to the outcome of the request"""
+        with self._condition:
+            self.in_flight -= 1
+            if overloaded or latency > self.target_latency:
+                self.limit = max(self.min_limit, self.limit * self.decrease_ratio)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
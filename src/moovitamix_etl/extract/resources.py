@@ -0,0 +1,6 @@
+"""Names of the API resources, in the order they must be loaded.
+
+Kept apart from the extractor, so naming them does not import its HTTP stack.
+"""
+
+RESOURCES = ('tracks', 'users', 'listen_history')
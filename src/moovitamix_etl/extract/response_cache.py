@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+
+@dataclass
+class CachedResponse:
+    """A decoded response body and the entity tag it was served with"""
+    etag: str
+    data: Any
+
+
+class ResponseCache:
+    """On-disk cache of API responses, bounded in size with least recently used eviction.
+
+    Entries are keyed by URL and hold the decoded body next to its ETag, so that a
+    page answered with 304 Not Modified is served from disk without any JSON parsing.
+    Bodies are stored pickled: the cache folder is private to the pipeline.
+    Recency survives restarts through the modification time of the entry files.
+
+    Args:
+        folder (str): directory holding the entries, created if missing.
+        max_bytes (int, optional): size cap of the entries on disk. Defaults to 256 MiB.
+    """
+
+    SUFFIX = ".cache"
+
+    def __init__(self, folder: str, max_bytes: int = 256 * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        # key -> size in bytes, least recently used first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        os.makedirs(folder, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self) -> None:
+        entries = []
+        for filename in os.listdir(self.folder):
+            if not filename.endswith(self.SUFFIX):
+                continue
+            stat = os.stat(os.path.join(self.folder, filename))
+            entries.append((stat.st_mtime, filename[:-len(self.SUFFIX)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._size += size
+        self._evict()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key + self.SUFFIX)
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    @property
+    def size(self) -> int:
+        """Total size of the entries on disk, in bytes"""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        """Return the cached response of a URL, or None"""
+        key = self.key(url)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    cached = pickle.load(f)
+                os.utime(path)
+            except (OSError, pickle.UnpicklingError, EOFError) as e:
+                self.logger.warning(f"Dropping unreadable cache entry {path}: {e}")
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return cached
+
+    def put(self, url: str, etag: str, data: Any) -> None:
+        """Store the response of a URL, evicting the least recently used entries beyond the size cap"""
+        key = self.key(url)
+        payload = pickle.dumps(CachedResponse(etag, data), protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._lock:
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+            self._size += len(payload) - self._entries.pop(key, 0)
+            self._entries[key] = len(payload)
+            self._evict()
+
+    def _remove(self, key: str) -> None:
+        self._size -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        """Remove every entry"""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
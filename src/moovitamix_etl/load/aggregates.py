@@ -0,0 +1,107 @@
+import logging
+from typing import Sequence
+
+from sqlalchemy import func, select
+
+from src.moovitamix_etl.load.model.model import (
+    DailyTrackPlays, EtlState, ListenHistory, UserGenrePlays, UserTrackPlays, track_genres
+)
+
+logger = logging.getLogger(__name__)
+
+# etl_state entry holding the id of the last listen event counted in the aggregates
+WATERMARK = 'aggregates.listen_history_id'
+
+# etl_state entry set to the run id of the last run which updated the aggregates or similarities,
+# polled by the serving processes to invalidate their caches
+PUBLISHED = 'aggregates.published'
+
+
+def _upsert(dialect: str, table, query, keys: Sequence[str], summed: Sequence[str], latest: Sequence[str] = ()):
+    """INSERT ... SELECT adding the counts of `query` to the rows already in `table`
+
+    The rows of `query` have the `keys` of the table, counts to add (`summed`) and
+    timestamps keeping the most recent value (`latest`).
+    """
+    columns = [*keys, *summed, *latest]
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table).from_select(columns, query)
+        new = statement.inserted
+        greatest = func.greatest
+    elif dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+            greatest = func.max
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+            greatest = func.greatest
+        statement = insert(table).from_select(columns, query)
+        new = statement.excluded
+    else:
+        raise ValueError(f"Aggregates are not supported on {dialect}")
+    values = {name: table.c[name] + new[name] for name in summed}
+    # The stored timestamp is null for the rows counted before it existed
+    values.update({name: func.coalesce(greatest(table.c[name], new[name]), new[name]) for name in latest})
+    if dialect == 'mysql':
+        return statement.on_duplicate_key_update(values)
+    return statement.on_conflict_do_update(index_elements=list(keys), set_=values)
+
+
+def refresh_aggregates(conn) -> int:
+    """Add the listen events loaded since the previous refresh to the aggregate tables
+
+    Per user and track play counts (`user_track_plays`), per user and genre play counts
+    (`user_genre_plays`, with the genres of the track at refresh time) and per day track
+    popularity (`daily_track_plays`) are upserted from the events whose id is above the
+    watermark kept in `etl_state`, grouped in the database by one INSERT ... SELECT each.
+
+    `conn` is a Core connection or an ORM session: run within the transaction loading
+    the events, the refresh commits with them, so every event is counted exactly once.
+    Events must be committed in id order, i.e. not by concurrent loaders meanwhile.
+
+    Returns:
+        int: number of events added to the aggregates.
+    """
+    # Connections know their dialect, sessions through their engine
+    dialect = (getattr(conn, 'dialect', None) or conn.get_bind().dialect).name
+    watermark = conn.execute(select(EtlState.value).where(EtlState.name == WATERMARK)).scalar()
+    low = int(watermark) if watermark is not None else 0
+    high = conn.execute(select(func.max(ListenHistory.id))).scalar() or 0
+    if high <= low:
+        return 0
+
+    events = ListenHistory.__table__
+    in_range = events.c.id.between(low + 1, high)
+    upserts = [
+        (
+            UserTrackPlays.__table__,
+            select(events.c.user_id, events.c.track_id, func.count(), func.max(events.c.listened_at))
+            .where(in_range).group_by(events.c.user_id, events.c.track_id),
+            ('user_id', 'track_id'), ('play_count',), ('last_listened_at',)
+        ),
+        (
+            UserGenrePlays.__table__,
+            select(events.c.user_id, track_genres.c.genre_id, func.count())
+            .select_from(events.join(track_genres, track_genres.c.track_id == events.c.track_id))
+            .where(in_range).group_by(events.c.user_id, track_genres.c.genre_id),
+            ('user_id', 'genre_id'), ('play_count',), ()
+        ),
+        (
+            DailyTrackPlays.__table__,
+            select(func.date(events.c.listened_at), events.c.track_id, func.count())
+            .where(in_range).group_by(func.date(events.c.listened_at), events.c.track_id),
+            ('day', 'track_id'), ('play_count',), ()
+        ),
+    ]
+    for table, query, keys, summed, latest in upserts:
+        conn.execute(_upsert(dialect, table, query, keys, summed, latest))
+
+    state = EtlState.__table__
+    if watermark is None:
+        conn.execute(state.insert().values(name=WATERMARK, value=str(high)))
+    else:
+        conn.execute(state.update().where(state.c.name == WATERMARK).values(value=str(high)))
+    count = conn.execute(select(func.count()).select_from(events).where(in_range)).scalar()
+    logger.info(f"Aggregated {count} new listen events (ids {low + 1} to {high})")
+    return count
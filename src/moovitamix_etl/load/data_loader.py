@@ -1,10 +1,22 @@
-from typing import List, Dict
+from __future__ import annotations
+
+from contextlib import contextmanager, nullcontext
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple
 import os
 from datetime import datetime
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import and_, bindparam, delete, func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 import pandas as pd
+from src.moovitamix_etl.checkpoint import Checkpoint
 from src.moovitamix_etl.load.database_config import DatabaseConfig
-from src.moovitamix_etl.load.model.model import Genre, Track, User, ListenHistory
+from src.moovitamix_etl.load.model.model import (
+    Genre, IdAlias, ParkedListenEvent, Track, User, ListenHistory, track_genres, user_favorite_genres
+)
+from src.moovitamix_etl.metrics import PipelineMetrics
+
+# pyarrow is only imported by the runs loading Arrow tables
+if TYPE_CHECKING:
+    import pyarrow as pa
 
 
 import logging
@@ -12,8 +24,32 @@ import logging
 class DataLoader:
     """Class to handle loading transformed data into either database or CSV files"""
     
-    def __init__(self, db_config: DatabaseConfig = None, into_csv: bool = False, csv_folder: str = "csv_data"):
+    # Loaded resources, in dependency order
+    RESOURCES = ('genres', 'tracks', 'users', 'listen_history')
+    
+    # Listen events with a missing reference logged as examples, out of all the skipped ones
+    ORPHAN_SAMPLE_SIZE = 5
+    
+    # Core load path: model, natural key, columns updated, junction table and relationship to genres
+    CORE_ENTITIES = {
+        'tracks': (Track, ('name', 'artist'), ('songwriters', 'duration', 'album'), track_genres, 'genres'),
+        'users': (User, ('email',), ('first_name', 'last_name', 'gender'), user_favorite_genres, 'favorite_genres'),
+    }
+    
+    def __init__(
+        self,
+        db_config: DatabaseConfig = None,
+        into_csv: bool = False,
+        csv_folder: str = "csv_data",
+        metrics: Optional[PipelineMetrics] = None,
+        core: bool = False,
+        batch_size: int = 10000,
+        key_index_dir: Optional[str] = None,
+        aggregates: bool = False,
+        park_orphans: bool = False
+    ):
         self.db_config = db_config or DatabaseConfig()
+        self.metrics = metrics or PipelineMetrics()
         self.logger = logging.getLogger(__name__)
         self.into_csv = into_csv
         self.csv_folder = csv_folder
@@ -21,52 +57,89 @@ class DataLoader:
         self.track_id_map = {}
         self.user_id_map = {}
         self.genre_id_map = {}
+        # Genre name -> database id, for the Core load path
+        self.genre_name_map = {}
+        # Load through SQLAlchemy Core, `batch_size` rows per executemany, instead of the ORM session
+        self.core = core
+        self.batch_size = batch_size
+        # On-disk natural key -> database id indexes of the dimensions, for the Core load path
+        self.key_index_dir = key_index_dir
+        self.key_cache = None
+        # Keys looked up or inserted by the current transaction, indexed once it commits
+        self._pending_keys = {}
+        # Add the new listen events to the aggregate tables within the transaction loading them
+        self.aggregates = aggregates
+        # Keep the listen events with a missing user or track in `parked_listen_events` instead of dropping them
+        self.park_orphans = park_orphans
+        # Set when resuming: the tracks and users of the previous run are not in the mappings
+        self._resolve_from_db = False
+        # Columns of the CSV files written so far, used when appending chunks
+        self._csv_columns = {}
         
         if self.into_csv:
             os.makedirs(self.csv_folder, exist_ok=True)
             self.logger.info(f"CSV data will be stored in: {self.csv_folder}")
     
-    def _save_to_csv(self, data: List, filename: str) -> None:
-        """Save data to CSV file"""
+    def _to_records(self, data: List) -> List[dict]:
+        """Turn ORM objects into plain dicts for CSV export"""
+        records = []
+        for item in data:
+            record = item.__dict__.copy()
+            record.pop('_sa_instance_state', None)
+            for relationship in inspect(type(item)).relationships.keys():
+                record.pop(relationship, None)
+            
+            # Handle relationships
+            if hasattr(item, 'genres'):
+                record['genres'] = ','.join([g.name for g in item.genres]) if item.genres else ''
+            if hasattr(item, 'favorite_genres'):
+                record['favorite_genres'] = ','.join([g.name for g in item.favorite_genres]) if item.favorite_genres else ''
+            
+            records.append(record)
+        return records
+    
+    def _save_to_csv(self, data: List, filename: str, append: bool = False) -> None:
+        """Save data to CSV file, or append it to the file when `append` is set"""
         filepath = os.path.join(self.csv_folder, filename)
         
         if data:
-            records = []
-            for item in data:
-                record = item.__dict__.copy()
-                record.pop('_sa_instance_state', None)
-                
-                # Handle relationships
-                if hasattr(item, 'genres'):
-                    record['genres'] = ','.join([g.name for g in item.genres]) if item.genres else ''
-                if hasattr(item, 'favorite_genres'):
-                    record['favorite_genres'] = ','.join([g.name for g in item.favorite_genres]) if item.favorite_genres else ''
-                
-                records.append(record)
-            
+            records = self._to_records(data)
             df = pd.DataFrame(records)
-            df.to_csv(filepath, index=False)
+            if append and filepath in self._csv_columns:
+                # Keep the header written by the first chunk
+                df = df.reindex(columns=self._csv_columns[filepath])
+                df.to_csv(filepath, index=False, mode='a', header=False)
+            else:
+                self._csv_columns[filepath] = list(df.columns)
+                df.to_csv(filepath, index=False)
             self.logger.info(f"Saved {len(records)} records to {filepath}")
-        else:
+        elif not (append and os.path.exists(filepath)):
             pd.DataFrame().to_csv(filepath, index=False)
             self.logger.info(f"Created empty CSV file: {filepath}")
     
     def _load_genres(self, session, genres: List[Genre], update_existing: bool) -> Dict[int, int]:
         """Load genres and return id mapping"""
+        # The genres of the transformer only receive their database id: in streaming mode
+        # the transform thread keeps using them, so they must not be attached to the session
         for genre in genres:
             existing = session.query(Genre).filter(Genre.name == genre.name).first()
             if existing:
+                if genre.id is None:
+                    genre.id = existing.id
                 self.genre_id_map[genre.id] = existing.id
                 if update_existing:
                     existing.name = genre.name
             else:
-                session.add(genre)
+                new_genre = Genre(name=genre.name)
+                session.add(new_genre)
                 session.flush()
-                self.genre_id_map[genre.id] = genre.id
+                genre.id = new_genre.id
+                self.genre_id_map[genre.id] = new_genre.id
         return self.genre_id_map
     
     def _load_tracks(self, session, tracks: List[Track], update_existing: bool) -> Dict[int, int]:
         """Load tracks and return id mapping"""
+        remapped_ids = {}
         for track in tracks:
             existing = session.query(Track).filter(
                 Track.name == track.name,
@@ -75,6 +148,8 @@ class DataLoader:
             
             if existing:
                 self.track_id_map[track.id] = existing.id
+                if existing.id != track.id:
+                    remapped_ids[track.id] = existing.id
                 if update_existing:
                     existing.songwriters = track.songwriters
                     existing.duration = track.duration
@@ -93,14 +168,18 @@ class DataLoader:
                 session.add(track)
                 session.flush()
                 self.track_id_map[track.id] = track.id
+        self._record_aliases(session, 'tracks', remapped_ids)
         return self.track_id_map
     
     def _load_users(self, session, users: List[User], update_existing: bool) -> Dict[int, int]:
         """Load users and return id mapping"""
+        remapped_ids = {}
         for user in users:
             existing = session.query(User).filter(User.email == user.email).first()
             if existing:
                 self.user_id_map[user.id] = existing.id
+                if existing.id != user.id:
+                    remapped_ids[user.id] = existing.id
                 if update_existing:
                     existing.first_name = user.first_name
                     existing.last_name = user.last_name
@@ -119,24 +198,146 @@ class DataLoader:
                 session.add(user)
                 session.flush()
                 self.user_id_map[user.id] = user.id
+        self._record_aliases(session, 'users', remapped_ids)
         return self.user_id_map
     
-    def _load_listen_history(self, session, listen_history: List[ListenHistory]) -> None:
-        """Load listen history using the id mappings"""
-        new_records = []
+    def _record_aliases(self, conn, resource: str, remapped_ids: Dict[int, int]) -> None:
+        """Record the source ids loaded into an existing row with another id
+        
+        Later runs and other shards only know these source ids through the aliases,
+        e.g. to replay the parked listen events referencing them.
+        """
+        aliases = IdAlias.__table__
+        source_ids = list(remapped_ids)
+        for start in range(0, len(source_ids), self.batch_size):
+            batch = source_ids[start:start + self.batch_size]
+            conn.execute(delete(aliases).where(aliases.c.resource == resource, aliases.c.source_id.in_(batch)))
+            conn.execute(insert(aliases), [
+                {'resource': resource, 'source_id': source_id, 'target_id': remapped_ids[source_id]}
+                for source_id in batch
+            ])
+    
+    def _resolve_ids(self, session, listen_history: List[ListenHistory]) -> None:
+        """Map the tracks and users loaded by a previous run or another shard
+        
+        They kept their source id, unless recorded as an alias of an existing row.
+        """
+        for resource, model, mapping, attribute in (
+            ('tracks', Track, self.track_id_map, 'track_id'),
+            ('users', User, self.user_id_map, 'user_id')
+        ):
+            missing = {getattr(history, attribute) for history in listen_history} - mapping.keys()
+            if not missing:
+                continue
+            aliases = session.execute(
+                select(IdAlias.source_id, IdAlias.target_id)
+                .where(IdAlias.resource == resource, IdAlias.source_id.in_(missing))
+            )
+            mapping.update((source_id, target_id) for source_id, target_id in aliases)
+            missing -= mapping.keys()
+            if missing:
+                found = session.scalars(select(model.id).where(model.id.in_(missing)))
+                mapping.update((db_id, db_id) for db_id in found)
+    
+    def _split_orphans(self, listen_history: List[ListenHistory]) -> Tuple[List[ListenHistory], List[dict]]:
+        """Listen events whose user and track are mapped, and the rows of the others, by anti-joins on the id sets"""
+        missing_users = {history.user_id for history in listen_history} - self.user_id_map.keys()
+        missing_tracks = {history.track_id for history in listen_history} - self.track_id_map.keys()
+        if not missing_users and not missing_tracks:
+            return listen_history, []
+        resolved, orphans = [], []
         for history in listen_history:
-            if history.track_id in self.track_id_map and history.user_id in self.user_id_map:
-                new_history = ListenHistory(
-                    user_id=self.user_id_map[history.user_id],
-                    track_id=self.track_id_map[history.track_id],
-                    listened_at=history.listened_at
-                )
-                new_records.append(new_history)
+            if history.user_id in missing_users or history.track_id in missing_tracks:
+                orphans.append({'user_id': history.user_id, 'track_id': history.track_id, 'listened_at': history.listened_at})
             else:
-                self.logger.warning(
-                    f"Skipping listen history record: user_id={history.user_id}, "
-                    f"track_id={history.track_id} - Missing reference"
-                )
+                resolved.append(history)
+        return resolved, orphans
+    
+    def _handle_orphans(self, conn, orphans: List[dict]) -> None:
+        """Report the listen events with a missing reference, given by source ids, and park them if enabled
+        
+        A single warning gives their count and a few of them, whatever their number.
+        """
+        if not orphans:
+            return
+        self.metrics.increment('orphan_listen_events', len(orphans))
+        users = len({orphan['user_id'] for orphan in orphans} - self.user_id_map.keys())
+        tracks = len({orphan['track_id'] for orphan in orphans} - self.track_id_map.keys())
+        sample = ', '.join(
+            f"(user_id={orphan['user_id']}, track_id={orphan['track_id']})"
+            for orphan in orphans[:self.ORPHAN_SAMPLE_SIZE]
+        )
+        action = 'Parking' if self.park_orphans else 'Skipping'
+        self.logger.warning(
+            f"{action} {len(orphans)} listen history records - Missing reference to {users} users "
+            f"and {tracks} tracks, e.g. {sample}"
+        )
+        if self.park_orphans:
+            for start in range(0, len(orphans), self.batch_size):
+                conn.execute(insert(ParkedListenEvent.__table__), orphans[start:start + self.batch_size])
+    
+    def replay_parked(self, refresh_aggregates: bool = True) -> int:
+        """Load the parked listen events whose user and track were loaded since
+        
+        The source ids of the events are resolved in a single query, through the
+        aliases of the source ids loaded into an existing row; the events still
+        unresolved stay parked.
+        
+        Args:
+            refresh_aggregates (bool, optional): add the replayed events to the aggregates.
+                Defaults to True.
+        
+        Returns:
+            int: number of listen events loaded.
+        """
+        parked = ParkedListenEvent.__table__
+        aliases = {resource: IdAlias.__table__.alias(f'{resource}_alias') for resource in ('users', 'tracks')}
+        user_id = func.coalesce(aliases['users'].c.target_id, parked.c.user_id)
+        track_id = func.coalesce(aliases['tracks'].c.target_id, parked.c.track_id)
+        query = (
+            select(parked.c.id, User.id, Track.id, parked.c.listened_at)
+            .select_from(
+                parked
+                .outerjoin(aliases['users'], and_(
+                    aliases['users'].c.resource == 'users', aliases['users'].c.source_id == parked.c.user_id
+                ))
+                .outerjoin(aliases['tracks'], and_(
+                    aliases['tracks'].c.resource == 'tracks', aliases['tracks'].c.source_id == parked.c.track_id
+                ))
+                .join(User.__table__, User.id == user_id)
+                .join(Track.__table__, Track.id == track_id)
+            )
+        )
+        with self._core_connection() as conn:
+            resolved = conn.execute(query).all()
+            for start in range(0, len(resolved), self.batch_size):
+                batch = resolved[start:start + self.batch_size]
+                conn.execute(insert(ListenHistory.__table__), [
+                    {'user_id': user, 'track_id': track, 'listened_at': listened_at}
+                    for _, user, track, listened_at in batch
+                ])
+                conn.execute(delete(parked).where(parked.c.id.in_([row[0] for row in batch])))
+            if refresh_aggregates:
+                self._refresh_aggregates(conn)
+            remaining = conn.execute(select(func.count()).select_from(parked)).scalar()
+        if resolved or remaining:
+            self.logger.info(f"Replayed {len(resolved)} parked listen events, {remaining} still parked")
+        return len(resolved)
+    
+    def _load_listen_history(self, session, listen_history: List[ListenHistory]) -> None:
+        """Load listen history using the id mappings"""
+        if self._resolve_from_db:
+            self._resolve_ids(session, listen_history)
+        listen_history, orphans = self._split_orphans(listen_history)
+        new_records = [
+            ListenHistory(
+                user_id=self.user_id_map[history.user_id],
+                track_id=self.track_id_map[history.track_id],
+                listened_at=history.listened_at
+            )
+            for history in listen_history
+        ]
+        self._handle_orphans(session, orphans)
         
         if new_records:
             session.bulk_save_objects(new_records)
@@ -154,12 +355,502 @@ class DataLoader:
         try:
             if self.into_csv:
                 return self._save_all_to_csv(tracks, users, listen_history, genres)
+            elif self.core:
+                return self._save_all_core(tracks, users, listen_history, genres, update_existing)
             else:
                 return self._save_all_to_db(tracks, users, listen_history, genres, update_existing)
         except Exception as e:
             self.logger.error(f"Error loading data: {str(e)}")
             raise
     
+    def load_stream(
+        self,
+        chunks: Iterable[Tuple],
+        update_existing: bool = True,
+        checkpoint: Optional[Checkpoint] = None,
+        concurrent: bool = False,
+        page_loaded: Optional[Callable[[str, int], None]] = None
+    ) -> bool:
+        """Load chunks of transformed data as they arrive from the streaming pipeline
+        
+        Chunks are (resource, records) or (resource, records, page) tuples and must
+        come in loading order: the genres of a chunk before the tracks and users using
+        them, and every track and user before the listen history referencing them.
+        
+        With a checkpoint, each page is committed on its own and recorded in the
+        checkpoint, instead of loading everything in a single transaction. Pages
+        committed on their own are passed to `page_loaded` as (resource, page).
+        
+        `concurrent` tells that other loaders (shards) write the same tables meanwhile:
+        each page is committed on its own and loaded again when it conflicts with
+        the natural keys they inserted, and the listen history may reference tracks
+        and users they loaded.
+        
+        The Core load path loads everything within a single transaction, so it takes
+        neither a checkpoint nor concurrent loaders.
+        """
+        if self.core and not self.into_csv and (checkpoint is not None or concurrent):
+            raise ValueError("The Core load path commits once, it cannot be used with checkpoints or shards")
+        try:
+            if self.into_csv:
+                return self._stream_to_csv(chunks)
+            elif self.core:
+                return self._stream_core(chunks, update_existing)
+            else:
+                return self._stream_to_db(chunks, update_existing, checkpoint, concurrent, page_loaded)
+        except Exception as e:
+            self.logger.error(f"Error loading data: {str(e)}")
+            raise
+    
+    def _stream_to_csv(self, chunks: Iterable[Tuple[str, List]]) -> bool:
+        """Append each chunk to the CSV file of its resource"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        
+        for resource, records, *_ in chunks:
+            with self.metrics.stage('load') as total, self.metrics.stage(f'load.{resource}') as step:
+                self._save_to_csv(records, f"{resource}_{timestamp}.csv", append=True)
+                total.add_rows(len(records))
+                step.add_rows(len(records))
+        
+        # Resources without any record still get their (empty) file
+        for resource in self.RESOURCES:
+            filepath = os.path.join(self.csv_folder, f"{resource}_{timestamp}.csv")
+            if not os.path.exists(filepath):
+                self._save_to_csv([], f"{resource}_{timestamp}.csv")
+        
+        self._log_csv_files()
+        return True
+    
+    def _stream_to_db(
+        self,
+        chunks: Iterable[Tuple],
+        update_existing: bool,
+        checkpoint: Optional[Checkpoint] = None,
+        concurrent: bool = False,
+        page_loaded: Optional[Callable[[str, int], None]] = None
+    ) -> bool:
+        """Load each chunk into the database, within a single transaction unless committing per page"""
+        try:
+            self.metrics.instrument_engine(self.db_config.engine)
+            if checkpoint is not None and any(checkpoint.last_loaded(resource) for resource in ('tracks', 'users')):
+                # Tracks and users of the previous run are resolved from the database, through the id aliases
+                self._resolve_from_db = True
+            self._resolve_from_db = self._resolve_from_db or concurrent
+            per_page = checkpoint is not None or concurrent
+            with self.db_config.get_session() as session:
+                # Committed rows stay in use by the next pages (e.g. genres), no need to reload them
+                session.expire_on_commit = False
+                page_chunks = []
+                for chunk in chunks:
+                    if not per_page:
+                        self._load_stream_chunk(session, chunk, update_existing)
+                        continue
+                    # New genres come ahead of the tracks or users of their page, committed with them
+                    page_chunks.append(chunk)
+                    if chunk[0] != 'genres':
+                        self._commit_page(session, page_chunks, update_existing, checkpoint, not concurrent, page_loaded)
+                        page_chunks = []
+                
+                if not per_page:
+                    self._refresh_aggregates(session)
+                self._log_counts(session)
+                return True
+                
+        except SQLAlchemyError as e:
+            self.logger.error(f"Database error: {str(e)}")
+            raise
+    
+    def _load_stream_chunk(self, session, chunk: Tuple, update_existing: bool) -> None:
+        """Load one streamed chunk and flush it"""
+        resource, records = chunk[0], chunk[1]
+        self.logger.debug(f"Loading {len(records)} {resource} to database...")
+        with self.metrics.stage('load') as total, self.metrics.stage(f'load.{resource}') as step:
+            self._load_chunk(session, resource, records, update_existing)
+            session.flush()
+            total.add_rows(len(records))
+            step.add_rows(len(records))
+    
+    def _commit_page(
+        self,
+        session,
+        chunks: List[Tuple],
+        update_existing: bool,
+        checkpoint: Optional[Checkpoint],
+        refresh_aggregates: bool = True,
+        page_loaded: Optional[Callable[[str, int], None]] = None,
+        attempts: int = 5
+    ) -> None:
+        """Load and commit the chunks of one source page
+        
+        The aggregates are refreshed with the page unless `refresh_aggregates` is unset:
+        concurrent loaders may commit their events out of id order.
+        
+        A concurrent loader inserting the same natural key (genre name, track name and
+        artist, user email) first makes the page fail on a unique constraint: it is then
+        rolled back and loaded again, matching the rows inserted by the other loader.
+        """
+        resource, _, *page = chunks[-1]
+        for attempt in range(1, attempts + 1):
+            try:
+                for chunk in chunks:
+                    self._load_stream_chunk(session, chunk, update_existing)
+                if refresh_aggregates and resource == 'listen_history':
+                    self._refresh_aggregates(session)
+                session.commit()
+                break
+            except IntegrityError as e:
+                session.rollback()
+                if attempt == attempts:
+                    raise
+                self.logger.warning(f"Page conflicting with a concurrent load, retrying ({attempt}/{attempts}): {e.orig}")
+                # The ids given to the genres of the page were rolled back
+                for resource, records, *_ in chunks:
+                    if resource == 'genres':
+                        for genre in records:
+                            self.genre_id_map.pop(genre.id, None)
+                            genre.id = None
+        
+        if checkpoint is not None and page:
+            checkpoint.mark_loaded(resource, page[0])
+        if page_loaded is not None and page:
+            page_loaded(resource, page[0])
+    
+    def _load_chunk(self, session, resource: str, records: List, update_existing: bool) -> None:
+        """Dispatch a chunk to the loading method of its resource"""
+        if resource == 'genres':
+            self._load_genres(session, records, update_existing)
+        elif resource == 'tracks':
+            self._load_tracks(session, records, update_existing)
+        elif resource == 'users':
+            self._load_users(session, records, update_existing)
+        elif resource == 'listen_history':
+            self._load_listen_history(session, records)
+        else:
+            raise ValueError(f"Unknown resource: {resource}")
+    
+    def load_tables(self, tables: Dict[str, pa.Table], update_existing: bool = True) -> bool:
+        """Load the Arrow tables of `DataTransformer.transform_tables` to the database or CSV files
+        
+        No ORM object is built: CSV files are written by the Arrow CSV writer, one per
+        table, and database rows go through the Core load path.
+        """
+        try:
+            if self.into_csv:
+                return self._save_tables_to_csv(tables)
+            else:
+                return self._save_tables_to_db(tables, update_existing)
+        except Exception as e:
+            self.logger.error(f"Error loading data: {str(e)}")
+            raise
+    
+    def _save_tables_to_csv(self, tables: Dict[str, pa.Table]) -> bool:
+        """Write each table to its CSV file, junction tables included"""
+        import pyarrow.csv
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        
+        for name, table in tables.items():
+            with self.metrics.stage(f'load.{name}') as step:
+                filepath = os.path.join(self.csv_folder, f"{name}_{timestamp}.csv")
+                pyarrow.csv.write_csv(table, filepath)
+                step.add_rows(table.num_rows)
+            self.logger.info(f"Saved {table.num_rows} records to {filepath}")
+        
+        self._log_csv_files()
+        return True
+    
+    def _save_tables_to_db(self, tables: Dict[str, pa.Table], update_existing: bool) -> bool:
+        """Load every table within a single transaction, one record batch at a time"""
+        try:
+            self.metrics.instrument_engine(self.db_config.engine)
+            with self._core_connection() as conn:
+                with self.metrics.stage('load.genres') as step:
+                    names = tables['genres'].column('name').to_pylist()
+                    self._load_genre_names(conn, names)
+                    # Ids given by the transform to the genres, referenced by the junction tables
+                    genre_ids = dict(zip(tables['genres'].column('id').to_pylist(), (self.genre_name_map[n] for n in names)))
+                    step.add_rows(len(names))
+                
+                for resource, (model, _, _, edge_table, _) in self.CORE_ENTITIES.items():
+                    self.logger.info(f"Loading {resource} to database...")
+                    with self.metrics.stage(f'load.{resource}') as step:
+                        for batch in tables[resource].to_batches(max_chunksize=self.batch_size):
+                            self._load_entity_rows(conn, resource, batch.to_pylist(), update_existing)
+                        edges = tables[edge_table.name]
+                        pairs = zip(edges.column(0).to_pylist(), (genre_ids[g] for g in edges.column(1).to_pylist()))
+                        self._load_edge_rows(conn, resource, pairs, update_existing)
+                        step.add_rows(tables[resource].num_rows)
+                
+                self.logger.info("Loading listen history to database...")
+                with self.metrics.stage('load.listen_history') as step:
+                    self._load_listen_history_table(conn, tables['listen_history'])
+                    step.add_rows(tables['listen_history'].num_rows)
+                
+                self._refresh_aggregates(conn)
+            
+            self._log_core_counts()
+            return True
+        
+        except SQLAlchemyError as e:
+            self.logger.error(f"Database error: {str(e)}")
+            raise
+    
+    @contextmanager
+    def _core_connection(self):
+        """Transaction on a Core connection sending executemany batches of `batch_size` rows"""
+        self._open_key_cache()
+        try:
+            with self.db_config.engine.connect() as conn:
+                conn.execution_options(insertmanyvalues_page_size=self.batch_size)
+                with conn.begin():
+                    yield conn
+            # Only committed keys are indexed: a rolled back insert must not be found later
+            self._publish_keys()
+        finally:
+            self._pending_keys.clear()
+    
+    def _open_key_cache(self) -> None:
+        """Check the key indexes against the database generation, and build them when outdated"""
+        if self.key_index_dir is None:
+            return
+        from src.moovitamix_etl.load.key_index import KeyCache
+        
+        generation = self.db_config.generation()
+        if self.key_cache is None or self.key_cache.generation != generation:
+            if self.key_cache is not None:
+                # The database was recreated since the previous run: its ids are gone
+                self.genre_name_map.clear()
+                self.track_id_map.clear()
+                self.user_id_map.clear()
+            self.key_cache = KeyCache(self.key_index_dir, generation)
+        if self.key_cache.stale:
+            with self.metrics.stage('load.key_index'):
+                self.key_cache.build(self.db_config, self.batch_size)
+    
+    def _indexed_ids(self, dimension: str, keys: List[Tuple]) -> Dict[Tuple, int]:
+        """Database ids of the natural keys found in the key index"""
+        if self.key_cache is None or not keys:
+            return {}
+        ids = self.key_cache[dimension].get_many(keys)
+        return {key: db_id for key, db_id in zip(keys, ids) if db_id is not None}
+    
+    def _remember_keys(self, dimension: str, items: Iterable[Tuple[Tuple, int]]) -> None:
+        if self.key_cache is not None:
+            self._pending_keys.setdefault(dimension, {}).update(items)
+    
+    def _publish_keys(self) -> None:
+        """Write the keys of the committed transaction to the key indexes"""
+        if self.key_cache is None:
+            return
+        for dimension, keys in self._pending_keys.items():
+            self.key_cache[dimension].update(keys.items())
+        self.key_cache.flush()
+    
+    def _load_genre_names(self, conn, names: List[str]) -> None:
+        """Insert the genres not in the database yet and record the ids of all in `genre_name_map`"""
+        names = [name for name in dict.fromkeys(names) if name not in self.genre_name_map]
+        indexed = self._indexed_ids('genres', [(name,) for name in names])
+        self.genre_name_map.update((name, db_id) for (name,), db_id in indexed.items())
+        names = [name for name in names if name not in self.genre_name_map]
+        for start in range(0, len(names), self.batch_size):
+            batch = names[start:start + self.batch_size]
+            existing = dict(conn.execute(select(Genre.name, Genre.id).where(Genre.name.in_(batch))).all())
+            missing = [{'name': name} for name in batch if name not in existing]
+            if missing:
+                conn.execute(insert(Genre.__table__), missing)
+                existing.update(conn.execute(select(Genre.name, Genre.id).where(Genre.name.in_(batch))).all())
+            self.genre_name_map.update(existing)
+            self._remember_keys('genres', (((name,), db_id) for name, db_id in existing.items()))
+    
+    def _load_entity_rows(self, conn, resource: str, rows: List[dict], update_existing: bool) -> None:
+        """Insert the tracks or users whose natural key is new, update the others, and map their ids
+        
+        With a key index, only the keys missing from it are looked up in the database.
+        """
+        model, key, updated, _, _ = self.CORE_ENTITIES[resource]
+        id_map = self.track_id_map if resource == 'tracks' else self.user_id_map
+        columns = model.__table__.c
+        natural_keys = [tuple(row[name] for name in key) for row in rows]
+        existing = self._indexed_ids(resource, natural_keys)
+        unindexed = {row[key[0]] for row, natural_key in zip(rows, natural_keys) if natural_key not in existing}
+        if unindexed:
+            found = {
+                tuple(row[1:]): row[0]
+                for row in conn.execute(
+                    select(columns.id, *[columns[name] for name in key])
+                    .where(columns[key[0]].in_(unindexed))
+                )
+            }
+            self._remember_keys(resource, found.items())
+            existing.update(found)
+        new_rows, updates, remapped_ids = [], [], {}
+        for row, natural_key in zip(rows, natural_keys):
+            if natural_key in existing:
+                id_map[row['id']] = existing[natural_key]
+                if existing[natural_key] != row['id']:
+                    remapped_ids[row['id']] = existing[natural_key]
+                updates.append(dict({name: row[name] for name in updated}, _id=existing[natural_key]))
+            else:
+                # Later rows with the same natural key map to the first one
+                existing[natural_key] = id_map[row['id']] = row['id']
+                self._remember_keys(resource, [(natural_key, row['id'])])
+                new_rows.append(row)
+        if new_rows:
+            conn.execute(insert(model.__table__), new_rows)
+        self._record_aliases(conn, resource, remapped_ids)
+        if updates and update_existing:
+            conn.execute(
+                update(model.__table__).where(columns.id == bindparam('_id')).values(
+                    {name: bindparam(name) for name in updated}
+                ),
+                updates
+            )
+    
+    def _load_edge_rows(self, conn, resource: str, pairs: Iterable[Tuple[int, int]], update_existing: bool) -> None:
+        """Insert the (source id, genre database id) pairs of the loaded tracks or users
+        
+        The previous genres of the owners are replaced, so all the pairs of an owner
+        must come in the same call, in row order: as with the ORM path, the last row
+        of a natural key gives the genres of the database row.
+        """
+        _, _, _, edge_table, _ = self.CORE_ENTITIES[resource]
+        id_map = self.track_id_map if resource == 'tracks' else self.user_id_map
+        owner_column, genre_column = edge_table.c.keys()
+        # Database owner id -> (source id, genre ids)
+        genres_of = {}
+        for source_id, genre_id in pairs:
+            if source_id not in id_map:
+                continue
+            owner_source_id, genre_ids = genres_of.get(id_map[source_id], (source_id, set()))
+            if owner_source_id != source_id:
+                genre_ids = set()
+            genre_ids.add(genre_id)
+            genres_of[id_map[source_id]] = (source_id, genre_ids)
+        pairs = {(owner_id, genre_id) for owner_id, (_, genre_ids) in genres_of.items() for genre_id in genre_ids}
+        owners = list(genres_of)
+        for start in range(0, len(owners), self.batch_size):
+            batch = owners[start:start + self.batch_size]
+            if update_existing:
+                conn.execute(delete(edge_table).where(edge_table.c[owner_column].in_(batch)))
+            else:
+                # Only the owners inserted by this load get their genres
+                pairs -= set(conn.execute(
+                    select(edge_table.c[owner_column], edge_table.c[genre_column])
+                    .where(edge_table.c[owner_column].in_(batch))
+                ).all())
+        rows = [{owner_column: owner_id, genre_column: genre_id} for owner_id, genre_id in sorted(pairs)]
+        for start in range(0, len(rows), self.batch_size):
+            conn.execute(insert(edge_table), rows[start:start + self.batch_size])
+    
+    def _map_ids(self, ids: pa.ChunkedArray, id_map: Dict[int, int]) -> pa.Array:
+        """Database ids of source ids, null where the source id was not loaded"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        
+        source_ids = pa.array(list(id_map.keys()), pa.int64())
+        db_ids = pa.array(list(id_map.values()), pa.int64())
+        return pc.take(db_ids, pc.index_in(ids, value_set=source_ids))
+    
+    def _load_listen_history_table(self, conn, listen_history: pa.Table) -> None:
+        """Insert the listen events whose track and user were loaded"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        
+        events = pa.table({
+            'user_id': self._map_ids(listen_history.column('user_id'), self.user_id_map),
+            'track_id': self._map_ids(listen_history.column('track_id'), self.track_id_map),
+            'listened_at': listen_history.column('listened_at'),
+        })
+        resolved = pc.and_(pc.is_valid(events.column('user_id')), pc.is_valid(events.column('track_id')))
+        self._handle_orphans(conn, listen_history.filter(pc.invert(resolved)).to_pylist())
+        for batch in events.filter(resolved).to_batches(max_chunksize=self.batch_size):
+            conn.execute(insert(ListenHistory.__table__), batch.to_pylist())
+    
+    def _load_listen_history_rows(self, conn, listen_history: List[ListenHistory]) -> None:
+        """Insert the listen events whose track and user were loaded, as plain rows"""
+        listen_history, orphans = self._split_orphans(listen_history)
+        rows = [
+            {
+                'user_id': self.user_id_map[history.user_id],
+                'track_id': self.track_id_map[history.track_id],
+                'listened_at': history.listened_at
+            }
+            for history in listen_history
+        ]
+        self._handle_orphans(conn, orphans)
+        if rows:
+            conn.execute(insert(ListenHistory.__table__), rows)
+    
+    def _load_core_chunk(self, conn, resource: str, records: List, update_existing: bool) -> None:
+        """Load model objects through the Core path, `batch_size` at a time
+        
+        The objects are only read: they are never added to a session, so nothing
+        keeps them alive once the caller drops them.
+        """
+        for start in range(0, len(records), self.batch_size):
+            batch = records[start:start + self.batch_size]
+            if resource == 'genres':
+                self._load_genre_names(conn, [genre.name for genre in batch])
+            elif resource in self.CORE_ENTITIES:
+                model, _, _, _, relationship = self.CORE_ENTITIES[resource]
+                names = model.__table__.c.keys()
+                rows = [{name: getattr(record, name) for name in names} for record in batch]
+                self._load_entity_rows(conn, resource, rows, update_existing)
+                pairs = [
+                    (record.id, self.genre_name_map[genre.name])
+                    for record in batch
+                    for genre in getattr(record, relationship)
+                    if genre.name in self.genre_name_map
+                ]
+                self._load_edge_rows(conn, resource, pairs, update_existing)
+            elif resource == 'listen_history':
+                self._load_listen_history_rows(conn, batch)
+            else:
+                raise ValueError(f"Unknown resource: {resource}")
+    
+    def _save_all_core(
+        self,
+        tracks: List[Track],
+        users: List[User],
+        listen_history: List[ListenHistory],
+        genres: List[Genre],
+        update_existing: bool
+    ) -> bool:
+        """Save all data to database through the Core path, within a single transaction"""
+        chunks = zip(self.RESOURCES, (genres, tracks, users, listen_history))
+        return self._stream_core(chunks, update_existing, streamed=False)
+    
+    def _stream_core(self, chunks: Iterable[Tuple], update_existing: bool, streamed: bool = True) -> bool:
+        """Load each chunk through the Core path, within a single transaction
+        
+        Streamed chunks also count in the 'load' stage, timed by the pipeline in batch mode.
+        """
+        try:
+            self.metrics.instrument_engine(self.db_config.engine)
+            with self._core_connection() as conn:
+                for resource, records, *_ in chunks:
+                    self.logger.debug(f"Loading {len(records)} {resource} to database...")
+                    total_stage = self.metrics.stage('load') if streamed else nullcontext()
+                    with total_stage as total, self.metrics.stage(f'load.{resource}') as step:
+                        self._load_core_chunk(conn, resource, records, update_existing)
+                        step.add_rows(len(records))
+                        if total is not None:
+                            total.add_rows(len(records))
+                
+                self._refresh_aggregates(conn)
+            
+            self._log_core_counts()
+            return True
+        
+        except SQLAlchemyError as e:
+            self.logger.error(f"Database error: {str(e)}")
+            raise
+    
+    def _log_core_counts(self) -> None:
+        """Log database record counts after a Core load"""
+        with self.db_config.get_session() as session:
+            self._log_counts(session)
+    
     def _save_all_to_csv(
         self,
         tracks: List[Track],
@@ -171,10 +862,10 @@ class DataLoader:
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             
-            self._save_to_csv(genres, f"genres_{timestamp}.csv")
-            self._save_to_csv(tracks, f"tracks_{timestamp}.csv")
-            self._save_to_csv(users, f"users_{timestamp}.csv")
-            self._save_to_csv(listen_history, f"listen_history_{timestamp}.csv")
+            for resource, records in zip(self.RESOURCES, (genres, tracks, users, listen_history)):
+                with self.metrics.stage(f'load.{resource}') as step:
+                    self._save_to_csv(records, f"{resource}_{timestamp}.csv")
+                    step.add_rows(len(records))
             
             self._log_csv_files()
             return True
@@ -193,27 +884,37 @@ class DataLoader:
     ) -> bool:
         """Save all data to database"""
         try:
+            self.metrics.instrument_engine(self.db_config.engine)
             with self.db_config.get_session() as session:
                 # Step 1: Genres
                 self.logger.info("Loading genres to database...")
-                self._load_genres(session, genres, update_existing)
-                session.flush()
+                with self.metrics.stage('load.genres') as step:
+                    self._load_genres(session, genres, update_existing)
+                    session.flush()
+                    step.add_rows(len(genres))
                 
                 # Step 2: Tracks
                 self.logger.info("Loading tracks to database...")
-                self._load_tracks(session, tracks, update_existing)
-                session.flush()
+                with self.metrics.stage('load.tracks') as step:
+                    self._load_tracks(session, tracks, update_existing)
+                    session.flush()
+                    step.add_rows(len(tracks))
                 
                 # Step 3: Users
                 self.logger.info("Loading users to database...")
-                self._load_users(session, users, update_existing)
-                session.flush()
+                with self.metrics.stage('load.users') as step:
+                    self._load_users(session, users, update_existing)
+                    session.flush()
+                    step.add_rows(len(users))
                 
                 # Step 4: Listen History
                 self.logger.info("Loading listen history to database...")
-                self._load_listen_history(session, listen_history)
-                session.flush()
+                with self.metrics.stage('load.listen_history') as step:
+                    self._load_listen_history(session, listen_history)
+                    session.flush()
+                    step.add_rows(len(listen_history))
                 
+                self._refresh_aggregates(session)
                 self._log_counts(session)
                 return True
                 
@@ -221,6 +922,15 @@ class DataLoader:
             self.logger.error(f"Database error: {str(e)}")
             raise
     
+    def _refresh_aggregates(self, conn) -> None:
+        """Upsert the listen events of the transaction into the aggregate tables"""
+        if not self.aggregates:
+            return
+        from src.moovitamix_etl.load.aggregates import refresh_aggregates
+        
+        with self.metrics.stage('load.aggregates') as step:
+            step.add_rows(refresh_aggregates(conn))
+    
     def _log_counts(self, session) -> None:
         """Log database record counts"""
         counts = {
@@ -1,38 +1,91 @@
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.ext.declarative import declarative_base
 from contextlib import contextmanager
-from typing import Generator
+from functools import lru_cache
+from typing import Any, Callable, Generator, Iterator, Optional
 import logging
 import os
-from dotenv import load_dotenv
+import uuid
+from src.moovitamix_etl.load.model.model import Base, EtlState
+
+
+@lru_cache(maxsize=None)
+def load_environment() -> None:
+    """Load the .env file into the environment, once, when a configuration is first created"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def _setting(value: Any, name: str, default: Optional[str], cast: Callable = str) -> Any:
+    """Explicit value, or else the environment variable `name` read now"""
+    if value is not None:
+        return value
+    raw = os.getenv(name, default)
+    return cast(raw) if raw is not None else None
+
+
+def _flag(raw: str) -> bool:
+    return raw.lower() == "true"
 
-# Load environment variables
-load_dotenv()
 
 class DatabaseConfig:
-    """Database configuration and connection management class"""
+    """Database configuration and connection management class
+    
+    Settings left to None come from the DB_* environment variables (and the .env
+    file), read when the configuration is created rather than when it is imported.
+    """
     
     def __init__(
         self,
-        user: str = os.getenv("DB_USER", "root"),
-        password: str = os.getenv("DB_PASSWORD", "root"),
-        host: str = os.getenv("DB_HOST", "localhost"),
-        port: str = os.getenv("DB_PORT", "3305"),
-        database: str = os.getenv("DB_NAME", "moovitamix"),
-        echo: bool = os.getenv("DB_ECHO", "False").lower() == "true"
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        host: Optional[str] = None,
+        port: Optional[str] = None,
+        database: Optional[str] = None,
+        echo: Optional[bool] = None,
+        url: Optional[str] = None,
+        pool_size: Optional[int] = None,
+        max_overflow: Optional[int] = None,
+        pool_timeout: Optional[float] = None,
+        pool_recycle: Optional[int] = None,
+        pool_pre_ping: Optional[bool] = None
     ):
+        load_environment()
+        user = _setting(user, "DB_USER", "root")
+        password = _setting(password, "DB_PASSWORD", "root")
+        host = _setting(host, "DB_HOST", "localhost")
+        port = _setting(port, "DB_PORT", "3305")
+        database = _setting(database, "DB_NAME", "moovitamix")
+        echo = _setting(echo, "DB_ECHO", "False", _flag)
+        url = _setting(url, "DB_URL", None)
+        pool_size = _setting(pool_size, "DB_POOL_SIZE", "5", int)
+        max_overflow = _setting(max_overflow, "DB_MAX_OVERFLOW", "10", int)
+        pool_timeout = _setting(pool_timeout, "DB_POOL_TIMEOUT", "30", float)
+        pool_recycle = _setting(pool_recycle, "DB_POOL_RECYCLE", "1800", int)
+        pool_pre_ping = _setting(pool_pre_ping, "DB_POOL_PRE_PING", "True", _flag)
+        
         self.user = user
         self.password = password
         self.host = host
         self.port = port
         self.database = database
         self.echo = echo
+        # Full SQLAlchemy URL overriding the MySQL components, e.g. sqlite:///moovitamix.db
+        self.url = url
+        # Connection pool, sized for the loaders running in parallel in this process
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_timeout = pool_timeout
+        self.pool_recycle = pool_recycle
+        # Check each connection before use, so connections dropped by the server are replaced
+        self.pool_pre_ping = pool_pre_ping
         
         # Initialize core SQLAlchemy components
         self._engine = None
         self._session_factory = None
-        self.Base = declarative_base()
+        self.Base = Base
         
         # Set up logging
         self.logger = logging.getLogger(__name__)
@@ -40,25 +93,32 @@ class DatabaseConfig:
     @property
     def database_url(self) -> str:
         """Construct database URL from components"""
+        if self.url:
+            return self.url
         return f"mysql+pymysql://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}"
     
     @property
     def engine(self):
         """Lazy initialization of the database engine"""
         if self._engine is None:
-            self._engine = create_engine(
-                self.database_url,
-                echo=self.echo,
-                pool_size=5,
-                max_overflow=10,
-                pool_timeout=30,
-                pool_recycle=1800,
-                # Add connect_args for additional MySQL configuration if needed
-                connect_args={
-                    "charset": "utf8mb4",
-                    "connect_timeout": 60,
-                }
-            )
+            if self.database_url.startswith("mysql"):
+                self._engine = create_engine(
+                    self.database_url,
+                    echo=self.echo,
+                    pool_size=self.pool_size,
+                    max_overflow=self.max_overflow,
+                    pool_timeout=self.pool_timeout,
+                    pool_recycle=self.pool_recycle,
+                    pool_pre_ping=self.pool_pre_ping,
+                    # Add connect_args for additional MySQL configuration if needed
+                    connect_args={
+                        "charset": "utf8mb4",
+                        "connect_timeout": 60,
+                    }
+                )
+            else:
+                # Other databases (e.g. SQLite for tests and benchmarks) keep their default pool
+                self._engine = create_engine(self.database_url, echo=self.echo, pool_pre_ping=self.pool_pre_ping)
         return self._engine
     
     @property
@@ -92,6 +152,65 @@ class DatabaseConfig:
         finally:
             session.close()
     
+    def stream_query(self, statement, batch_size: int = 1000, **params) -> Iterator[Row]:
+        """
+        Iterate over the rows of a query without buffering the whole result.
+        
+        The rows are read through a server-side cursor (SSCursor with PyMySQL) and
+        fetched `batch_size` at a time, so large reads such as key preloads or exports
+        keep a bounded memory. The connection stays checked out until the iteration
+        ends or the generator is closed.
+        
+        Usage:
+            for track_id, name in db_config.stream_query(select(Track.id, Track.name)):
+                ...
+        """
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(statement, params)
+            for partition in result.partitions():
+                yield from partition
+    
+    def generation(self) -> str:
+        """
+        Marker of the current life of the database, created by its first call.
+        
+        Recreating the tables gives a new marker, telling the caches built from the
+        previous content (e.g. the key indexes of `KeyCache`) to rebuild. Operations
+        deleting or renumbering rows behind the pipeline must call `new_generation`.
+        """
+        with self.get_session() as session:
+            marker = session.get(EtlState, 'generation')
+            if marker is not None:
+                return marker.value
+        try:
+            return self.new_generation(replace=False)
+        except IntegrityError:
+            # Created meanwhile by a concurrent loader
+            with self.get_session() as session:
+                return session.get(EtlState, 'generation').value
+    
+    def new_generation(self, replace: bool = True) -> str:
+        """Record a new generation marker, invalidating the caches built from the database"""
+        value = uuid.uuid4().hex
+        with self.get_session() as session:
+            if replace:
+                session.merge(EtlState(name='generation', value=value))
+            else:
+                session.add(EtlState(name='generation', value=value))
+        self.logger.info(f"Database generation: {value}")
+        return value
+    
+    def get_state(self, name: str) -> Optional[str]:
+        """Value of an `etl_state` entry, None when missing"""
+        with self.get_session() as session:
+            state = session.get(EtlState, name)
+            return state.value if state is not None else None
+    
+    def set_state(self, name: str, value: str) -> None:
+        """Create or replace an `etl_state` entry"""
+        with self.get_session() as session:
+            session.merge(EtlState(name=name, value=value))
+    
     def init_database(self) -> bool:
         """
         Initialize the database by creating all tables.
@@ -140,9 +259,6 @@ class DatabaseConfig:
             self._session_factory = None
             self.logger.info("Database engine disposed")
 
-# Create a default instance
-default_db_config = DatabaseConfig()
-
 # Example usage
 if __name__ == "__main__":
     # Set up logging
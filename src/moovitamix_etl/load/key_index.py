@@ -0,0 +1,203 @@
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from src.moovitamix_etl.load.model.model import Genre, Track, User
+
+# One slot of an index: hash of the natural key (0 when empty) and database id
+SLOT_DTYPE = np.dtype([('hash', '<u8'), ('id', '<i8')])
+
+# Slots are doubled whenever the index gets more than half full
+MIN_CAPACITY = 1024
+
+
+def key_hash(key: Tuple) -> int:
+    """64 bit hash of a natural key, never 0 which marks the empty slots"""
+    encoded = '\x1f'.join(str(part) for part in key).encode()
+    return int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), 'little') or 1
+
+
+class KeyIndex:
+    """Open addressing hash table from natural keys to database ids, in a memory-mapped file
+
+    Only the 64 bit hashes of the keys are stored, so an index of millions of keys
+    takes 16 bytes per slot and opens without being read. Lookups and inserts probe
+    linearly from the hash, a batch of keys at a time with numpy.
+
+    Hits are not checked against the keys: two natural keys with the same hash share
+    a slot, and the second one silently gets the id of the first. With 64 bit hashes
+    this takes billions of keys to become likely (about n² / 2^65 for n keys).
+
+    Args:
+        path (str): the `.npy` file of the index, created when missing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.exists(path):
+            self.slots = np.load(path, mmap_mode='r+')
+        else:
+            self.slots = self._create(path, MIN_CAPACITY)
+        self.count = int(np.count_nonzero(self.slots['hash']))
+
+    @staticmethod
+    def _create(path: str, capacity: int) -> np.memmap:
+        slots = np.lib.format.open_memmap(path, mode='w+', dtype=SLOT_DTYPE, shape=(capacity,))
+        slots[:] = 0
+        return slots
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _probe(self, hashes: np.ndarray) -> np.ndarray:
+        """Slot of each hash: the one holding it, or the empty slot where it would go"""
+        mask = np.uint64(len(self.slots) - 1)
+        positions = (hashes & mask).astype(np.int64)
+        pending = np.arange(len(hashes))
+        while len(pending):
+            found = self.slots['hash'][positions[pending]]
+            done = (found == hashes[pending]) | (found == 0)
+            pending = pending[~done]
+            positions[pending] = (positions[pending] + 1) & int(mask)
+        return positions
+
+    def get_many(self, keys: Sequence[Tuple]) -> List[Optional[int]]:
+        """Database id of each natural key, None when it is not in the index (or the id of a colliding key)"""
+        if not keys:
+            return []
+        hashes = np.fromiter((key_hash(key) for key in keys), dtype=np.uint64, count=len(keys))
+        slots = self.slots[self._probe(hashes)]
+        return [int(slot_id) if slot_hash else None for slot_hash, slot_id in zip(slots['hash'], slots['id'])]
+
+    def get(self, key: Tuple) -> Optional[int]:
+        return self.get_many([key])[0]
+
+    def update(self, items: Iterable[Tuple[Tuple, int]]) -> None:
+        """Add or replace natural key -> database id entries"""
+        items = list(items)
+        if not items:
+            return
+        hashes = np.fromiter((key_hash(key) for key, _ in items), dtype=np.uint64, count=len(items))
+        ids = np.fromiter((db_id for _, db_id in items), dtype=np.int64, count=len(items))
+        # The last entry of a key repeated in the batch wins
+        _, last = np.unique(hashes[::-1], return_index=True)
+        keep = len(items) - 1 - last
+        self._reserve(self.count + len(keep))
+        self.count += self._insert(hashes[keep], ids[keep])
+
+    def _insert(self, hashes: np.ndarray, ids: np.ndarray) -> int:
+        """Write distinct hashes and their ids, return the number of slots they newly took
+
+        All the hashes are probed at once; hashes probing to the same empty slot take
+        it in turns, the others probing again past it.
+        """
+        added = 0
+        while len(hashes):
+            positions = self._probe(hashes)
+            replaced = self.slots['hash'][positions] == hashes
+            self.slots['id'][positions[replaced]] = ids[replaced]
+            empty = np.flatnonzero(~replaced)
+            _, first = np.unique(positions[empty], return_index=True)
+            taken = empty[first]
+            self.slots['hash'][positions[taken]] = hashes[taken]
+            self.slots['id'][positions[taken]] = ids[taken]
+            added += len(taken)
+            pending = np.setdiff1d(empty, taken, assume_unique=True)
+            hashes, ids = hashes[pending], ids[pending]
+        return added
+
+    def _reserve(self, count: int) -> None:
+        """Grow the table to keep it at most half full"""
+        capacity = len(self.slots)
+        if count * 2 <= capacity:
+            return
+        while count * 2 > capacity:
+            capacity *= 2
+        used = np.array(self.slots[self.slots['hash'] != 0])
+        tmp_path = f"{self.path}.{os.getpid()}.tmp.npy"
+        old = self.slots
+        self.slots = self._create(tmp_path, capacity)
+        self._insert(used['hash'], used['id'])
+        self.slots.flush()
+        del old
+        os.replace(tmp_path, self.path)
+
+    def flush(self) -> None:
+        self.slots.flush()
+
+
+class KeyCache:
+    """Key indexes of the dimensions (genres, tracks, users) of one database
+
+    The folder records the generation marker of the database its indexes were built
+    from (see `DatabaseConfig.generation`). Opened against another generation, e.g.
+    after the database was recreated, the indexes are discarded and built again from
+    the dimension tables by `build`.
+
+    Args:
+        folder (str): directory of the index files.
+        generation (str): generation marker of the database.
+    """
+
+    # Dimension -> model and natural key columns
+    DIMENSIONS = {
+        'genres': (Genre, ('name',)),
+        'tracks': (Track, ('name', 'artist')),
+        'users': (User, ('email',)),
+    }
+
+    def __init__(self, folder: str, generation: str):
+        self.folder = folder
+        self.generation = generation
+        self.logger = logging.getLogger(__name__)
+        meta_path = os.path.join(folder, 'key_index.json')
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        # Set while the indexes do not hold the keys already in the database
+        self.stale = meta.get('generation') != generation
+        if self.stale:
+            if meta:
+                self.logger.info("Database generation changed, discarding the key indexes")
+            shutil.rmtree(folder, ignore_errors=True)
+            os.makedirs(folder, exist_ok=True)
+        self.indexes: Dict[str, KeyIndex] = {
+            dimension: KeyIndex(os.path.join(folder, f"{dimension}.npy"))
+            for dimension in self.DIMENSIONS
+        }
+
+    def build(self, db_config, batch_size: int = 10000) -> None:
+        """Index the natural keys of the dimension tables, read through a server-side cursor
+
+        The generation is only recorded once every index is complete, so an interrupted
+        build starts over on the next run.
+        """
+        for dimension, (model, key) in self.DIMENSIONS.items():
+            columns = model.__table__.c
+            statement = select(*[columns[name] for name in key], columns.id)
+            rows = db_config.stream_query(statement, batch_size=batch_size)
+            while True:
+                batch = [(tuple(row[:-1]), row[-1]) for row in itertools.islice(rows, batch_size)]
+                self.indexes[dimension].update(batch)
+                if len(batch) < batch_size:
+                    break
+            self.logger.info(f"Indexed {len(self.indexes[dimension])} {dimension} keys")
+        self.flush()
+        with open(os.path.join(self.folder, 'key_index.json'), 'w') as f:
+            json.dump({'generation': self.generation}, f)
+        self.stale = False
+
+    def __getitem__(self, dimension: str) -> KeyIndex:
+        return self.indexes[dimension]
+
+    def flush(self) -> None:
+        for index in self.indexes.values():
+            index.flush()
@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import List
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Table
+from sqlalchemy import Column, Date, Float, Index, Integer, String, DateTime, ForeignKey, Table, UniqueConstraint
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func
 
@@ -11,7 +11,9 @@ track_genres = Table(
     'track_genres',
     Base.metadata,
     Column('track_id', Integer, ForeignKey('tracks.id'), primary_key=True),
-    Column('genre_id', Integer, ForeignKey('genres.id'), primary_key=True)
+    Column('genre_id', Integer, ForeignKey('genres.id'), primary_key=True),
+    # Tracks of a genre, for the analytics API
+    Index('ix_track_genres_genre', 'genre_id', 'track_id')
 )
 
 # Junction table for user_favorite_genres
@@ -44,6 +46,8 @@ class User(Base):
 class Track(Base):
     """Track model"""
     __tablename__ = 'tracks'
+    # Natural key of a track, keeps concurrent loaders from inserting the same one twice
+    __table_args__ = (UniqueConstraint('name', 'artist', name='uq_tracks_name_artist'),)
 
     id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False)
@@ -78,6 +82,8 @@ class Genre(Base):
 class ListenHistory(Base):
     """Listen History model"""
     __tablename__ = 'listen_history'
+    # History of a user over a time range, paginated on (listened_at, id)
+    __table_args__ = (Index('ix_listen_history_user_listened', 'user_id', 'listened_at', 'id'),)
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -91,4 +97,83 @@ class ListenHistory(Base):
     def __repr__(self):
         return f"<ListenHistory User:{self.user_id} Track:{self.track_id}>"
 
+class IdAlias(Base):
+    """Source id of a track or user loaded into an existing row with the same natural key"""
+    __tablename__ = 'id_aliases'
+
+    resource = Column(String(32), primary_key=True)
+    source_id = Column(Integer, primary_key=True)
+    target_id = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<IdAlias {self.resource}:{self.source_id} -> {self.target_id}>"
+
+class ParkedListenEvent(Base):
+    """Listen event whose user or track was not loaded yet, with its source ids, replayed once they are"""
+    __tablename__ = 'parked_listen_events'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    track_id = Column(Integer, nullable=False)
+    listened_at = Column(DateTime(timezone=True))
+    parked_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<ParkedListenEvent User:{self.user_id} Track:{self.track_id}>"
+
+class EtlState(Base):
+    """Named values kept by the pipeline in the database, e.g. its generation marker"""
+    __tablename__ = 'etl_state'
+
+    name = Column(String(64), primary_key=True)
+    value = Column(String(255), nullable=False)
+
+    def __repr__(self):
+        return f"<EtlState {self.name}={self.value}>"
+
+class UserTrackPlays(Base):
+    """Number of listens of a track by a user, maintained from the loaded listen history"""
+    __tablename__ = 'user_track_plays'
 
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    track_id = Column(Integer, ForeignKey('tracks.id'), primary_key=True)
+    play_count = Column(Integer, nullable=False)
+    last_listened_at = Column(DateTime(timezone=True))
+
+    def __repr__(self):
+        return f"<UserTrackPlays User:{self.user_id} Track:{self.track_id} x{self.play_count}>"
+
+class UserGenrePlays(Base):
+    """Number of listens of the tracks of a genre by a user"""
+    __tablename__ = 'user_genre_plays'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    genre_id = Column(Integer, ForeignKey('genres.id'), primary_key=True)
+    play_count = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<UserGenrePlays User:{self.user_id} Genre:{self.genre_id} x{self.play_count}>"
+
+class DailyTrackPlays(Base):
+    """Number of listens of a track per day"""
+    __tablename__ = 'daily_track_plays'
+
+    day = Column(Date, primary_key=True)
+    track_id = Column(Integer, ForeignKey('tracks.id'), primary_key=True)
+    play_count = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<DailyTrackPlays {self.day} Track:{self.track_id} x{self.play_count}>"
+
+class TrackSimilarity(Base):
+    """Track among the most similar to another one, from the users listening to both"""
+    __tablename__ = 'track_similarity'
+
+    track_id = Column(Integer, ForeignKey('tracks.id'), primary_key=True)
+    similar_track_id = Column(Integer, ForeignKey('tracks.id'), primary_key=True)
+    score = Column(Float, nullable=False)
+    # 1 for the most similar track
+    position = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<TrackSimilarity Track:{self.track_id} ~ Track:{self.similar_track_id} {self.score:.3f}>"
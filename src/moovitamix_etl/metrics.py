@@ -0,0 +1,367 @@
+import itertools
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Generator, List, Optional, Tuple
+
+# Upper bounds (in seconds) of the HTTP request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_PREFIX = "moovitamix_etl"
+
+
+# Interval between two samples of the resident memory while stages are open
+RSS_SAMPLING_INTERVAL = 0.01
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of the current process since it started, in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of the current process, in bytes (0 without /proc, e.g. on macOS)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+class RssSampler:
+    """Sample the resident memory in a background thread while stages are open
+
+    Each open stage holds a watch: the resident memory at its start and the highest
+    value sampled since. The thread stops once no watch is left, and starts again
+    with the next one.
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLING_INTERVAL):
+        self.interval = interval
+        self._watches: Dict[int, List[int]] = {}
+        self._tokens = itertools.count()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self) -> int:
+        """Start watching, return the token to give to `release`"""
+        rss = current_rss_bytes()
+        with self._lock:
+            token = next(self._tokens)
+            self._watches[token] = [rss, rss]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+                self._thread.start()
+        return token
+
+    def release(self, token: int) -> int:
+        """Stop watching, return the peak growth of the resident memory over its start"""
+        rss = current_rss_bytes()
+        with self._lock:
+            start, peak = self._watches.pop(token)
+        return max(peak, rss) - start
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            rss = current_rss_bytes()
+            with self._lock:
+                if not self._watches:
+                    self._thread = None
+                    return
+                for watch in self._watches.values():
+                    watch[1] = max(watch[1], rss)
+
+
+@dataclass
+class StageMetrics:
+    """Measurements of one pipeline stage or loading step"""
+    name: str
+    wall_time: float = 0.0
+    rows: int = 0
+    db_statements: int = 0
+    # Highest growth of the resident memory over its value when the stage was entered
+    peak_rss_delta_bytes: int = 0
+    calls: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.wall_time if self.wall_time > 0 else 0.0
+
+    def add_rows(self, count: int) -> None:
+        with self._lock:
+            self.rows += count
+
+    def to_dict(self) -> dict:
+        return {
+            "wall_time_seconds": round(self.wall_time, 6),
+            "rows": self.rows,
+            "rows_per_second": round(self.rows_per_second, 2),
+            "db_statements": self.db_statements,
+            "peak_rss_delta_bytes": self.peak_rss_delta_bytes,
+            "calls": self.calls,
+        }
+
+
+@dataclass
+class LatencyHistogram:
+    """Cumulative latency histogram, Prometheus style"""
+    buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    counts: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    total: float = 0.0
+    count: int = 0
+
+    def observe(self, seconds: float) -> None:
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += seconds
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le, cumulative count) pairs, ending with the +Inf bucket"""
+        pairs, running = [], 0
+        for bound, count in zip(list(self.buckets) + [float("inf")], self.counts):
+            running += count
+            pairs.append(("+Inf" if bound == float("inf") else repr(bound), running))
+        return pairs
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum_seconds": round(self.total, 6),
+            "mean_seconds": round(self.total / self.count, 6) if self.count else 0.0,
+            "buckets": dict(self.cumulative()),
+        }
+
+
+class PipelineMetrics:
+    """Collect wall time, throughput, HTTP latency, DB statements and memory of a run.
+
+    Stages are timed with the `stage` context manager and can be nested (e.g. 'load'
+    and 'load.tracks'). Entering the same stage several times accumulates its
+    measurements, which is how the streaming mode reports busy time per stage.
+    All methods are thread safe.
+
+    The memory of a stage is the growth of the resident memory of the process over
+    its value when the stage was entered, sampled every `RSS_SAMPLING_INTERVAL`
+    while it runs (from /proc, so only on Linux): stages running concurrently in
+    other threads count in it too. The run report also gives the peak resident
+    memory of the process since it started.
+    """
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.run_id = run_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.success: Optional[bool] = None
+        self.stages: Dict[str, StageMetrics] = {}
+        self.http_latency: Dict[str, LatencyHistogram] = {}
+        self.http_errors: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {}
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._active = threading.local()
+        # id(engine) -> (engine, listener), to stop counting once the run is over
+        self._instrumented_engines = {}
+        self._rss = RssSampler()
+
+    def _get_stage(self, name: str) -> StageMetrics:
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = StageMetrics(name)
+            return self.stages[name]
+
+    def _active_stages(self) -> List[StageMetrics]:
+        if not hasattr(self._active, "stack"):
+            self._active.stack = []
+        return self._active.stack
+
+    @contextmanager
+    def stage(self, name: str) -> Generator[StageMetrics, None, None]:
+        """Time a stage; DB statements run meanwhile on this thread are counted for it"""
+        stage = self._get_stage(name)
+        active = self._active_stages()
+        active.append(stage)
+        watch = self._rss.watch()
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            elapsed = time.perf_counter() - start
+            rss_delta = self._rss.release(watch)
+            active.pop()
+            with stage._lock:
+                stage.wall_time += elapsed
+                stage.calls += 1
+                stage.peak_rss_delta_bytes = max(stage.peak_rss_delta_bytes, rss_delta)
+
+    def observe_request(self, endpoint: str, seconds: float, failed: bool = False) -> None:
+        """Record the latency of one HTTP request"""
+        with self._lock:
+            self.http_latency.setdefault(endpoint, LatencyHistogram()).observe(seconds)
+            if failed:
+                self.http_errors[endpoint] = self.http_errors.get(endpoint, 0) + 1
+
+    def increment(self, name: str, count: int = 1) -> None:
+        """Add to a named counter, e.g. 'http_not_modified'"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def instrument_engine(self, engine) -> None:
+        """Count the statements executed through an engine, per active stage"""
+        from sqlalchemy import event
+
+        if id(engine) in self._instrumented_engines:
+            return
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            for stage in self._active_stages():
+                with stage._lock:
+                    stage.db_statements += 1
+
+        self._instrumented_engines[id(engine)] = (engine, count_statement)
+
+    def release_engines(self) -> None:
+        """Stop counting the statements of the instrumented engines, e.g. engines kept for the next run"""
+        from sqlalchemy import event
+
+        for engine, listener in self._instrumented_engines.values():
+            event.remove(engine, "before_cursor_execute", listener)
+        self._instrumented_engines.clear()
+
+    def merge_report(self, report: dict) -> None:
+        """Add the stages and counters of another run report, e.g. one of a worker process"""
+        for name, measured in report["stages"].items():
+            stage = self._get_stage(name)
+            with stage._lock:
+                stage.wall_time += measured["wall_time_seconds"]
+                stage.rows += measured["rows"]
+                stage.db_statements += measured["db_statements"]
+                stage.calls += measured["calls"]
+                stage.peak_rss_delta_bytes = max(stage.peak_rss_delta_bytes, measured["peak_rss_delta_bytes"])
+        for name, count in report.get("counters", {}).items():
+            self.increment(name, count)
+
+    def finish(self, success: bool) -> None:
+        """Mark the end of the run"""
+        self.finished_at = time.time()
+        self.success = success
+
+    def to_dict(self) -> dict:
+        """Run report as a JSON serializable dict"""
+        finished_at = self.finished_at or time.time()
+        with self._lock:
+            return {
+                "run_id": self.run_id,
+                "success": self.success,
+                "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+                "duration_seconds": round(finished_at - self.started_at, 6),
+                "process_peak_rss_bytes": peak_rss_bytes(),
+                "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+                "http_requests": {
+                    endpoint: dict(histogram.to_dict(), errors=self.http_errors.get(endpoint, 0))
+                    for endpoint, histogram in self.http_latency.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def to_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        report = self.to_dict()
+        p = METRIC_PREFIX
+        lines = [
+            f"# HELP {p}_run_success Whether the last run succeeded (1) or failed (0)",
+            f"# TYPE {p}_run_success gauge",
+            f"{p}_run_success {1 if self.success else 0}",
+            f"# HELP {p}_run_timestamp_seconds Start time of the last run",
+            f"# TYPE {p}_run_timestamp_seconds gauge",
+            f"{p}_run_timestamp_seconds {self.started_at:.3f}",
+            f"# HELP {p}_run_duration_seconds Wall time of the last run",
+            f"# TYPE {p}_run_duration_seconds gauge",
+            f"{p}_run_duration_seconds {report['duration_seconds']}",
+            f"# HELP {p}_process_peak_rss_bytes Peak resident memory of the process since it started",
+            f"# TYPE {p}_process_peak_rss_bytes gauge",
+            f"{p}_process_peak_rss_bytes {report['process_peak_rss_bytes']}",
+        ]
+
+        stage_metrics = [
+            ("stage_duration_seconds", "wall_time_seconds", "Wall time spent in a stage"),
+            ("stage_rows", "rows", "Rows processed by a stage"),
+            ("stage_rows_per_second", "rows_per_second", "Throughput of a stage"),
+            ("stage_db_statements", "db_statements", "SQL statements executed by a stage"),
+            ("stage_peak_rss_delta_bytes", "peak_rss_delta_bytes", "Peak growth of the resident memory during a stage"),
+        ]
+        for metric, key, description in stage_metrics:
+            lines.append(f"# HELP {p}_{metric} {description}")
+            lines.append(f"# TYPE {p}_{metric} gauge")
+            for name, stage in report["stages"].items():
+                lines.append(f'{p}_{metric}{{stage="{name}"}} {stage[key]}')
+
+        lines.append(f"# HELP {p}_http_request_duration_seconds Latency of the requests sent to the API")
+        lines.append(f"# TYPE {p}_http_request_duration_seconds histogram")
+        with self._lock:
+            histograms = list(self.http_latency.items())
+        for endpoint, histogram in histograms:
+            for le, count in histogram.cumulative():
+                lines.append(f'{p}_http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{le}"}} {count}')
+            lines.append(f'{p}_http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram.total:.6f}')
+            lines.append(f'{p}_http_request_duration_seconds_count{{endpoint="{endpoint}"}} {histogram.count}')
+
+        lines.append(f"# HELP {p}_http_request_errors Failed requests sent to the API")
+        lines.append(f"# TYPE {p}_http_request_errors gauge")
+        for endpoint, _ in histograms:
+            lines.append(f'{p}_http_request_errors{{endpoint="{endpoint}"}} {self.http_errors.get(endpoint, 0)}')
+
+        for name, value in report["counters"].items():
+            lines.append(f"# TYPE {p}_{name}_total counter")
+            lines.append(f"{p}_{name}_total {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, folder: str) -> str:
+        """Write the run report as JSON and return its path"""
+        os.makedirs(folder, exist_ok=True)
+        filepath = os.path.join(folder, f"run_report_{self.run_id}.json")
+        with open(filepath, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        self.logger.info(f"Run report written to {filepath}")
+        return filepath
+
+    def write_prometheus(self, folder: str, filename: str = f"{METRIC_PREFIX}.prom") -> str:
+        """Write the metrics for the node_exporter textfile collector and return the path
+
+        The file is written to a temporary name then renamed, so the collector never
+        reads a half written file.
+        """
+        os.makedirs(folder, exist_ok=True)
+        filepath = os.path.join(folder, filename)
+        tmp_path = f"{filepath}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, filepath)
+        self.logger.info(f"Prometheus metrics written to {filepath}")
+        return filepath
+
+    def push(self, gateway_url: str, job: str = METRIC_PREFIX, timeout: float = 10.0) -> None:
+        """Push the metrics to a Prometheus Pushgateway"""
+        import requests
+
+        url = f"{gateway_url.rstrip('/')}/metrics/job/{job}"
+        response = requests.put(url, data=self.to_prometheus().encode(), timeout=timeout)
+        response.raise_for_status()
+        self.logger.info(f"Metrics pushed to {url}")
@@ -1,26 +1,221 @@
+from __future__ import annotations
+
 import argparse
 import logging
-from src.moovitamix_etl.extract.extractor import Extractor
-from src.moovitamix_etl.transform.data_transformer import DataTransformer
-from src.moovitamix_etl.load.database_config import DatabaseConfig
-from src.moovitamix_etl.load.data_loader import DataLoader
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional, Tuple
+from src.moovitamix_etl.checkpoint import DEFAULT_CHECKPOINT_FILE, Checkpoint
+from src.moovitamix_etl.extract.resources import RESOURCES
+from src.moovitamix_etl.metrics import PipelineMetrics
+from src.moovitamix_etl.profiling import PROFILE_MODES, StageProfiler
+from src.moovitamix_etl.sharding import load_phases, shard_range
+from src.moovitamix_etl.streaming import StreamingRunner
+
+# pandas, SQLAlchemy, pyarrow and requests are imported by the stage needing them,
+# so that starting the CLI, or a CSV run, does not pay for all of them
+if TYPE_CHECKING:
+    from src.moovitamix_etl.extract.extractor import Extractor
+    from src.moovitamix_etl.load.database_config import DatabaseConfig
 
 class ETLPipeline:
     """ETL Pipeline to process music data"""
     
-    def __init__(self, into_csv: bool = False, csv_folder: str = "csv_data"):
+    def __init__(
+        self,
+        into_csv: bool = False,
+        csv_folder: str = "csv_data",
+        streaming: bool = False,
+        queue_size: int = 4,
+        page_size: int = 100,
+        bulk_export: bool = False,
+        metrics_dir: Optional[str] = None,
+        pushgateway_url: Optional[str] = None,
+        profile: Optional[str] = None,
+        profile_sampling: bool = False,
+        profile_interval: float = 0.01,
+        http_cache_dir: Optional[str] = None,
+        http_cache_size_mb: int = 256,
+        changed_only: bool = False,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 30.0,
+        max_retries: int = 5,
+        concurrency: int = 1,
+        checkpoint_file: Optional[str] = None,
+        resume: bool = False,
+        api_url: str = "http://127.0.0.1:8000",
+        db_url: Optional[str] = None,
+        shards: int = 1,
+        shard_index: int = 0,
+        workers: int = 1,
+        resources: Optional[List[str]] = None,
+        transform_workers: int = 1,
+        arrow: bool = False,
+        core_load: bool = False,
+        load_batch_size: int = 10000,
+        key_index_dir: Optional[str] = None,
+        aggregates: bool = False,
+        export_matrix_dir: Optional[str] = None,
+        export_format: str = "npy",
+        similarity: Optional[str] = None,
+        similarity_top_k: int = 20,
+        similarity_memory_mb: float = 256,
+        validate: bool = False,
+        reject_dir: str = "rejects",
+        park_orphans: bool = False,
+        db_pool_size: Optional[int] = None,
+        db_max_overflow: Optional[int] = None,
+        db_pool_pre_ping: Optional[bool] = None,
+        keep_warm: bool = False
+    ):
         self.into_csv = into_csv
         self.csv_folder = csv_folder
+        self.streaming = streaming
+        self.queue_size = queue_size
+        self.page_size = page_size
+        self.bulk_export = bulk_export
+        self.metrics_dir = metrics_dir
+        self.pushgateway_url = pushgateway_url
+        self.profile = profile
+        self.profile_sampling = profile_sampling
+        self.profile_interval = profile_interval
+        self.http_cache_dir = http_cache_dir
+        self.http_cache_size_mb = http_cache_size_mb
+        self.changed_only = changed_only
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.concurrency = concurrency
+        self.checkpoint_file = checkpoint_file
+        self.resume = resume
+        self.api_url = api_url
+        self.db_url = db_url
+        self.shards = shards
+        self.shard_index = shard_index
+        self.workers = workers
+        self.resources = list(resources or RESOURCES)
+        self.transform_workers = transform_workers
+        self.arrow = arrow
+        self.core_load = core_load
+        self.load_batch_size = load_batch_size
+        # On-disk natural key indexes of the dimensions, kept between runs
+        self.key_index_dir = key_index_dir
+        # Maintain the play count aggregates from the loaded listen events
+        self.aggregates = aggregates
+        # Export stage: user x track CSR matrix of the listen history, appended with the new days
+        self.export_matrix_dir = export_matrix_dir
+        self.export_format = export_format
+        # Item-item similarities computed from the exported matrix: metric, top-K, block memory
+        self.similarity = similarity
+        self.similarity_top_k = similarity_top_k
+        self.similarity_memory_mb = similarity_memory_mb
+        # Data quality checks between transform and load, rejected rows written to reject_dir
+        self.validate = validate
+        self.reject_dir = reject_dir
+        self.validator = None
+        # Park the listen events of users or tracks not loaded yet, replayed at the start of the next runs
+        self.park_orphans = park_orphans
+        # Pool settings overriding the DB_POOL_* environment variables when set
+        self.db_pool_size = db_pool_size
+        self.db_max_overflow = db_max_overflow
+        self.db_pool_pre_ping = db_pool_pre_ping
+        # Keep the extractor, transformer, loader and database engine across runs (daemon mode)
+        self.keep_warm = keep_warm
+        self._warm = {}
+        # Extractor of the current run, whose pages are cached once loaded
+        self._extractor = None
+        if shards > 1 or workers > 1:
+            if bulk_export:
+                raise ValueError("Sharding splits the paginated source, it cannot be used with the bulk export")
+            # Shards are made of page ranges, processed page by page
+            self.streaming = True
+        if arrow and self.streaming:
+            raise ValueError("Arrow tables are exchanged between the phases of a batch run, not in streaming mode")
+        if core_load and (shards > 1 or workers > 1 or checkpoint_file or resume):
+            raise ValueError("The Core load path commits once, it cannot be used with checkpoints or shards")
+        if key_index_dir and not (core_load or arrow or transform_workers > 1):
+            raise ValueError("The key index is used by the Core load path, it needs --core-load, --arrow or --transform-workers")
+        if aggregates and into_csv:
+            raise ValueError("The aggregates are maintained in the database, not in CSV files")
+        if export_matrix_dir and into_csv:
+            raise ValueError("The interaction matrix is exported from the database, not from CSV files")
+        if park_orphans and into_csv:
+            raise ValueError("Orphan listen events are parked in the database, not in CSV files")
+        if similarity and not export_matrix_dir:
+            raise ValueError("Similarities are computed from the exported matrix, they need --export-matrix-dir")
+        # Profiles are written next to the run report
+        if self.profile and not self.metrics_dir:
+            self.metrics_dir = "reports"
+        self.metrics = PipelineMetrics()
+        self.profiler = None
         self.logger = logging.getLogger(__name__)
         
     def run(self):
         """Execute the ETL pipeline"""
+        if self.workers > 1:
+            return self._run_workers()
+        
+        run_id = None
+        if self.shards > 1:
+            run_id = f"{datetime.now():%Y%m%d_%H%M%S}_shard{self.shard_index}of{self.shards}"
+        self.metrics = PipelineMetrics(run_id=run_id)
+        self.profiler = None
+        if self.profile:
+            self.profiler = StageProfiler.from_mode(
+                self.profile,
+                self.metrics_dir,
+                self.metrics.run_id,
+                sampling=self.profile_sampling,
+                interval=self.profile_interval
+            )
+            self.profiler.start()
+        self.validator = self._create_validator() if self.validate else None
+        
+        success = False
+        try:
+            if self.streaming:
+                success = self._run_streaming()
+            elif self.arrow:
+                success = self._run_arrow()
+            else:
+                success = self._run_batch()
+            if success and self._extractor is not None:
+                self._extractor.acknowledge_all()
+            # The shards of a sharded run leave these steps to the run of every shard (`finalize`)
+            if success and self.shards == 1:
+                success = self._finalize(refresh_aggregates=False)
+            return success
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
+            if self.validator is not None:
+                self.validator.write_rejects(self.reject_dir, self.metrics.run_id)
+            self.metrics.finish(success)
+            self._export_metrics()
+            self.metrics.release_engines()
+    
+    def _profile(self, stage: str, cpu: bool = True, memory: bool = True):
+        """Profile a stage when profiling is enabled"""
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.stage(stage, cpu=cpu, memory=memory)
+    
+    def _run_batch(self):
+        """Execute the ETL pipeline one phase after the other"""
+        if self.checkpoint_file or self.resume:
+            self.logger.warning("Checkpoints are only kept in streaming mode, ignoring them")
         try:
             # Extract
             self.logger.info("Starting extraction phase...")
             tracks_dtos, users_dtos, listen_histories_dtos = self._extract()
             self.logger.info("Extraction completed successfully")
             
+            if self.transform_workers > 1:
+                return self._run_batch_tables(tracks_dtos, users_dtos, listen_histories_dtos)
+            
             # Transform
             self.logger.info("Starting transformation phase...")
             tracks, users, listen_history, genres = self._transform(
@@ -30,6 +225,10 @@ class ETLPipeline:
             )
             self.logger.info("Transformation completed successfully")
             
+            # Validate
+            if self.validator is not None:
+                tracks, users, listen_history, genres = self._validate(tracks, users, listen_history, genres)
+            
             # Load
             self.logger.info("Starting loading phase...")
             success = self._load(tracks, users, listen_history, genres)
@@ -45,43 +244,572 @@ class ETLPipeline:
             self.logger.error(f"Pipeline failed: {str(e)}")
             raise
     
+    def _run_arrow(self):
+        """Execute the ETL pipeline one phase after the other, exchanging Arrow tables"""
+        if self.checkpoint_file or self.resume:
+            self.logger.warning("Checkpoints are only kept in streaming mode, ignoring them")
+        if not self.into_csv and not self._check_database():
+            return False
+        
+        with self.metrics.stage('extract') as stage, self._profile('extract'):
+            extractor = self._create_extractor()
+            sources = extractor.get_all_tables(size=self.page_size, bulk_export=self.bulk_export)
+            stage.add_rows(sum(table.num_rows for table in sources.values()))
+        self.logger.info("Extraction completed successfully")
+        
+        with self.metrics.stage('transform') as stage, self._profile('transform'):
+            tables = self._create_transformer().transform_tables(**sources)
+            stage.add_rows(sum(table.num_rows for table in tables.values()))
+        self.logger.info("Transformation completed successfully")
+        
+        return self._load_tables(tables)
+    
+    def _run_batch_tables(self, tracks_dtos, users_dtos, listen_histories_dtos) -> bool:
+        """Transform the extracted DTOs in worker processes, then load their Arrow tables"""
+        if not self.into_csv and not self._check_database():
+            return False
+        
+        self.logger.info("Starting transformation phase...")
+        with self.metrics.stage('transform') as stage, self._profile('transform'):
+            transformer = self._create_transformer(workers=self.transform_workers)
+            try:
+                tables = transformer.transform_dtos(tracks_dtos, users_dtos, listen_histories_dtos)
+            finally:
+                # A kept transformer keeps its worker processes for the next runs
+                if not self.keep_warm:
+                    transformer.close()
+            stage.add_rows(sum(table.num_rows for table in tables.values()))
+        self.logger.info("Transformation completed successfully")
+        
+        return self._load_tables(tables)
+    
+    def _load_tables(self, tables) -> bool:
+        """Validate then load the Arrow tables of a batch run, without building any model"""
+        if self.validator is not None:
+            with self.metrics.stage('validate') as stage, self._profile('validate'):
+                stage.add_rows(sum(tables[name].num_rows for name in ('tracks', 'users', 'listen_history')))
+                tables = self.validator.validate_tables(tables)
+        
+        with self.metrics.stage('load') as stage, self._profile('load'):
+            loader = self._create_loader(self.csv_folder)
+            success = loader.load_tables(tables)
+            stage.add_rows(sum(table.num_rows for table in tables.values()))
+        
+        if success:
+            self.logger.info("Pipeline completed successfully!")
+        return success
+    
+    def _run_streaming(self):
+        """Execute the ETL pipeline with extract, transform and load running concurrently"""
+        try:
+            if not self.into_csv and not self._check_database():
+                return False
+            
+            extractor = self._create_extractor()
+            transformer = self._create_transformer()
+            # Shards write CSV files named alike, each in its own folder
+            csv_folder = self.csv_folder
+            if self.shards > 1:
+                csv_folder = os.path.join(self.csv_folder, f"shard_{self.shard_index}")
+            loader = self._create_loader(csv_folder)
+            checkpoint = self._open_checkpoint()
+            
+            def transform(chunk):
+                with self.metrics.stage('transform') as stage, self._profile('transform', memory=False):
+                    chunks = transformer.transform_chunk(chunk[0], chunk[2])
+                    stage.add_rows(sum(len(records) for _, records in chunks))
+                if self.validator is not None:
+                    with self.metrics.stage('validate') as stage, self._profile('validate', memory=False):
+                        stage.add_rows(sum(len(records) for _, records in chunks))
+                        chunks = self.validator.validate_chunk(chunks)
+                # Keep the source page of the records, the unit of the load checkpoints
+                return [(resource, records, chunk[1]) for resource, records in chunks]
+            
+            self.logger.info(f"Starting streaming pipeline (queue size: {self.queue_size})...")
+            def sink(chunks):
+                with self._profile('load', memory=False):
+                    return loader.load_stream(
+                        chunks,
+                        checkpoint=checkpoint,
+                        concurrent=self.shards > 1,
+                        page_loaded=extractor.acknowledge
+                    )
+            
+            # Stages run concurrently, so memory is profiled for the run as a whole
+            def source():
+                if self.bulk_export:
+                    return self._timed_pages(extractor.iter_all_exports(batch_size=self.page_size))
+                pages = self._iter_source_pages(extractor, checkpoint)
+                if checkpoint is not None:
+                    pages = self._checkpointed_pages(pages, checkpoint)
+                return self._timed_pages(pages)
+            
+            runner = StreamingRunner(queue_size=self.queue_size)
+            with self._profile('streaming', cpu=False):
+                success = runner.run(
+                    source=source,
+                    transform=transform,
+                    sink=sink
+                )
+            
+            if success:
+                if checkpoint is not None:
+                    checkpoint.remove()
+                self.logger.info("Pipeline completed successfully!")
+                return True
+            else:
+                self.logger.error("Pipeline failed during loading phase")
+                return False
+                
+        except Exception as e:
+            self.logger.error(f"Pipeline failed: {str(e)}")
+            raise
+    
+    def _run_workers(self) -> bool:
+        """Run the pipeline as `workers` shards in a local process pool
+        
+        Every phase (tracks and users, then listen history) is run by all the shards
+        before the next one starts, since listen history references every page range.
+        """
+        self.metrics = PipelineMetrics()
+        success = False
+        try:
+            # Spawned workers do not inherit the threads (and locks) of this process
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+                for phase in load_phases(self.resources):
+                    self.logger.info(f"Loading {', '.join(phase)} with {self.workers} workers...")
+                    futures = [
+                        pool.submit(run_shard, self._shard_options(index, phase))
+                        for index in range(self.workers)
+                    ]
+                    results = [future.result() for future in futures]
+                    for _, report in results:
+                        self.metrics.merge_report(report)
+                    if not all(shard_success for shard_success, _ in results):
+                        self.logger.error(f"Pipeline failed while loading {', '.join(phase)}")
+                        return False
+            
+            success = self._finalize(refresh_aggregates=True)
+            if success:
+                self.logger.info("Pipeline completed successfully!")
+            return success
+        finally:
+            self.metrics.finish(success)
+            self._export_metrics()
+    
+    def finalize(self) -> bool:
+        """Complete a sharded run spread over several machines, once every shard committed
+        
+        Concurrent shards do not replay the parked events nor maintain the aggregates,
+        and do not export the listen history nor publish their run: the coordinator of
+        a multi-node run (`--shards N` on every machine) runs this once the last phase
+        completed on all of them, with the same `--park-orphans`, `--aggregates`,
+        `--export-matrix-dir` and `--similarity` options. Local pools (`--workers N`) do it by themselves.
+        """
+        self.metrics = PipelineMetrics()
+        success = False
+        try:
+            if not self._check_database():
+                return False
+            success = self._finalize(refresh_aggregates=True)
+            return success
+        finally:
+            self.metrics.finish(success)
+            self._export_metrics()
+    
+    def _finalize(self, refresh_aggregates: bool) -> bool:
+        """Steps reading every listen event of the run: parked events replay, aggregates, matrix export and publication
+        
+        `refresh_aggregates` is set when the events were loaded by concurrent shards,
+        which leave the aggregates to be refreshed once they all committed.
+        """
+        if self.park_orphans:
+            self._replay_parked(refresh_aggregates=not refresh_aggregates)
+        if refresh_aggregates and self.aggregates:
+            self._refresh_aggregates()
+        if self.export_matrix_dir and not self._run_export():
+            return False
+        if self.aggregates or self.similarity:
+            self._publish()
+        return True
+    
+    def _refresh_aggregates(self) -> None:
+        """Add the listen events loaded by the shards to the aggregate tables"""
+        from src.moovitamix_etl.load.aggregates import refresh_aggregates
+        
+        with self.metrics.stage('load.aggregates') as stage, self._database_config().engine.begin() as conn:
+            stage.add_rows(refresh_aggregates(conn))
+    
+    def _replay_parked(self, refresh_aggregates: bool) -> None:
+        """Load the parked listen events whose user and track arrived since they were parked
+        
+        It runs once every shard committed, so the events can reference the tracks and
+        users loaded by any of them.
+        """
+        with self.metrics.stage('load.parked') as stage:
+            loader = self._create_loader(self.csv_folder)
+            stage.add_rows(loader.replay_parked(refresh_aggregates=refresh_aggregates))
+    
+    def _run_export(self) -> bool:
+        """Append the listen events of the days not exported yet to the interaction matrix"""
+        from src.moovitamix_etl.export.interaction_matrix import InteractionMatrixExporter
+        
+        self.logger.info("Starting export phase...")
+        with self.metrics.stage('export') as stage, self._profile('export'):
+            exporter = InteractionMatrixExporter(self._database_config(), self.export_matrix_dir, fmt=self.export_format)
+            stage.add_rows(exporter.export())
+        if self.similarity:
+            self._run_similarity()
+        return True
+    
+    def _run_similarity(self) -> None:
+        """Replace the top-K similar tracks of every track, from the exported matrix"""
+        from src.moovitamix_etl.export.interaction_matrix import load_matrix
+        from src.moovitamix_etl.export.similarity import SimilarityBuilder
+        
+        with self.metrics.stage('similarity') as stage, self._profile('similarity'):
+            builder = SimilarityBuilder(
+                self._database_config(),
+                metric=self.similarity,
+                top_k=self.similarity_top_k,
+                memory_mb=self.similarity_memory_mb,
+                batch_size=self.load_batch_size
+            )
+            stage.add_rows(builder.build(load_matrix(self.export_matrix_dir)))
+    
+    def _publish(self) -> None:
+        """Tell the serving processes that the aggregates and similarities changed"""
+        from src.moovitamix_etl.load.aggregates import PUBLISHED
+        
+        self._database_config().set_state(PUBLISHED, self.metrics.run_id)
+        self.logger.info(f"Published the aggregates of run {self.metrics.run_id}")
+    
+    def _shard_options(self, index: int, resources: List[str]) -> dict:
+        """Arguments of the pipeline run by one worker"""
+        return dict(
+            into_csv=self.into_csv,
+            csv_folder=self.csv_folder,
+            streaming=True,
+            queue_size=self.queue_size,
+            page_size=self.page_size,
+            metrics_dir=self.metrics_dir,
+            profile=self.profile,
+            profile_sampling=self.profile_sampling,
+            profile_interval=self.profile_interval,
+            http_cache_dir=self.http_cache_dir,
+            http_cache_size_mb=self.http_cache_size_mb,
+            changed_only=self.changed_only,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            max_retries=self.max_retries,
+            concurrency=self.concurrency,
+            checkpoint_file=self.checkpoint_file,
+            resume=self.resume,
+            api_url=self.api_url,
+            db_url=self.db_url,
+            db_pool_size=self.db_pool_size,
+            db_max_overflow=self.db_max_overflow,
+            db_pool_pre_ping=self.db_pool_pre_ping,
+            aggregates=self.aggregates,
+            park_orphans=self.park_orphans,
+            validate=self.validate,
+            reject_dir=self.reject_dir,
+            shards=self.workers,
+            shard_index=index,
+            resources=resources
+        )
+    
+    def _iter_source_pages(self, extractor: Extractor, checkpoint: Optional[Checkpoint]) -> Iterator[Tuple[str, int, list]]:
+        """Pages of the resources of this run, restricted to the page range of the shard"""
+        start_pages = checkpoint.start_pages() if checkpoint else {}
+        if self.shards == 1 and self.resources == list(RESOURCES):
+            yield from extractor.iter_all_resources(
+                size=self.page_size,
+                changed_only=self.changed_only,
+                start_pages=start_pages
+            )
+            return
+
+        for resource in self.resources:
+            first, last = 1, None
+            if self.shards > 1:
+                first, last = shard_range(extractor.page_count(resource, self.page_size), self.shards, self.shard_index)
+                self.logger.info(f"Shard {self.shard_index}/{self.shards}: {resource} pages {first} to {last}")
+            for page, dtos in extractor.iter_pages(
+                resource,
+                size=self.page_size,
+                start_page=max(first, start_pages.get(resource, 1)),
+                end_page=last,
+                changed_only=self.changed_only
+            ):
+                yield resource, page, dtos
+    
+    def _open_checkpoint(self) -> Optional[Checkpoint]:
+        """Checkpoint of the run, carried on from the previous run with --resume"""
+        if not (self.checkpoint_file or self.resume):
+            return None
+        if self.into_csv or self.bulk_export:
+            self.logger.warning("Checkpoints need paginated extraction into the database, ignoring them")
+            return None
+        
+        path = self.checkpoint_file or DEFAULT_CHECKPOINT_FILE
+        if self.shards > 1:
+            root, extension = os.path.splitext(path)
+            path = f"{root}.shard{self.shard_index}of{self.shards}{extension}"
+        if not self.resume:
+            return Checkpoint(path, self.page_size)
+        
+        checkpoint = Checkpoint.load(path, self.page_size)
+        if checkpoint.resources:
+            progress = ", ".join(
+                f"{resource} from page {page}" for resource, page in checkpoint.start_pages().items()
+            )
+            self.logger.info(f"Resuming from {path}: {progress}")
+        else:
+            self.logger.info(f"No checkpoint found at {path}, starting from the first page")
+        return checkpoint
+    
+    def _checkpointed_pages(self, pages: Iterable, checkpoint: Checkpoint) -> Iterator:
+        """Record each page handed over by the extract stage"""
+        for page in pages:
+            checkpoint.mark_extracted(page[0], page[1])
+            yield page
+    
+    def _reuse(self, name: str, create: Callable):
+        """Object created on first use, then kept for the next runs when keeping warm"""
+        if not self.keep_warm:
+            return create()
+        if name not in self._warm:
+            self._warm[name] = create()
+        return self._warm[name]
+    
+    def _create_extractor(self) -> Extractor:
+        """Extractor of the run, kept with its HTTP connection pool when keeping warm"""
+        extractor = self._reuse('extractor', self._new_extractor)
+        # A kept extractor records its requests in the metrics of the current run
+        extractor.metrics = self.metrics
+        # and does not cache the pages of a previous run that failed to load them
+        extractor.discard_unacknowledged()
+        self._extractor = extractor
+        return extractor
+    
+    def _new_extractor(self) -> Extractor:
+        """Extractor reusing the pages cached by previous runs when a cache folder is set"""
+        from src.moovitamix_etl.extract.extractor import Extractor
+        from src.moovitamix_etl.extract.resilience import RetryPolicy
+        from src.moovitamix_etl.extract.response_cache import ResponseCache
+        
+        cache = None
+        if self.http_cache_dir:
+            cache = ResponseCache(self.http_cache_dir, max_bytes=self.http_cache_size_mb * 1024 * 1024)
+        return Extractor(
+            api_url=self.api_url,
+            metrics=self.metrics,
+            cache=cache,
+            timeout=(self.connect_timeout, self.read_timeout),
+            retry=RetryPolicy(max_retries=self.max_retries),
+            max_concurrency=self.concurrency
+        )
+    
+    def _create_transformer(self, workers: int = 1):
+        """Transformer of the run, spread over a process pool with several workers"""
+        if workers > 1:
+            from src.moovitamix_etl.transform.parallel_transformer import ParallelTransformer
+            return self._reuse(f'transformer_{workers}', lambda: ParallelTransformer(workers=workers))
+        from src.moovitamix_etl.transform.data_transformer import DataTransformer
+        return self._reuse('transformer', DataTransformer)
+    
+    def _create_validator(self):
+        """Validator of the run
+        
+        Pages of a streaming run hold a single resource, so references are not checked;
+        nor are they when the loader parks the orphan listen events.
+        """
+        from src.moovitamix_etl.transform.data_validator import DataValidator
+        
+        validator = DataValidator(check_references=not (self.streaming or self.park_orphans))
+        validator.metrics = self.metrics
+        return validator
+    
+    def _create_loader(self, csv_folder: str):
+        """Loader writing to the destination of the run"""
+        from src.moovitamix_etl.load.data_loader import DataLoader
+        
+        # A kept loader keeps its id mappings and genre ids for the next runs
+        loader = self._reuse(f'loader_{csv_folder}', lambda: DataLoader(
+            db_config=self._database_config(),
+            into_csv=self.into_csv,
+            csv_folder=csv_folder,
+            core=self.core_load,
+            batch_size=self.load_batch_size,
+            key_index_dir=self.key_index_dir,
+            aggregates=self.aggregates,
+            park_orphans=self.park_orphans
+        ))
+        loader.metrics = self.metrics
+        return loader
+    
+    def _database_config(self) -> DatabaseConfig:
+        """Database of the run, from the command line options or else the DB_* environment variables"""
+        from src.moovitamix_etl.load.database_config import DatabaseConfig
+        
+        return self._reuse('database', lambda: DatabaseConfig(
+            url=self.db_url,
+            pool_size=self.db_pool_size,
+            max_overflow=self.db_max_overflow,
+            pool_pre_ping=self.db_pool_pre_ping
+        ))
+    
+    def _check_database(self) -> bool:
+        """Verify database connection before loading"""
+        db_config = self._database_config()
+        if not db_config.test_connection():
+            self.logger.error("Failed to connect to database")
+            return False
+        return True
+    
+    def _timed_pages(self, pages: Iterable) -> Iterator:
+        """Account the time spent fetching each page to the extract stage"""
+        pages = iter(pages)
+        while True:
+            with self.metrics.stage('extract') as stage, self._profile('extract', memory=False):
+                try:
+                    page = next(pages)
+                except StopIteration:
+                    return
+                stage.add_rows(len(page[2]))
+            yield page
+    
+    def _export_metrics(self):
+        """Write the run report and Prometheus metrics; never fails the run"""
+        try:
+            if self.metrics_dir:
+                self.metrics.write_json(self.metrics_dir)
+                self.metrics.write_prometheus(self.metrics_dir)
+            if self.pushgateway_url:
+                self.metrics.push(self.pushgateway_url)
+        except Exception as e:
+            self.logger.warning(f"Failed to export metrics: {str(e)}")
+    
     def _extract(self):
         """Extract data from sources"""
-        extractor = Extractor()
-        return extractor.get_all_resources()
+        with self.metrics.stage('extract') as stage, self._profile('extract'):
+            extractor = self._create_extractor()
+            if self.bulk_export:
+                resources = extractor.get_all_exports()
+            else:
+                resources = extractor.get_all_resources()
+            stage.add_rows(sum(len(dtos) for dtos in resources))
+        return resources
     
     def _transform(self, tracks_dtos, users_dtos, listen_histories_dtos):
         """Transform extracted data"""
-        transformer = DataTransformer()
-        return transformer.transform_all(
-            tracks_dtos,
-            users_dtos,
-            listen_histories_dtos
-        )
+        with self.metrics.stage('transform') as stage, self._profile('transform'):
+            transformer = self._create_transformer()
+            tracks, users, listen_history, genres = transformer.transform_all(
+                tracks_dtos,
+                users_dtos,
+                listen_histories_dtos
+            )
+            stage.add_rows(len(tracks) + len(users) + len(listen_history) + len(genres))
+        return tracks, users, listen_history, genres
+    
+    def _validate(self, tracks, users, listen_history, genres):
+        """Drop the transformed rows failing the data quality checks"""
+        with self.metrics.stage('validate') as stage, self._profile('validate'):
+            stage.add_rows(len(tracks) + len(users) + len(listen_history))
+            return self.validator.validate_all(tracks, users, listen_history, genres)
     
     def _load(self, tracks, users, listen_history, genres):
         """Load transformed data"""
-        if not self.into_csv:
-            # Verify database connection before loading
-            db_config = DatabaseConfig()
-            if not db_config.test_connection():
-                self.logger.error("Failed to connect to database")
-                return False
-        
-        # Initialize loader with specified destination
-        loader = DataLoader(
-            into_csv=self.into_csv,
-            csv_folder=self.csv_folder
-        )
+        if not self.into_csv and not self._check_database():
+            return False
         
-        # Load the data
-        return loader.load_all(tracks, users, listen_history, genres)
+        with self.metrics.stage('load') as stage, self._profile('load'):
+            # Initialize loader with specified destination
+            loader = self._create_loader(self.csv_folder)
+            
+            # Load the data
+            success = loader.load_all(tracks, users, listen_history, genres)
+            stage.add_rows(len(tracks) + len(users) + len(listen_history) + len(genres))
+        return success
+
+def run_shard(options: dict) -> Tuple[bool, dict]:
+    """Run one shard of the pipeline in a worker process, return its success and run report"""
+    pipeline = ETLPipeline(**options)
+    success = pipeline.run()
+    return success, pipeline.metrics.to_dict()
+
+def serve(pipeline: ETLPipeline, args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    """Run the pipeline on the schedule of the command line until SIGINT or SIGTERM"""
+    import signal
+    from src.moovitamix_etl.daemon import EtlDaemon
+    from src.moovitamix_etl.scheduler import CronSchedule, IntervalSchedule
+    
+    if (args.interval is None) == (args.cron is None):
+        parser.error('serve needs either --interval or --cron')
+    schedule = IntervalSchedule(args.interval) if args.interval is not None else CronSchedule(args.cron)
+    daemon = EtlDaemon(
+        pipeline,
+        schedule,
+        host=args.health_host,
+        port=args.health_port,
+        run_on_start=args.run_on_start
+    )
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: daemon.stop())
+    daemon.serve()
 
 def main():
     """Main entry point with argument parsing"""
     # Set up argument parser
     parser = argparse.ArgumentParser(description='MoovitaMix ETL Pipeline')
     
+    parser.add_argument(
+        'command',
+        nargs='?',
+        choices=['run', 'serve', 'finalize'],
+        default='run',
+        help='run the pipeline once (default), serve: run it on a schedule, keeping connections and caches warm, '
+             'or finalize: replay the parked events, refresh the aggregates, export and publish '
+             'once every shard of a multi-node run committed'
+    )
+    
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=None,
+        help='With serve, seconds between the starts of two runs'
+    )
+    
+    parser.add_argument(
+        '--cron',
+        type=str,
+        default=None,
+        help='With serve, five field cron expression of the run times, e.g. "0 2 * * *"'
+    )
+    
+    parser.add_argument(
+        '--run-on-start',
+        action='store_true',
+        help='With serve, run once when starting, then follow the schedule'
+    )
+    
+    parser.add_argument(
+        '--health-host',
+        type=str,
+        default='127.0.0.1',
+        help='With serve, address of the /health and /metrics endpoint (default: 127.0.0.1)'
+    )
+    
+    parser.add_argument(
+        '--health-port',
+        type=int,
+        default=8001,
+        help='With serve, port of the /health and /metrics endpoint (default: 8001)'
+    )
+    
     parser.add_argument(
         '--into-csv',
         action='store_true',
@@ -95,6 +823,286 @@ def main():
         help='Folder to store CSV files (default: csv_data)'
     )
     
+    parser.add_argument(
+        '--api-url',
+        type=str,
+        default='http://127.0.0.1:8000',
+        help='Base URL of the MooVitamix API (default: http://127.0.0.1:8000)'
+    )
+    
+    parser.add_argument(
+        '--db-url',
+        type=str,
+        default=None,
+        help='SQLAlchemy URL of the database, overriding the DB_* environment variables'
+    )
+    
+    parser.add_argument(
+        '--db-pool-size',
+        type=int,
+        default=None,
+        help='Connections kept in the database pool (default: DB_POOL_SIZE or 5)'
+    )
+    
+    parser.add_argument(
+        '--db-max-overflow',
+        type=int,
+        default=None,
+        help='Connections opened beyond the pool size under load (default: DB_MAX_OVERFLOW or 10)'
+    )
+    
+    parser.add_argument(
+        '--db-pool-pre-ping',
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help='Check pooled connections before use (default: DB_POOL_PRE_PING or enabled)'
+    )
+    
+    parser.add_argument(
+        '--streaming',
+        action='store_true',
+        help='Run extract, transform and load concurrently, page by page'
+    )
+    
+    parser.add_argument(
+        '--queue-size',
+        type=int,
+        default=4,
+        help='Max number of pages buffered between two streaming stages (default: 4)'
+    )
+    
+    parser.add_argument(
+        '--page-size',
+        type=int,
+        default=100,
+        help='Number of documents requested per page, or per batch with --bulk-export, in streaming mode (default: 100)'
+    )
+    
+    parser.add_argument(
+        '--bulk-export',
+        action='store_true',
+        help='Extract each resource from its streamed NDJSON export endpoint instead of paginated requests'
+    )
+    
+    parser.add_argument(
+        '--shards',
+        type=int,
+        default=1,
+        help='Split the paginated source into this many page ranges, e.g. one per machine (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--shard-index',
+        type=int,
+        default=0,
+        help='Page range processed by this run, from 0 to --shards - 1 (default: 0)'
+    )
+    
+    parser.add_argument(
+        '--resources',
+        nargs='+',
+        choices=list(RESOURCES),
+        default=None,
+        help='Resources to process (default: all). With --shards, load tracks and users on every shard before listen_history'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Run the pipeline as this many shards in a local process pool (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--arrow',
+        action='store_true',
+        help='In batch mode, exchange Arrow tables between extract, transform and load instead of objects per row'
+    )
+    
+    parser.add_argument(
+        '--core-load',
+        action='store_true',
+        help='Load the database through SQLAlchemy Core executemany batches instead of the ORM session'
+    )
+    
+    parser.add_argument(
+        '--load-batch-size',
+        type=int,
+        default=10000,
+        help='Rows per executemany batch with --core-load or --arrow (default: 10000)'
+    )
+    
+    parser.add_argument(
+        '--key-index-dir',
+        help='Keep memory-mapped natural key -> id indexes of the dimensions in this directory between runs, '
+             'rebuilt when the database is recreated (with --core-load or --arrow)'
+    )
+    
+    parser.add_argument(
+        '--aggregates',
+        action='store_true',
+        help='Upsert the new listen events into the user_track_plays, user_genre_plays and '
+             'daily_track_plays tables within the transaction loading them'
+    )
+    
+    parser.add_argument(
+        '--export-matrix-dir',
+        help='After loading, append the complete days not exported yet to a CSR user x track play count '
+             'matrix in this directory'
+    )
+    
+    parser.add_argument(
+        '--export-format',
+        choices=['npy', 'npz'],
+        default='npy',
+        help='Matrix files: raw memory-mappable .npy arrays or a single .npz archive (default: npy)'
+    )
+    
+    parser.add_argument(
+        '--similarity',
+        choices=['cosine', 'jaccard'],
+        help='After the export, write the most similar tracks of each track to the track_similarity table'
+    )
+    
+    parser.add_argument(
+        '--similarity-top-k',
+        type=int,
+        default=20,
+        help='Similar tracks kept per track with --similarity (default: 20)'
+    )
+    
+    parser.add_argument(
+        '--similarity-memory-mb',
+        type=float,
+        default=256,
+        help='Working memory of each block of tracks with --similarity (default: 256)'
+    )
+    
+    parser.add_argument(
+        '--validate',
+        action='store_true',
+        help='Check emails, MM:SS durations, timestamps and, in batch mode, the references of the listen events '
+             'before loading; rejected rows are written to --reject-dir with their reason codes'
+    )
+    
+    parser.add_argument(
+        '--reject-dir',
+        type=str,
+        default='rejects',
+        help='Folder of the reject files written with --validate (default: rejects)'
+    )
+    
+    parser.add_argument(
+        '--park-orphans',
+        action='store_true',
+        help='Keep the listen events whose user or track is missing in the parked_listen_events table, '
+             'and load them once their user and track arrived, after the load of a later run'
+    )
+    
+    parser.add_argument(
+        '--transform-workers',
+        type=int,
+        default=1,
+        help='Transform the extracted data in this many processes and load it as Arrow tables, in batch mode (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--http-cache-dir',
+        type=str,
+        default=None,
+        help='Folder caching the API pages; unchanged pages are revalidated with If-None-Match and cost a 304'
+    )
+    
+    parser.add_argument(
+        '--http-cache-size-mb',
+        type=int,
+        default=256,
+        help='Size cap of the HTTP cache, least recently used pages are evicted beyond it (default: 256)'
+    )
+    
+    parser.add_argument(
+        '--changed-only',
+        action='store_true',
+        help='In streaming mode, skip the pages not modified since the previous run (requires --http-cache-dir)'
+    )
+    
+    parser.add_argument(
+        '--connect-timeout',
+        type=float,
+        default=3.05,
+        help='Seconds to wait for a connection to the API (default: 3.05)'
+    )
+    
+    parser.add_argument(
+        '--read-timeout',
+        type=float,
+        default=30.0,
+        help='Seconds to wait for the API to answer (default: 30)'
+    )
+    
+    parser.add_argument(
+        '--max-retries',
+        type=int,
+        default=5,
+        help='Retries of a request failing with a timeout, 429 or 5xx, with jittered exponential backoff (default: 5)'
+    )
+    
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=1,
+        help='Max pages requested in parallel in streaming mode; lowered automatically when the API slows down (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--checkpoint-file',
+        type=str,
+        default=None,
+        help='In streaming mode, commit each page on its own and record the progress in this file '
+             f'(default with --resume: {DEFAULT_CHECKPOINT_FILE})'
+    )
+    
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Continue a failed streaming run after the last page it committed'
+    )
+    
+    parser.add_argument(
+        '--metrics-dir',
+        type=str,
+        default=None,
+        help='Folder to write the JSON run report and the Prometheus textfile metrics to'
+    )
+    
+    parser.add_argument(
+        '--pushgateway-url',
+        type=str,
+        default=None,
+        help='Prometheus Pushgateway to push the run metrics to'
+    )
+    
+    parser.add_argument(
+        '--profile',
+        type=str,
+        choices=PROFILE_MODES,
+        default=None,
+        help='Capture CPU (cProfile) and/or memory (tracemalloc) profiles per stage, written next to the run report'
+    )
+    
+    parser.add_argument(
+        '--profile-sampling',
+        action='store_true',
+        help='Sample the stacks instead of running cProfile for CPU profiles; memory profiles always trace every allocation'
+    )
+    
+    parser.add_argument(
+        '--profile-interval',
+        type=float,
+        default=0.01,
+        help='Seconds between two CPU samples in sampling mode (default: 0.01)'
+    )
+    
     parser.add_argument(
         '--log-level',
         type=str,
@@ -115,11 +1123,64 @@ def main():
     # Create and run pipeline
     pipeline = ETLPipeline(
         into_csv=args.into_csv,
-        csv_folder=args.csv_folder
+        csv_folder=args.csv_folder,
+        streaming=args.streaming,
+        queue_size=args.queue_size,
+        page_size=args.page_size,
+        bulk_export=args.bulk_export,
+        metrics_dir=args.metrics_dir,
+        pushgateway_url=args.pushgateway_url,
+        profile=args.profile,
+        profile_sampling=args.profile_sampling,
+        profile_interval=args.profile_interval,
+        http_cache_dir=args.http_cache_dir,
+        http_cache_size_mb=args.http_cache_size_mb,
+        changed_only=args.changed_only,
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+        max_retries=args.max_retries,
+        concurrency=args.concurrency,
+        checkpoint_file=args.checkpoint_file,
+        resume=args.resume,
+        api_url=args.api_url,
+        db_url=args.db_url,
+        db_pool_size=args.db_pool_size,
+        db_max_overflow=args.db_max_overflow,
+        db_pool_pre_ping=args.db_pool_pre_ping,
+        shards=args.shards,
+        shard_index=args.shard_index,
+        workers=args.workers,
+        transform_workers=args.transform_workers,
+        arrow=args.arrow,
+        core_load=args.core_load,
+        load_batch_size=args.load_batch_size,
+        key_index_dir=args.key_index_dir,
+        aggregates=args.aggregates,
+        export_matrix_dir=args.export_matrix_dir,
+        export_format=args.export_format,
+        similarity=args.similarity,
+        similarity_top_k=args.similarity_top_k,
+        similarity_memory_mb=args.similarity_memory_mb,
+        validate=args.validate,
+        reject_dir=args.reject_dir,
+        park_orphans=args.park_orphans,
+        resources=args.resources,
+        keep_warm=args.command == 'serve'
     )
     
+    if args.command == 'serve':
+        serve(pipeline, args, parser)
+        return
+    if args.command == 'run' and args.shards > 1 and (
+        args.aggregates or args.export_matrix_dir or args.similarity or args.park_orphans
+    ):
+        logging.warning(
+            "Shards do not replay the parked events, refresh the aggregates nor export the interaction matrix: "
+            "run the finalize command once every shard committed"
+        )
+    
     try:
-        success = pipeline.run()
+        success = pipeline.finalize() if args.command == 'finalize' else pipeline.run()
         exit(0 if success else 1)
     except Exception as e:
         logging.error(f"Pipeline failed with error: {str(e)}")
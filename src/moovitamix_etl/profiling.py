@@ -0,0 +1,226 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Generator, List, Optional
+
+PROFILE_MODES = ('cpu', 'memory', 'both')
+
+# Frames of the profiling machinery itself, hidden from the memory reports
+_TRACEMALLOC_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+
+class StackSampler:
+    """Sample the stacks of the threads running a profiled stage at a fixed interval.
+
+    Much cheaper than cProfile since nothing is traced between two samples, which
+    makes it suitable for production runs. Stacks are kept in the collapsed format
+    understood by flamegraph.pl and speedscope.
+
+    Args:
+        interval (float, optional): seconds between two samples. Defaults to 0.01.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.stacks: Dict[str, Counter] = {}
+        self._threads: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._run, name="etl-profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    @contextmanager
+    def track(self, stage: str) -> Generator[None, None, None]:
+        """Sample the current thread on behalf of a stage"""
+        ident = threading.get_ident()
+        previous = self._threads.get(ident)
+        self._threads[ident] = stage
+        try:
+            yield
+        finally:
+            if previous is None:
+                self._threads.pop(ident, None)
+            else:
+                self._threads[ident] = previous
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, stage in list(self._threads.items()):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    self.stacks.setdefault(stage, Counter())[";".join(reversed(stack))] += 1
+
+
+class StageProfiler:
+    """Capture CPU and memory profiles for each stage of a pipeline run.
+
+    CPU mode records a cProfile per stage, or stack samples when `sampling` is set.
+    Memory mode records with tracemalloc the peak traced memory, the top allocators
+    and a snapshot at the end of each stage. `sampling` only applies to CPU profiles:
+    memory profiles trace every allocation, with the overhead that implies.
+
+    Args:
+        output_dir (str): folder the profiles are written to, next to the run report.
+        run_id (str): identifier of the run, used in the file names.
+        cpu (bool, optional): capture CPU profiles. Defaults to False.
+        memory (bool, optional): capture memory profiles. Defaults to False.
+        sampling (bool, optional): sample the stacks instead of running cProfile. Defaults to False.
+        interval (float, optional): seconds between two CPU samples. Defaults to 0.01.
+        top (int, optional): number of entries kept in the text summaries. Defaults to 25.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        run_id: str,
+        cpu: bool = False,
+        memory: bool = False,
+        sampling: bool = False,
+        interval: float = 0.01,
+        top: int = 25
+    ):
+        self.output_dir = output_dir
+        self.run_id = run_id
+        self.cpu = cpu
+        self.memory = memory
+        self.sampling = sampling
+        self.top = top
+        self.sampler = StackSampler(interval) if cpu and sampling else None
+        self.files: List[str] = []
+        self.logger = logging.getLogger(__name__)
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+
+    @classmethod
+    def from_mode(cls, mode: str, output_dir: str, run_id: str, **kwargs) -> "StageProfiler":
+        """Build a profiler from a --profile option value: cpu, memory or both"""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        return cls(
+            output_dir,
+            run_id,
+            cpu=mode in ('cpu', 'both'),
+            memory=mode in ('memory', 'both'),
+            **kwargs
+        )
+
+    def start(self) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self._started_tracemalloc = True
+        if self.sampler is not None:
+            self.sampler.start()
+
+    def stop(self) -> List[str]:
+        """Stop profiling, write the CPU profiles and return every written file"""
+        if self.sampler is not None:
+            self.sampler.stop()
+            for stage, stacks in self.sampler.stacks.items():
+                self._write_folded(stage, stacks)
+        for stage, profile in self._profiles.items():
+            self._write_pstats(stage, profile)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        for filepath in self.files:
+            self.logger.info(f"Profile written to {filepath}")
+        return self.files
+
+    @contextmanager
+    def stage(self, name: str, cpu: bool = True, memory: bool = True) -> Generator[None, None, None]:
+        """Profile a stage; CPU profiles of a stage entered several times are merged
+
+        Memory profiles are process wide, so pass `memory=False` for stages running
+        concurrently with others and profile their enclosing block instead.
+        """
+        with self._cpu(name) if cpu and self.cpu else nullcontext(), \
+                self._memory(name) if memory and self.memory else nullcontext():
+            yield
+
+    @contextmanager
+    def _cpu(self, name: str) -> Generator[None, None, None]:
+        if self.sampler is not None:
+            with self.sampler.track(name):
+                yield
+            return
+
+        with self._lock:
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+        try:
+            profile.enable()
+        except ValueError as e:
+            # Python 3.12+ allows only one active cProfile at a time
+            self.logger.warning(f"Cannot profile stage '{name}': {str(e)}")
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    @contextmanager
+    def _memory(self, name: str) -> Generator[None, None, None]:
+        start = tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_FILTERS)
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            end = tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_FILTERS)
+            self._write_memory(name, start, end, current, peak)
+
+    def _path(self, kind: str, stage: str, extension: str) -> str:
+        filepath = os.path.join(self.output_dir, f"{kind}_{self.run_id}_{stage}.{extension}")
+        if filepath not in self.files:
+            self.files.append(filepath)
+        return filepath
+
+    def _write_pstats(self, stage: str, profile: cProfile.Profile) -> None:
+        profile.dump_stats(self._path("cpu", stage, "pstats"))
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(self.top)
+        with open(self._path("cpu", stage, "txt"), "w") as f:
+            f.write(summary.getvalue())
+
+    def _write_folded(self, stage: str, stacks: Counter) -> None:
+        with open(self._path("cpu", stage, "folded"), "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def _write_memory(self, stage: str, start, end, current: int, peak: int) -> None:
+        end.dump(self._path("memory", stage, "tracemalloc"))
+        with open(self._path("memory", stage, "txt"), "w") as f:
+            f.write(f"Stage: {stage}\n")
+            f.write(f"Peak traced memory: {peak / 1024 / 1024:.2f} MiB\n")
+            f.write(f"Traced memory at end: {current / 1024 / 1024:.2f} MiB\n\n")
+            f.write(f"Top {self.top} allocators (growth during the stage):\n")
+            for stat in end.compare_to(start, "lineno")[:self.top]:
+                f.write(f"{stat}\n")
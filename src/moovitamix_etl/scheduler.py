@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+from typing import Set, Tuple
+
+# (name, lowest, highest) of the five fields of a cron expression
+CRON_FIELDS = (
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day of month', 1, 31),
+    ('month', 1, 12),
+    ('day of week', 0, 7),
+)
+
+
+class IntervalSchedule:
+    """Run every `seconds` seconds"""
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("The interval must be positive")
+        self.seconds = seconds
+
+    def next_after(self, moment: datetime) -> datetime:
+        return moment + timedelta(seconds=self.seconds)
+
+    def __repr__(self):
+        return f"<IntervalSchedule every {self.seconds}s>"
+
+
+class CronSchedule:
+    """Run at the minutes matching a standard five field cron expression
+
+    Fields accept `*`, numbers, ranges `a-b`, lists `a,b` and steps `*/n` or `a-b/n`;
+    day of week 0 and 7 are Sunday. As in cron, when both the day of month and the
+    day of week are restricted, a day matching either of them is a match.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"A cron expression has 5 fields, got {len(fields)}: {expression!r}")
+        self.expression = expression
+        parsed = [
+            self._parse_field(field, name, low, high)
+            for field, (name, low, high) in zip(fields, CRON_FIELDS)
+        ]
+        self.minutes, self.hours, self.days, self.months, weekdays = (values for values, _ in parsed)
+        self.weekdays = {weekday % 7 for weekday in weekdays}
+        self._any_day = parsed[2][1]
+        self._any_weekday = parsed[4][1]
+
+    @staticmethod
+    def _parse_field(field: str, name: str, low: int, high: int) -> Tuple[Set[int], bool]:
+        """Values matched by a field, and whether it is a plain `*`"""
+        values = set()
+        for part in field.split(','):
+            value_range, _, step = part.partition('/')
+            if value_range == '*':
+                first, last = low, high
+            elif '-' in value_range:
+                first, last = (int(bound) for bound in value_range.split('-'))
+            else:
+                first = last = int(value_range)
+            if not low <= first <= last <= high:
+                raise ValueError(f"Invalid {name} field: {field!r}")
+            values.update(range(first, last + 1, int(step) if step else 1))
+        return values, field == '*'
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        # Python counts weekdays from Monday = 0, cron from Sunday = 0
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching minute strictly after `moment`"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Skip whole months, days and hours that do not match; a match exists within 5 years
+        limit = candidate + timedelta(days=5 * 366)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"The cron expression {self.expression!r} never matches")
+
+    def __repr__(self):
+        return f"<CronSchedule {self.expression!r}>"
+
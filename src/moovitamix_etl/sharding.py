@@ -0,0 +1,34 @@
+from typing import List, Sequence, Tuple
+
+
+def shard_range(pages: int, shards: int, index: int) -> Tuple[int, int]:
+    """First and last page (inclusive) of a shard of the paginated source
+
+    Pages are split in `shards` contiguous ranges whose sizes differ by one at most.
+    A shard gets an empty range (first > last) when there are fewer pages than shards.
+
+    Args:
+        pages (int): number of pages of the resource.
+        shards (int): number of shards.
+        index (int): index of the shard, from 0 to shards - 1.
+
+    Returns:
+        Tuple[int, int]: the first and last page of the shard
+    """
+    if not 0 <= index < shards:
+        raise ValueError(f"Shard index {index} out of range for {shards} shards")
+    per_shard, extra = divmod(pages, shards)
+    first = index * per_shard + min(index, extra) + 1
+    last = first + per_shard - (0 if index < extra else 1)
+    return first, last
+
+
+def load_phases(resources: Sequence[str]) -> List[List[str]]:
+    """Group resources into phases that every shard must finish before the next one starts
+
+    Listen history references tracks and users from every page range, so it can only
+    be loaded once all the shards have loaded them.
+    """
+    dimensions = [resource for resource in resources if resource != 'listen_history']
+    facts = [resource for resource in resources if resource == 'listen_history']
+    return [phase for phase in (dimensions, facts) if phase]
@@ -0,0 +1,146 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+# Marker put on a queue by a stage once it has produced its last item
+_DONE = object()
+
+
+class PipelineAborted(Exception):
+    """Raised inside a stage when another stage of the pipeline has failed"""
+
+
+class BoundedQueue:
+    """Fixed capacity queue linking two stages.
+
+    A full queue blocks the upstream stage (backpressure). Blocking calls wake up
+    regularly so that a stage waiting on its neighbour gives up as soon as the
+    pipeline is aborted, instead of hanging forever.
+    """
+
+    def __init__(self, maxsize: int, abort: threading.Event, poll_interval: float = 0.1):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.abort = abort
+        self.poll_interval = poll_interval
+
+    def put(self, item: Any) -> None:
+        """Put an item, waiting while the queue is full"""
+        while True:
+            if self.abort.is_set():
+                raise PipelineAborted("aborted after a failure in another stage")
+            try:
+                self._queue.put(item, timeout=self.poll_interval)
+                return
+            except queue.Full:
+                continue
+
+    def close(self) -> None:
+        """Signal the downstream stage that no more items will come"""
+        self.put(_DONE)
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            if self.abort.is_set():
+                raise PipelineAborted("aborted after a failure in another stage")
+            try:
+                item = self._queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+
+class StreamingRunner:
+    """Run extract, transform and load as concurrent stages linked by bounded queues.
+
+    The extract and transform stages run in their own threads while the load stage
+    runs in the calling thread, so that database sessions stay on the thread that
+    opened them. The first error raised by any stage aborts the others and is
+    re-raised by `run`.
+
+    Args:
+        queue_size (int, optional): max number of chunks waiting between two stages. Defaults to 4.
+    """
+
+    def __init__(self, queue_size: int = 4):
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        self.queue_size = queue_size
+        self.logger = logging.getLogger(__name__)
+        self._abort = threading.Event()
+        self._errors: List[BaseException] = []
+        self._errors_lock = threading.Lock()
+
+    def _fail(self, error: BaseException) -> None:
+        """Record the first real error and abort every stage"""
+        if not isinstance(error, PipelineAborted):
+            with self._errors_lock:
+                self._errors.append(error)
+        self._abort.set()
+
+    def _start_stage(self, name: str, target: Callable[[], None]) -> threading.Thread:
+        def body():
+            try:
+                target()
+            except BaseException as e:
+                if not isinstance(e, PipelineAborted):
+                    self.logger.error(f"Stage '{name}' failed: {str(e)}")
+                self._fail(e)
+
+        thread = threading.Thread(target=body, name=f"etl-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def run(
+        self,
+        source: Callable[[], Iterable[Any]],
+        transform: Callable[[Any], Iterable[Any]],
+        sink: Callable[[Iterable[Any]], Any]
+    ) -> Any:
+        """Run the three stages until the source is exhausted
+
+        Args:
+            source (Callable): returns an iterable of extracted chunks.
+            transform (Callable): turns one extracted chunk into zero or more chunks to load.
+            sink (Callable): consumes the iterable of transformed chunks.
+
+        Returns:
+            Any: whatever the sink returned
+        """
+        self._abort.clear()
+        self._errors = []
+        extracted = BoundedQueue(self.queue_size, self._abort)
+        transformed = BoundedQueue(self.queue_size, self._abort)
+
+        def extract_stage():
+            for chunk in source():
+                extracted.put(chunk)
+            extracted.close()
+
+        def transform_stage():
+            for chunk in extracted:
+                for out in transform(chunk):
+                    transformed.put(out)
+            transformed.close()
+
+        threads = [
+            self._start_stage("extract", extract_stage),
+            self._start_stage("transform", transform_stage),
+        ]
+
+        result: Optional[Any] = None
+        try:
+            result = sink(iter(transformed))
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            # Release any stage still blocked on a queue once the sink is done
+            self._abort.set()
+            for thread in threads:
+                thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+        return result
@@ -0,0 +1,208 @@
+"""Arrow representation of the extracted and transformed entities.
+
+Tracks, users and listen events are Arrow tables with one column per attribute.
+Tables travel between processes as Arrow IPC buffers, which are read back without
+parsing nor per-row objects: worker processes turn batches of DTOs into normalized
+tables (`transform_batch`), their genres numbered by the dictionary installed in
+every worker when it starts (`init_worker`).
+
+The same tables are the interchange format of the Arrow pipeline: the extractor
+builds source tables straight from the API documents, `transform_tables` derives
+the normalized tables (entities, genres, junction edges) with Arrow compute
+kernels, reusing the source columns, and the loader writes them as they are.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+TRACKS_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('name', pa.string()),
+    ('artist', pa.string()),
+    ('songwriters', pa.string()),
+    ('duration', pa.string()),
+    ('album', pa.string()),
+    ('created_at', pa.timestamp('us')),
+    ('updated_at', pa.timestamp('us')),
+])
+
+USERS_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('first_name', pa.string()),
+    ('last_name', pa.string()),
+    ('email', pa.string()),
+    ('gender', pa.string()),
+    ('created_at', pa.timestamp('us')),
+    ('updated_at', pa.timestamp('us')),
+])
+
+LISTEN_EVENTS_SCHEMA = pa.schema([
+    ('user_id', pa.int64()),
+    ('track_id', pa.int64()),
+    ('listened_at', pa.timestamp('us')),
+])
+
+GENRES_SCHEMA = pa.schema([
+    ('id', pa.int32()),
+    ('name', pa.string()),
+])
+
+TRACK_GENRES_SCHEMA = pa.schema([
+    ('track_id', pa.int64()),
+    ('genre_id', pa.int32()),
+])
+
+USER_FAVORITE_GENRES_SCHEMA = pa.schema([
+    ('user_id', pa.int64()),
+    ('genre_id', pa.int32()),
+])
+
+# Documents of the API, as returned by the paginated and export endpoints
+SOURCE_SCHEMAS = {
+    'tracks': pa.schema([
+        *[TRACKS_SCHEMA.field(name) for name in ('id', 'name', 'artist', 'songwriters', 'duration')],
+        ('genres', pa.string()),
+        *[TRACKS_SCHEMA.field(name) for name in ('album', 'created_at', 'updated_at')],
+    ]),
+    'users': pa.schema([
+        *[USERS_SCHEMA.field(name) for name in ('id', 'first_name', 'last_name', 'email', 'gender')],
+        ('favorite_genres', pa.string()),
+        *[USERS_SCHEMA.field(name) for name in ('created_at', 'updated_at')],
+    ]),
+    'listen_history': pa.schema([
+        ('user_id', pa.int64()),
+        ('items', pa.list_(pa.int64())),
+        ('created_at', pa.timestamp('us')),
+        ('updated_at', pa.timestamp('us')),
+    ]),
+}
+
+# Tables produced by `transform_tables`, in loading order
+TABLES = ('genres', 'tracks', 'track_genres', 'users', 'user_favorite_genres', 'listen_history')
+
+
+def _table(schema: pa.Schema, dtos: Sequence) -> pa.Table:
+    """Table of the attributes of DTOs, one column per field of the schema"""
+    return pa.table({name: [getattr(dto, name) for dto in dtos] for name in schema.names}, schema=schema)
+
+
+def source_table(resource: str, items: List[dict]) -> pa.Table:
+    """Table of API documents, their ISO 8601 timestamps parsed"""
+    schema = SOURCE_SCHEMAS[resource]
+    as_strings = pa.schema([
+        field.with_type(pa.string()) if pa.types.is_timestamp(field.type) else field
+        for field in schema
+    ])
+    return pa.Table.from_pylist(items, schema=as_strings).cast(schema)
+
+
+def _split_genres(owner_ids: pa.ChunkedArray, genres_strings: pa.ChunkedArray) -> Tuple[pa.Array, pa.Array]:
+    """Owner ids and genre names of every comma separated genres string, exploded"""
+    lists = pc.split_pattern(genres_strings.combine_chunks(), ',')
+    names = pc.utf8_trim_whitespace(pc.list_flatten(lists))
+    owners = pc.take(owner_ids.combine_chunks(), pc.list_parent_indices(lists))
+    named = pc.not_equal(names, '')
+    return pc.filter(owners, named), pc.filter(names, named)
+
+
+def unique_edges(edges: pa.Table) -> pa.Table:
+    """Junction table without duplicate pairs, in the order of their first occurrence"""
+    names = edges.schema.names
+    return edges.group_by(names, use_threads=False).aggregate([]).select(names)
+
+
+def _genre_edges(owners: pa.Array, names: pa.Array, genres: pa.Table, schema: pa.Schema) -> pa.Table:
+    """Junction table from owners to the ids of their genres, without duplicate pairs"""
+    genre_ids = pc.take(genres.column('id'), pc.index_in(names, value_set=genres.column('name')))
+    return unique_edges(pa.table([owners, genre_ids], schema=schema))
+
+
+def genres_table(names: Iterable[str]) -> pa.Table:
+    """Genres numbered from 1 in name order"""
+    names = sorted(names)
+    return pa.table([pa.array(range(1, len(names) + 1), pa.int32()), pa.array(names, pa.string())], schema=GENRES_SCHEMA)
+
+
+def _listen_events(listen_history: pa.Table) -> pa.Table:
+    """One row per item of the listen history documents"""
+    items = listen_history.column('items').combine_chunks()
+    parents = pc.list_parent_indices(items)
+    return pa.table([
+        pc.take(listen_history.column('user_id'), parents),
+        pc.list_flatten(items),
+        pc.take(listen_history.column('created_at'), parents),
+    ], schema=LISTEN_EVENTS_SCHEMA)
+
+
+def transform_tables(tracks: pa.Table, users: pa.Table, listen_history: pa.Table) -> Dict[str, pa.Table]:
+    """Normalized tables of the source tables, keyed by the names of `TABLES`
+
+    Genres get ids from 1 in name order, referenced by the junction tables; the
+    loader maps them to the database ids. Entity columns are the source columns,
+    not copied.
+    """
+    track_owners, track_names = _split_genres(tracks.column('id'), tracks.column('genres'))
+    user_owners, user_names = _split_genres(users.column('id'), users.column('favorite_genres'))
+    genres = genres_table(pc.unique(pa.concat_arrays([track_names, user_names])).to_pylist())
+
+    return {
+        'genres': genres,
+        'tracks': tracks.select(TRACKS_SCHEMA.names),
+        'track_genres': _genre_edges(track_owners, track_names, genres, TRACK_GENRES_SCHEMA),
+        'users': users.select(USERS_SCHEMA.names),
+        'user_favorite_genres': _genre_edges(user_owners, user_names, genres, USER_FAVORITE_GENRES_SCHEMA),
+        'listen_history': _listen_events(listen_history),
+    }
+
+
+def to_ipc(table: pa.Table) -> pa.Buffer:
+    """Serialize a table in the Arrow IPC stream format"""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def from_ipc(buffer) -> pa.Table:
+    """Read a table serialized by `to_ipc`, without copying its buffers"""
+    return pa.ipc.open_stream(buffer).read_all()
+
+
+def genre_names(genres_strings: Iterable[str]) -> set:
+    """Genre names of comma separated genres strings, split as by `transform_tables`"""
+    return {name.strip() for genres in genres_strings for name in genres.split(',')} - {''}
+
+
+# Genre dictionary of a worker process, installed by `init_worker`
+_worker_genres: Optional[pa.Table] = None
+
+# Entity table and genres junction table of a resource, with the column of its genres string
+_ENTITIES = {
+    'tracks': (TRACKS_SCHEMA, TRACK_GENRES_SCHEMA, 'genres'),
+    'users': (USERS_SCHEMA, USER_FAVORITE_GENRES_SCHEMA, 'favorite_genres'),
+}
+
+
+def init_worker(genres: pa.Table) -> None:
+    """Install the genre dictionary shared by every batch transformed by this process"""
+    global _worker_genres
+    _worker_genres = genres
+
+
+def transform_batch(resource: str, dtos: Sequence) -> Tuple[pa.Buffer, ...]:
+    """Normalized tables of a batch of DTOs, built in a worker process, as Arrow IPC buffers
+
+    Tracks and users give their table and their genres junction table, the genre
+    ids taken from the dictionary of `init_worker`; the listen history gives its
+    exploded events.
+    """
+    if resource not in SOURCE_SCHEMAS:
+        raise ValueError(f"Unknown resource: {resource}")
+    table = _table(SOURCE_SCHEMAS[resource], dtos)
+    if resource == 'listen_history':
+        return (to_ipc(_listen_events(table)),)
+    schema, edges_schema, genres_column = _ENTITIES[resource]
+    owners, names = _split_genres(table.column('id'), table.column(genres_column))
+    return to_ipc(table.select(schema.names)), to_ipc(_genre_edges(owners, names, _worker_genres, edges_schema))
@@ -1,15 +1,22 @@
+from __future__ import annotations
+
 import pandas as pd
-from typing import List, Tuple
+from typing import TYPE_CHECKING, Dict, List, Tuple
 from src.moovitamix_etl.load.model.model import Genre, Track, User, ListenHistory
 from moovitamix_etl.extract.dtos.track_dto import TrackDto
 from moovitamix_etl.extract.dtos.user_dto import UserDto
 from moovitamix_etl.extract.dtos.listen_history import ListenHistoryDto
 
+# pyarrow is only imported by the runs transforming Arrow tables
+if TYPE_CHECKING:
+    import pyarrow as pa
+
 
 class DataTransformer:
     """Transform DTOs to database models using pandas for efficiency"""
     
     def __init__(self):
+        self.genres = []
         self.genres_map = {}
         
     def create_genres_list(self, tracks_dtos: List[TrackDto], users_dtos: List[UserDto]) -> List[Genre]:
@@ -61,6 +68,34 @@ class DataTransformer:
         
         return self.genres
     
+    def register_genres(self, genres_strings: List[str]) -> List[Genre]:
+        """Add the genres not seen yet to the genres map and return only those"""
+        
+        all_genres = pd.Series([g for g in genres_strings if g], dtype=object)
+        if all_genres.empty:
+            return []
+        
+        unique_genres = (
+            all_genres
+            .str.split(',')
+            .explode()
+            .str.strip()
+            .dropna()
+            .drop_duplicates()
+            .sort_values()
+        )
+        
+        new_genres = [
+            Genre(name=genre_name)
+            for genre_name in unique_genres
+            if genre_name not in self.genres_map
+        ]
+        for genre in new_genres:
+            self.genres_map[genre.name] = genre
+        self.genres.extend(new_genres)
+        
+        return new_genres
+    
     def transform_tracks(self, tracks_dto: List[TrackDto]) -> List[Track]:
         """Transform track DTOs using pandas"""
         
@@ -190,4 +225,43 @@ class DataTransformer:
         users = self.transform_users(users_dto)
         listen_history = self.transform_listen_history(listen_history_dto)
         
-        return tracks, users, listen_history, self.genres
\ No newline at end of file
+        return tracks, users, listen_history, self.genres
+    
+    def transform_tables(
+        self,
+        tracks: pa.Table,
+        users: pa.Table,
+        listen_history: pa.Table
+    ) -> Dict[str, pa.Table]:
+        """Transform the source tables of the extractor into the tables to load
+        
+        Unlike `transform_all`, no object is built per row: the result holds the
+        genres, tracks, users and listen events tables and the junction tables from
+        tracks and users to their genres, keyed by the names of `columnar.TABLES`.
+        """
+        from src.moovitamix_etl.transform import columnar
+        
+        return columnar.transform_tables(tracks, users, listen_history)
+    
+    def transform_chunk(self, resource: str, dtos: List) -> List[Tuple[str, List]]:
+        """Transform one page of DTOs, as used by the streaming pipeline
+        
+        Genres are discovered incrementally: the genres first seen in this chunk are
+        returned as a 'genres' chunk ahead of the tracks or users referencing them.
+        """
+        chunks = []
+        if resource == 'tracks':
+            new_genres = self.register_genres([t.genres for t in dtos])
+            if new_genres:
+                chunks.append(('genres', new_genres))
+            chunks.append(('tracks', self.transform_tracks(dtos)))
+        elif resource == 'users':
+            new_genres = self.register_genres([u.favorite_genres for u in dtos])
+            if new_genres:
+                chunks.append(('genres', new_genres))
+            chunks.append(('users', self.transform_users(dtos)))
+        elif resource == 'listen_history':
+            chunks.append(('listen_history', self.transform_listen_history(dtos)))
+        else:
+            raise ValueError(f"Unknown resource: {resource}")
+        return chunks
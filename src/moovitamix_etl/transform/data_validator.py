@@ -0,0 +1,233 @@
+"""Data quality checks between the transform and the load phases.
+
+Each rule is evaluated on a whole column with Arrow compute kernels (regular
+expressions, comparisons, set membership), so the cost per row stays in C. The
+rows failing a rule are dropped before the load, and recorded with the codes of
+the rules they failed, instead of failing the database transaction of the run.
+"""
+
+import csv
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Reason codes written to the reject files
+INVALID_EMAIL = 'invalid_email'
+INVALID_DURATION = 'invalid_duration'
+INVALID_TIMESTAMP = 'invalid_timestamp'
+UNKNOWN_USER = 'unknown_user'
+UNKNOWN_TRACK = 'unknown_track'
+
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+# MM:SS, seconds below 60
+DURATION_PATTERN = r'^\d{2}:[0-5]\d$'
+
+# Columns of the records checked by the rules
+COLUMNS = {
+    'tracks': pa.schema([
+        ('id', pa.int64()),
+        ('duration', pa.string()),
+        ('created_at', pa.timestamp('us')),
+        ('updated_at', pa.timestamp('us')),
+    ]),
+    'users': pa.schema([
+        ('id', pa.int64()),
+        ('email', pa.string()),
+        ('created_at', pa.timestamp('us')),
+        ('updated_at', pa.timestamp('us')),
+    ]),
+    'listen_history': pa.schema([
+        ('user_id', pa.int64()),
+        ('track_id', pa.int64()),
+        ('listened_at', pa.timestamp('us')),
+    ]),
+}
+
+REJECT_FIELDS = ('resource', 'key', 'reasons')
+
+
+def _columns(resource: str, records: Sequence) -> pa.Table:
+    """Table of the checked attributes of transformed records"""
+    schema = COLUMNS[resource]
+    return pa.table({name: [getattr(record, name) for record in records] for name in schema.names}, schema=schema)
+
+
+def _fails(passed: pa.ChunkedArray) -> np.ndarray:
+    """Rows failing a check, null results counting as failures"""
+    return np.asarray(pc.invert(pc.fill_null(passed, False)))
+
+
+class DataValidator:
+    """Reject the transformed rows which would fail or corrupt the load
+
+    Tracks need a `MM:SS` duration and users a well-formed email; every timestamp
+    must lie between `min_timestamp` and the validation time plus `max_skew`. With
+    `check_references`, listen events must reference a user and a track accepted in
+    the same run (set anti-joins on the ids), which needs the dimensions of the run
+    to be complete, as in batch runs.
+
+    Args:
+        check_references (bool, optional): reject the listen events of unknown users
+            or tracks. Defaults to True.
+        min_timestamp (datetime, optional): earliest valid timestamp. Defaults to 2000-01-01.
+        max_skew (timedelta, optional): how far in the future a timestamp may be. Defaults to one day.
+    """
+
+    def __init__(
+        self,
+        check_references: bool = True,
+        min_timestamp: datetime = datetime(2000, 1, 1),
+        max_skew: timedelta = timedelta(days=1)
+    ):
+        self.check_references = check_references
+        self.min_timestamp = min_timestamp
+        self.max_timestamp = datetime.now() + max_skew
+        # (resource, key, reason codes) of the rejected rows
+        self.rejects: List[Tuple[str, str, str]] = []
+        self.metrics = None
+        self.logger = logging.getLogger(__name__)
+
+    def _valid_timestamps(self, column: pa.ChunkedArray) -> pa.ChunkedArray:
+        return pc.and_(
+            pc.greater_equal(column, pa.scalar(self.min_timestamp, column.type)),
+            pc.less_equal(column, pa.scalar(self.max_timestamp, column.type))
+        )
+
+    def check(
+        self,
+        resource: str,
+        table: pa.Table,
+        user_ids: Optional[pa.Array] = None,
+        track_ids: Optional[pa.Array] = None
+    ) -> np.ndarray:
+        """Mask of the valid rows of a table, recording the others as rejects
+
+        Args:
+            resource (str): 'tracks', 'users' or 'listen_history'.
+            table (pa.Table): rows holding at least the columns of `COLUMNS[resource]`.
+            user_ids (pa.Array, optional): accepted user ids, for the listen events.
+            track_ids (pa.Array, optional): accepted track ids, for the listen events.
+
+        Returns:
+            np.ndarray: boolean mask, True for the rows to load.
+        """
+        failures: Dict[str, np.ndarray] = {}
+        if resource == 'tracks':
+            failures[INVALID_DURATION] = _fails(pc.match_substring_regex(table.column('duration'), DURATION_PATTERN))
+        elif resource == 'users':
+            failures[INVALID_EMAIL] = _fails(pc.match_substring_regex(table.column('email'), EMAIL_PATTERN))
+        if resource == 'listen_history':
+            failures[INVALID_TIMESTAMP] = _fails(self._valid_timestamps(table.column('listened_at')))
+            if user_ids is not None:
+                failures[UNKNOWN_USER] = _fails(pc.is_in(table.column('user_id'), value_set=user_ids))
+            if track_ids is not None:
+                failures[UNKNOWN_TRACK] = _fails(pc.is_in(table.column('track_id'), value_set=track_ids))
+        else:
+            failures[INVALID_TIMESTAMP] = (
+                _fails(self._valid_timestamps(table.column('created_at')))
+                | _fails(self._valid_timestamps(table.column('updated_at')))
+            )
+
+        codes = list(failures)
+        matrix = np.vstack([failures[code] for code in codes])
+        rejected = np.flatnonzero(matrix.any(axis=0))
+        if len(rejected):
+            self._record(resource, table.take(pa.array(rejected)), matrix[:, rejected], codes)
+        valid = np.ones(table.num_rows, dtype=bool)
+        valid[rejected] = False
+        return valid
+
+    def _record(self, resource: str, rows: pa.Table, matrix: np.ndarray, codes: List[str]) -> None:
+        """Keep the keys and reason codes of rejected rows"""
+        if resource == 'listen_history':
+            keys = [
+                f"{user_id}:{track_id}:{listened_at.isoformat() if listened_at else ''}"
+                for user_id, track_id, listened_at in zip(
+                    rows.column('user_id').to_pylist(),
+                    rows.column('track_id').to_pylist(),
+                    rows.column('listened_at').to_pylist()
+                )
+            ]
+        else:
+            keys = [str(key) for key in rows.column('id').to_pylist()]
+        for index, key in enumerate(keys):
+            reasons = '|'.join(code for code, failed in zip(codes, matrix[:, index]) if failed)
+            self.rejects.append((resource, key, reasons))
+        if self.metrics is not None:
+            for code, count in zip(codes, matrix.sum(axis=1).tolist()):
+                if count:
+                    self.metrics.increment(f'rejected_{code}', count)
+        self.logger.warning(f"Rejected {len(keys)} {resource} rows failing the data quality checks")
+
+    def validate_records(
+        self,
+        resource: str,
+        records: List,
+        user_ids: Optional[pa.Array] = None,
+        track_ids: Optional[pa.Array] = None
+    ) -> List:
+        """Valid transformed records (tracks, users or listen events) of a resource"""
+        if resource not in COLUMNS or not records:
+            return records
+        valid = self.check(resource, _columns(resource, records), user_ids, track_ids)
+        if valid.all():
+            return records
+        return [record for record, keep in zip(records, valid.tolist()) if keep]
+
+    def validate_all(self, tracks: List, users: List, listen_history: List, genres: List) -> Tuple[List, List, List, List]:
+        """Valid records of a batch run, as returned by `DataTransformer.transform_all`"""
+        tracks = self.validate_records('tracks', tracks)
+        users = self.validate_records('users', users)
+        user_ids = track_ids = None
+        if self.check_references:
+            user_ids = pa.array([user.id for user in users], pa.int64())
+            track_ids = pa.array([track.id for track in tracks], pa.int64())
+        listen_history = self.validate_records('listen_history', listen_history, user_ids, track_ids)
+        return tracks, users, listen_history, genres
+
+    def validate_chunk(self, chunks: List[Tuple[str, List]]) -> List[Tuple[str, List]]:
+        """Valid records of the chunks of one page, as returned by `DataTransformer.transform_chunk`
+
+        A page holds a single resource, so references are not checked.
+        """
+        return [(resource, self.validate_records(resource, records)) for resource, records in chunks]
+
+    def validate_tables(self, tables: Dict[str, pa.Table]) -> Dict[str, pa.Table]:
+        """Valid rows of the tables of `DataTransformer.transform_tables`
+
+        The genre edges of rejected tracks and users are dropped with them.
+        """
+        tables = dict(tables)
+        for resource, edges, owner in (('tracks', 'track_genres', 'track_id'), ('users', 'user_favorite_genres', 'user_id')):
+            valid = self.check(resource, tables[resource])
+            if not valid.all():
+                tables[resource] = tables[resource].filter(pa.array(valid))
+                tables[edges] = tables[edges].filter(
+                    pc.is_in(tables[edges].column(owner), value_set=tables[resource].column('id').combine_chunks())
+                )
+        user_ids = track_ids = None
+        if self.check_references:
+            user_ids = tables['users'].column('id').combine_chunks()
+            track_ids = tables['tracks'].column('id').combine_chunks()
+        valid = self.check('listen_history', tables['listen_history'], user_ids, track_ids)
+        if not valid.all():
+            tables['listen_history'] = tables['listen_history'].filter(pa.array(valid))
+        return tables
+
+    def write_rejects(self, folder: str, run_id: str) -> Optional[str]:
+        """Write the rejected rows of the run as `rejects_<run id>.csv`, return its path if any row was rejected"""
+        if not self.rejects:
+            return None
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"rejects_{run_id}.csv")
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(REJECT_FIELDS)
+            writer.writerows(self.rejects)
+        self.logger.warning(f"{len(self.rejects)} rejected rows written to {path}")
+        return path
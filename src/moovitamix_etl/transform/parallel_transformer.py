@@ -0,0 +1,138 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+import pyarrow as pa
+import pyarrow.compute as pc
+from src.moovitamix_etl.load.model.model import Genre, Track, User, ListenHistory
+from src.moovitamix_etl.transform.columnar import (
+    LISTEN_EVENTS_SCHEMA, TRACK_GENRES_SCHEMA, TRACKS_SCHEMA, USER_FAVORITE_GENRES_SCHEMA, USERS_SCHEMA,
+    from_ipc, genre_names, genres_table, init_worker, transform_batch, unique_edges
+)
+from src.moovitamix_etl.transform.data_transformer import DataTransformer
+from moovitamix_etl.extract.dtos.track_dto import TrackDto
+from moovitamix_etl.extract.dtos.user_dto import UserDto
+from moovitamix_etl.extract.dtos.listen_history import ListenHistoryDto
+
+
+class ParallelTransformer(DataTransformer):
+    """Transform DTOs in a process pool, batch by batch
+
+    Workers turn batches of DTOs into the normalized tables of the Arrow pipeline
+    (genre splitting, timestamps, exploded listen events), so only columnar buffers
+    come back to this process, which concatenates them and hands them to the Arrow
+    load path as they are.
+
+    Genre ids come from a dictionary installed in every worker when the pool starts,
+    so they agree across batches. The pool is kept for the next calls until `close`,
+    e.g. across the runs of a pipeline kept warm, and only restarted when a call
+    brings genres missing from its dictionary.
+    """
+
+    def __init__(self, workers: Optional[int] = None, batch_size: int = 10000):
+        super().__init__()
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.logger = logging.getLogger(__name__)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Genre dictionary of the running workers
+        self._genres = genres_table([])
+
+    def _pool(self, names: set) -> ProcessPoolExecutor:
+        """Pool whose workers know every genre name of `names`"""
+        known = set(self._genres.column('name').to_pylist())
+        if not names <= known:
+            if self._executor is not None:
+                self.logger.info(f"Restarting the worker processes with {len(names - known)} new genres")
+                self.close()
+            self._genres = genres_table(known | names)
+        if self._executor is None:
+            # Spawned workers do not inherit the threads (and locks) of this process
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+                initargs=(self._genres,)
+            )
+        return self._executor
+
+    def close(self) -> None:
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _batches(self, resource: str, dtos: List) -> Iterator[Tuple[str, List]]:
+        for start in range(0, len(dtos), self.batch_size):
+            yield resource, dtos[start:start + self.batch_size]
+
+    def transform_dtos(
+        self,
+        tracks_dto: List[TrackDto],
+        users_dto: List[UserDto],
+        listen_history_dto: List[ListenHistoryDto]
+    ) -> Dict[str, pa.Table]:
+        """Transform all DTOs into the tables of `transform_tables`, the batches spread over the workers
+
+        Only the distinct genres strings are read here, to give the workers every
+        genre of the run; the tables of a resource are the concatenation of those of
+        its batches.
+        """
+        resources = {'tracks': tracks_dto, 'users': users_dto, 'listen_history': listen_history_dto}
+        names = genre_names({dto.genres for dto in tracks_dto} | {dto.favorite_genres for dto in users_dto})
+        batches = [batch for resource, dtos in resources.items() for batch in self._batches(resource, dtos)]
+        self.logger.info(f"Transforming {len(batches)} batches with {self.workers} worker processes")
+
+        parts = {
+            'tracks': ([TRACKS_SCHEMA.empty_table()], [TRACK_GENRES_SCHEMA.empty_table()]),
+            'users': ([USERS_SCHEMA.empty_table()], [USER_FAVORITE_GENRES_SCHEMA.empty_table()]),
+            'listen_history': ([LISTEN_EVENTS_SCHEMA.empty_table()],),
+        }
+        buffers = self._pool(names).map(transform_batch, *zip(*batches)) if batches else []
+        for (resource, _), tables in zip(batches, buffers):
+            for part, buffer in zip(parts[resource], tables):
+                part.append(from_ipc(buffer))
+
+        genres = self._genres.filter(pc.is_in(self._genres.column('name'), value_set=pa.array(sorted(names), pa.string())))
+        return {
+            'genres': genres,
+            'tracks': pa.concat_tables(parts['tracks'][0]),
+            # An owner repeated in several batches would repeat its edges
+            'track_genres': unique_edges(pa.concat_tables(parts['tracks'][1])),
+            'users': pa.concat_tables(parts['users'][0]),
+            'user_favorite_genres': unique_edges(pa.concat_tables(parts['users'][1])),
+            'listen_history': pa.concat_tables(parts['listen_history'][0]),
+        }
+
+    def transform_all(
+        self,
+        tracks_dto: List[TrackDto],
+        users_dto: List[UserDto],
+        listen_history_dto: List[ListenHistoryDto]
+    ) -> Tuple[List[Track], List[User], List[ListenHistory], List[Genre]]:
+        """Transform all DTOs into database models, built from the tables of `transform_dtos`
+
+        Building the models takes longer than transforming the batches: loaders
+        taking Arrow tables should be given `transform_dtos` instead.
+        """
+        tables = self.transform_dtos(tracks_dto, users_dto, listen_history_dto)
+        genres = tables['genres']
+        self.genres = [Genre(name=name) for name in genres.column('name').to_pylist()]
+        self.genres_map = {genre.name: genre for genre in self.genres}
+        by_id = dict(zip(genres.column('id').to_pylist(), self.genres))
+
+        track_genres = self._genres_by_owner(tables['track_genres'], 'track_id', by_id)
+        user_genres = self._genres_by_owner(tables['user_favorite_genres'], 'user_id', by_id)
+        tracks = [Track(**row, genres=track_genres.get(row['id'], [])) for row in tables['tracks'].to_pylist()]
+        users = [User(**row, favorite_genres=user_genres.get(row['id'], [])) for row in tables['users'].to_pylist()]
+        listen_history = [ListenHistory(**row) for row in tables['listen_history'].to_pylist()]
+        return tracks, users, listen_history, self.genres
+
+    @staticmethod
+    def _genres_by_owner(edges: pa.Table, owner: str, genres: Dict[int, Genre]) -> Dict[int, List[Genre]]:
+        """Genre models of each owner of a junction table, in the order of the edges"""
+        grouped: Dict[int, List[Genre]] = {}
+        for owner_id, genre_id in zip(edges.column(owner).to_pylist(), edges.column('genre_id').to_pylist()):
+            grouped.setdefault(owner_id, []).append(genres[genre_id])
+        return grouped
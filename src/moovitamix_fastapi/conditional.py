@@ -0,0 +1,59 @@
+"""
+Conditional requests on the paginated endpoints: ETag and Last-Modified validators.
+"""
+
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+from fastapi import Request, Response
+from fastapi_pagination import paginate
+from pydantic import BaseModel
+
+
+def page_etag(version: str, request: Request) -> str:
+    """
+    Entity tag of a page, derived from the dataset version and the page parameters.
+
+    The data is generated once at startup and never modified afterwards, so a page
+    is identified by the dataset it comes from and its position: no need to
+    serialize and hash its content to validate it.
+    """
+    page = request.query_params.get("page", "1")
+    size = request.query_params.get("size", "100")
+    return f'"{version}-{page}-{size}"'
+
+
+def _updated_at(row) -> datetime:
+    value = row.updated_at if isinstance(row, BaseModel) else row["updated_at"]
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _matches(etag: str, if_none_match: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (candidate.strip().removeprefix("W/") for candidate in if_none_match.split(","))
+
+
+def conditional_paginate(rows, request: Request, response: Response, version: str):
+    """
+    Paginate rows, or answer 304 Not Modified when the client already holds the page.
+
+    Args:
+        rows (Sequence): The rows to paginate, Pydantic models or dicts.
+        request (Request): The incoming request, read for its page parameters and If-None-Match.
+        response (Response): The response the ETag and Last-Modified headers are set on.
+        version (str): Identifies the dataset served, changes whenever the data changes.
+
+    """
+    etag = page_etag(version, request)
+    if _matches(etag, request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    page = paginate(rows)
+    response.headers["ETag"] = etag
+    if page.items:
+        last_modified = max(_updated_at(row) for row in page.items)
+        response.headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return page
@@ -0,0 +1,60 @@
+"""
+Bulk export of a whole resource as a single streamed NDJSON response.
+"""
+
+import json
+import zlib
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+# Rows serialized together into one chunk of the response body
+EXPORT_BATCH_SIZE = 1000
+
+# Favor speed over ratio: NDJSON of repetitive rows compresses well even at level 1
+GZIP_LEVEL = 1
+
+
+def _to_json(row) -> str:
+    if isinstance(row, BaseModel):
+        return row.model_dump_json()
+    return json.dumps(row, separators=(",", ":"), default=str)
+
+
+def iter_ndjson(rows, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Serialize rows as NDJSON, one chunk per batch of rows.
+
+    Args:
+        rows (Sequence): The rows to export, Pydantic models or dicts.
+        batch_size (int, optional): The number of rows per chunk. Defaults to EXPORT_BATCH_SIZE.
+
+    """
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        yield "".join(_to_json(row) + "\n" for row in batch).encode()
+
+
+def iter_gzip(chunks, level=GZIP_LEVEL):
+    """
+    Compress a stream of chunks as a single gzip stream.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def ndjson_response(rows, request: Request) -> StreamingResponse:
+    """
+    Stream every row as NDJSON, gzip compressed when the client accepts it.
+    """
+    body = iter_ndjson(rows)
+    headers = {}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = iter_gzip(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type="application/x-ndjson", headers=headers)
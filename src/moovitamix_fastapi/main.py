@@ -1,9 +1,15 @@
+import os
+import uuid
+
 from classes_out import ListenHistoryOut, TracksOut, UsersOut
-from fastapi import FastAPI, Query
+from conditional import conditional_paginate
+from export import ndjson_response
+from fastapi import FastAPI, Query, Request, Response
 from fastapi.openapi.docs import get_swagger_ui_html
-from fastapi.responses import RedirectResponse
-from fastapi_pagination import Page, add_pagination, paginate
+from fastapi.responses import RedirectResponse, StreamingResponse
+from fastapi_pagination import Page, add_pagination
 from generate_fake_data import FakeDataGenerator
+from vectorized_fake_data import LazyFakeDataGenerator, VectorizedFakeDataGenerator
 
 Page = Page.with_custom_options(
     size=Query(100, ge=1, le=100),
@@ -31,24 +37,58 @@ async def overridden_swagger():
     )
 
 
-data_range_observations = 1000
-generator = FakeDataGenerator(data_range_observations)
+data_range_observations = int(os.getenv("FAKE_DATA_OBSERVATIONS", "1000"))
+fake_data_mode = os.getenv("FAKE_DATA_MODE", "faker")
+fake_data_seed = int(os.getenv("FAKE_DATA_SEED", "42"))
+# "vectorized" generates millions of rows in seconds, reproducibly from FAKE_DATA_SEED
+if fake_data_mode == "vectorized":
+    generator = VectorizedFakeDataGenerator(data_range_observations, seed=fake_data_seed)
+# "lazy" generates nothing at startup: each page is generated when served
+elif fake_data_mode == "lazy":
+    generator = LazyFakeDataGenerator(
+        data_range_observations,
+        seed=fake_data_seed,
+        cache_blocks=int(os.getenv("FAKE_DATA_CACHE_BLOCKS", "256")),
+    )
+else:
+    generator = FakeDataGenerator(data_range_observations)
 tracks, users, listen_history = generator.generate_fake_data()
 
+# Part of the ETag of every page: seeded data is the same across restarts, Faker data is not
+if fake_data_mode in ("vectorized", "lazy"):
+    data_version = f"{fake_data_mode}-{fake_data_seed}-{data_range_observations}"
+else:
+    data_version = uuid.uuid4().hex
+
 
 @app.get("/tracks", tags=["HTTP methods"])
-async def get_tracks() -> Page[TracksOut]:
-    return paginate(tracks)
+async def get_tracks(request: Request, response: Response) -> Page[TracksOut]:
+    return conditional_paginate(tracks, request, response, data_version)
 
 
 @app.get("/users", tags=["HTTP methods"])
-async def get_users() -> Page[UsersOut]:
-    return paginate(users)
+async def get_users(request: Request, response: Response) -> Page[UsersOut]:
+    return conditional_paginate(users, request, response, data_version)
 
 
 @app.get("/listen_history", tags=["HTTP methods"])
-async def get_listen_history() -> Page[ListenHistoryOut]:
-    return paginate(listen_history)
+async def get_listen_history(request: Request, response: Response) -> Page[ListenHistoryOut]:
+    return conditional_paginate(listen_history, request, response, data_version)
+
+
+@app.get("/tracks/export", tags=["Bulk export"])
+async def export_tracks(request: Request) -> StreamingResponse:
+    return ndjson_response(tracks, request)
+
+
+@app.get("/users/export", tags=["Bulk export"])
+async def export_users(request: Request) -> StreamingResponse:
+    return ndjson_response(users, request)
+
+
+@app.get("/listen_history/export", tags=["Bulk export"])
+async def export_listen_history(request: Request) -> StreamingResponse:
+    return ndjson_response(listen_history, request)
 
 
 add_pagination(app)
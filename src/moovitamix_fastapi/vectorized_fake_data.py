@@ -0,0 +1,377 @@
+"""
+Vectorized, seeded alternative to FakeDataGenerator for large datasets.
+
+Every column is drawn in bulk with NumPy from a seed and kept as integer arrays;
+rows are only built as dicts when a slice is requested, which is what pagination
+does. Millions of rows are generated in seconds, identically for a given seed.
+"""
+
+import math
+from collections.abc import Sequence
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+GENDERS = np.array([
+    "Male",
+    "Female",
+    "Non-binary",
+    "Genderqueer",
+    "Genderfluid",
+    "Agender",
+    "Bigender",
+    "Gender questioning",
+    "Gender nonconforming",
+])
+
+GENRES = np.array([
+    "Rock",
+    "Pop",
+    "Hip Hop",
+    "Jazz",
+    "Electronic",
+    "Classical",
+    "Country",
+    "Blues",
+    "R&B",
+    "Reggae",
+    "Folk",
+    "Metal",
+    "Punk",
+    "Funk",
+    "Indie",
+    "Alternative",
+    "Techno",
+])
+
+# Single genres and every pair of genres, as found in the `genres` field of a track
+GENRE_CHOICES = np.array(
+    list(GENRES) + [f"{a}, {b}" for i, a in enumerate(GENRES) for b in GENRES[i + 1:]]
+)
+
+WORDS = np.array([
+    "love", "night", "dream", "fire", "river", "summer", "heart", "city", "light", "shadow",
+    "storm", "gold", "echo", "wild", "blue", "ocean", "road", "star", "rain", "home",
+])
+
+FIRST_NAMES = np.array([
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda",
+    "David", "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+])
+
+LAST_NAMES = np.array([
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas",
+])
+
+# Fixed reference date so that timestamps do not depend on when data is generated
+REFERENCE_DATE = np.datetime64("2024-05-09T00:00:00", "s")
+TWO_YEARS = 2 * 365 * 24 * 3600
+
+
+class ColumnarRows(Sequence):
+    """
+    Read-only sequence of dicts backed by columns; rows are only built when accessed.
+
+    Args:
+        length (int): The number of rows.
+        columns (dict): For each field, a function returning the values of the rows
+            between two positions.
+
+    """
+
+    def __init__(self, length: int, columns: Dict[str, Callable[[int, int], list]]):
+        self.length = length
+        self.columns = columns
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            values = {name: column(start, stop) for name, column in self.columns.items()}
+            return [dict(zip(values, row)) for row in zip(*values.values())]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("row index out of range")
+        return self[index:index + 1][0]
+
+
+def _timestamps(rng, size):
+    """Random (created_at, updated_at) pairs over the two years before the reference date."""
+    created = REFERENCE_DATE - rng.integers(0, TWO_YEARS, size=size).astype("timedelta64[s]")
+    age = (REFERENCE_DATE - created).astype(np.int64)
+    updated = created + (rng.random(size) * age).astype("timedelta64[s]")
+    return created, updated
+
+
+def _iso(values):
+    return lambda start, stop: np.datetime_as_string(values[start:stop], unit="s").tolist()
+
+
+def _pick(vocabulary, indexes):
+    return lambda start, stop: vocabulary[indexes[start:stop]].tolist()
+
+
+def _full_name(first, last):
+    return lambda start, stop: [
+        f"{f} {l}" for f, l in zip(FIRST_NAMES[first[start:stop]], LAST_NAMES[last[start:stop]])
+    ]
+
+
+class VectorizedFakeDataGenerator:
+    """
+    Generate fake data in bulk with NumPy, reproducibly from a seed.
+
+    Same interface as FakeDataGenerator, without its limits: ids are permutations
+    of 1..n (no 100k cap) and the tracks of each listen history entry are drawn for
+    every user at once instead of sampling the whole track list per user.
+
+    Args:
+        data_range_observations (int): The number of users and listen history entries to generate.
+        seed (int, optional): The random seed. Defaults to None (not reproducible).
+        items_per_user (int, optional): The number of tracks in each listen history entry. Defaults to 5.
+        n_tracks (int, optional): The number of tracks. Defaults to data_range_observations.
+
+    """
+
+    def __init__(
+        self,
+        data_range_observations: int,
+        seed: Optional[int] = None,
+        items_per_user: int = 5,
+        n_tracks: Optional[int] = None,
+    ):
+        self.data_range_observations = data_range_observations
+        self.seed = seed
+        self.items_per_user = items_per_user
+        self.n_tracks = max(items_per_user, n_tracks or data_range_observations)
+
+    def generate_fake_data(self):
+        """
+        Generate fake data for tracks, users, and listen history.
+
+        Returns:
+            tuple: A tuple containing three sequences of dicts:
+                - tracks: The generated tracks.
+                - users: The generated users.
+                - listen_history: The generated listen history.
+
+        """
+        rng = np.random.default_rng(self.seed)
+        track_ids = rng.permutation(self.n_tracks) + 1
+        user_ids = rng.permutation(self.data_range_observations) + 1
+
+        tracks = self._generate_tracks(rng, track_ids)
+        users = self._generate_users(rng, user_ids)
+        listen_history = self._generate_listen_history(
+            rng, user_ids, self.n_tracks, lambda positions: track_ids[positions]
+        )
+        return tracks, users, listen_history
+
+    def _generate_tracks(self, rng, ids):
+        n = len(ids)
+        name, album = rng.integers(0, len(WORDS), size=(2, n))
+        artist, writer = rng.integers(0, len(FIRST_NAMES), size=(2, n))
+        artist_last, writer_last = rng.integers(0, len(LAST_NAMES), size=(2, n))
+        seconds = rng.integers(60, 600, size=n)
+        genres = rng.integers(0, len(GENRE_CHOICES), size=n)
+        created, updated = _timestamps(rng, n)
+
+        def track_name(start, stop):
+            # As for emails, the id keeps the (name, artist) natural key unique
+            return [f"{w} {i}" for w, i in zip(WORDS[name[start:stop]], ids[start:stop].tolist())]
+
+        return ColumnarRows(n, {
+            "id": lambda start, stop: ids[start:stop].tolist(),
+            "name": track_name,
+            "artist": _full_name(artist, artist_last),
+            "songwriters": _full_name(writer, writer_last),
+            "duration": lambda start, stop: [
+                f"{s // 60:02d}:{s % 60:02d}" for s in seconds[start:stop].tolist()
+            ],
+            "genres": _pick(GENRE_CHOICES, genres),
+            "album": _pick(WORDS, album),
+            "created_at": _iso(created),
+            "updated_at": _iso(updated),
+        })
+
+    def _generate_users(self, rng, ids):
+        n = len(ids)
+        first, last = rng.integers(0, len(FIRST_NAMES), size=(2, n))
+        gender = rng.integers(0, len(GENDERS), size=n)
+        genre = rng.integers(0, len(GENRES), size=n)
+        created, updated = _timestamps(rng, n)
+
+        def email(start, stop):
+            # The id keeps emails unique whatever the number of users
+            return [
+                f"{f.lower()}.{l.lower()}.{i}@example.com"
+                for f, l, i in zip(
+                    FIRST_NAMES[first[start:stop]], LAST_NAMES[last[start:stop]], ids[start:stop].tolist()
+                )
+            ]
+
+        return ColumnarRows(n, {
+            "id": lambda start, stop: ids[start:stop].tolist(),
+            "first_name": _pick(FIRST_NAMES, first),
+            "last_name": _pick(LAST_NAMES, last),
+            "email": email,
+            "gender": _pick(GENDERS, gender),
+            "favorite_genres": _pick(GENRES, genre),
+            "created_at": _iso(created),
+            "updated_at": _iso(updated),
+        })
+
+    def _generate_listen_history(self, rng, user_ids, n_tracks, track_id_of):
+        n = len(user_ids)
+        positions = rng.integers(0, n_tracks, size=(n, self.items_per_user))
+        # Like random.sample, a user never lists the same track twice: redraw those rows
+        while True:
+            ordered = np.sort(positions, axis=1)
+            duplicated = (ordered[:, 1:] == ordered[:, :-1]).any(axis=1)
+            if not duplicated.any():
+                break
+            positions[duplicated] = rng.integers(
+                0, n_tracks, size=(int(duplicated.sum()), self.items_per_user)
+            )
+        items = track_id_of(positions)
+        created, updated = _timestamps(rng, n)
+
+        return ColumnarRows(n, {
+            "user_id": lambda start, stop: user_ids[start:stop].tolist(),
+            "items": lambda start, stop: items[start:stop].tolist(),
+            "created_at": _iso(created),
+            "updated_at": _iso(updated),
+        })
+
+
+class LazyRows(Sequence):
+    """
+    Virtual sequence of rows generated block by block, only when accessed.
+
+    Args:
+        length (int): The number of rows.
+        block_size (int): The number of rows generated at once.
+        block (callable): Returns the rows of a block from its number.
+
+    """
+
+    def __init__(self, length: int, block_size: int, block: Callable[[int], list]):
+        self.length = length
+        self.block_size = block_size
+        self.block = block
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            rows = []
+            for number in range(start // self.block_size, math.ceil(stop / self.block_size)):
+                block_start = number * self.block_size
+                block = self.block(number)
+                rows.extend(block[max(start - block_start, 0):stop - block_start])
+            return rows
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("row index out of range")
+        return self[index:index + 1][0]
+
+
+class LazyFakeDataGenerator(VectorizedFakeDataGenerator):
+    """
+    Generate fake data on demand, one block of rows at a time.
+
+    Nothing is generated up front: the rows of a block are drawn when a page
+    touching it is served, from a random generator seeded with (seed, resource,
+    block), so any page is reproducible without generating the pages before it.
+    Ids are a seeded permutation of 1..n computed arithmetically, so no id array is
+    kept either. Recently served blocks stay in an LRU cache. Startup is instant
+    and memory flat whatever the size of the virtual dataset.
+
+    Args:
+        data_range_observations (int): The number of users and listen history entries to serve.
+        seed (int, optional): The random seed. Defaults to 0.
+        items_per_user (int, optional): The number of tracks in each listen history entry. Defaults to 5.
+        n_tracks (int, optional): The number of tracks. Defaults to data_range_observations.
+        block_size (int, optional): The number of rows generated at once. Defaults to 1000.
+        cache_blocks (int, optional): The number of blocks kept per resource. Defaults to 256.
+
+    """
+
+    RESOURCES = ("tracks", "users", "listen_history")
+
+    def __init__(
+        self,
+        data_range_observations: int,
+        seed: int = 0,
+        items_per_user: int = 5,
+        n_tracks: Optional[int] = None,
+        block_size: int = 1000,
+        cache_blocks: int = 256,
+    ):
+        super().__init__(data_range_observations, seed, items_per_user, n_tracks)
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self._track_ids = self._permutation(self.n_tracks, salt=0)
+        self._user_ids = self._permutation(self.data_range_observations, salt=1)
+
+    def _permutation(self, n, salt):
+        """Seeded bijection of 0..n-1 onto the ids 1..n: i -> (a * i + b) mod n + 1."""
+        rng = np.random.default_rng([self.seed, salt])
+        multiplier = int(rng.integers(n // 3 + 1, 2**31)) | 1
+        while math.gcd(multiplier, n) != 1:
+            multiplier += 2
+        offset = int(rng.integers(0, n))
+        return lambda positions: (multiplier * np.asarray(positions, dtype=np.int64) + offset) % n + 1
+
+    def _rng(self, resource, block):
+        return np.random.default_rng([self.seed, self.RESOURCES.index(resource) + 2, block])
+
+    def _block_positions(self, block, length):
+        start = block * self.block_size
+        return np.arange(start, min(start + self.block_size, length))
+
+    def _tracks_block(self, block):
+        ids = self._track_ids(self._block_positions(block, self.n_tracks))
+        return self._generate_tracks(self._rng("tracks", block), ids)[:]
+
+    def _users_block(self, block):
+        ids = self._user_ids(self._block_positions(block, self.data_range_observations))
+        return self._generate_users(self._rng("users", block), ids)[:]
+
+    def _listen_history_block(self, block):
+        user_ids = self._user_ids(self._block_positions(block, self.data_range_observations))
+        return self._generate_listen_history(
+            self._rng("listen_history", block), user_ids, self.n_tracks, self._track_ids
+        )[:]
+
+    def generate_fake_data(self):
+        """
+        Create the virtual tracks, users, and listen history, without generating any row.
+
+        Returns:
+            tuple: A tuple containing three lazy sequences of dicts:
+                - tracks: The virtual tracks.
+                - users: The virtual users.
+                - listen_history: The virtual listen history.
+
+        """
+        def cached(block):
+            return lru_cache(maxsize=self.cache_blocks)(block)
+
+        return (
+            LazyRows(self.n_tracks, self.block_size, cached(self._tracks_block)),
+            LazyRows(self.data_range_observations, self.block_size, cached(self._users_block)),
+            LazyRows(self.data_range_observations, self.block_size, cached(self._listen_history_block)),
+        )
@@ -0,0 +1,242 @@
+"""
+Read-only analytics over the loaded schema, paginated by keyset and cached for a few seconds.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel
+from sqlalchemy import Integer, bindparam, func, select, tuple_
+
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import (
+    DailyTrackPlays, Genre, ListenHistory, Track, UserGenrePlays, track_genres
+)
+
+MAX_PAGE_SIZE = 500
+
+# Bounds of the ranges left open by the requests
+MIN_DATETIME, MAX_DATETIME = datetime(1970, 1, 1), datetime(9999, 12, 31)
+MIN_DAY, MAX_DAY = date(1970, 1, 1), date(9999, 12, 31)
+# Play count above any real one, starting the first page of a ranking
+MAX_PLAYS = 2 ** 62
+
+_history = ListenHistory.__table__
+_tracks = Track.__table__
+_daily = DailyTrackPlays.__table__
+_genre_plays = UserGenrePlays.__table__
+_genres = Genre.__table__
+
+# Listens of a user in [start, end), after the (listened_at, id) cursor: a range of ix_listen_history_user_listened
+USER_HISTORY = (
+    select(_history.c.id, _history.c.track_id, _tracks.c.name, _tracks.c.artist, _history.c.listened_at)
+    .select_from(_history.join(_tracks, _tracks.c.id == _history.c.track_id))
+    .where(
+        _history.c.user_id == bindparam("user_id"),
+        _history.c.listened_at < bindparam("end"),
+        tuple_(_history.c.listened_at, _history.c.id) > tuple_(
+            bindparam("after_at", type_=_history.c.listened_at.type), bindparam("after_id", type_=Integer)
+        ),
+    )
+    .order_by(_history.c.listened_at, _history.c.id)
+    .limit(bindparam("limit"))
+)
+
+# Tracks of a genre (ix_track_genres_genre) ranked by their daily plays over [since, until],
+# after the (plays, track_id) cursor
+_plays = func.sum(_daily.c.play_count).label("plays")
+GENRE_TOP_TRACKS = (
+    select(_daily.c.track_id, _tracks.c.name, _tracks.c.artist, _plays)
+    .select_from(
+        track_genres.join(_daily, _daily.c.track_id == track_genres.c.track_id)
+        .join(_tracks, _tracks.c.id == track_genres.c.track_id)
+    )
+    .where(
+        track_genres.c.genre_id == bindparam("genre_id"),
+        _daily.c.day.between(bindparam("since"), bindparam("until")),
+    )
+    .group_by(_daily.c.track_id, _tracks.c.name, _tracks.c.artist)
+    .having(
+        (_plays < bindparam("after_plays"))
+        | ((_plays == bindparam("after_plays")) & (_daily.c.track_id > bindparam("after_id")))
+    )
+    .order_by(_plays.desc(), _daily.c.track_id)
+    .limit(bindparam("limit"))
+)
+
+# Plays of a user per genre, a range of the user_genre_plays primary key
+USER_GENRE_MIX = (
+    select(_genre_plays.c.genre_id, _genres.c.name, _genre_plays.c.play_count)
+    .select_from(_genre_plays.join(_genres, _genres.c.id == _genre_plays.c.genre_id))
+    .where(_genre_plays.c.user_id == bindparam("user_id"))
+    .order_by(_genre_plays.c.play_count.desc(), _genre_plays.c.genre_id)
+)
+
+
+def encode_cursor(*values) -> str:
+    """Opaque cursor of the sort key of the last row of a page"""
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+class AnalyticsStore:
+    """Run the analytics queries, through a short-lived cache of their pages
+
+    Every query is a module level statement with bound parameters, compiled once by
+    SQLAlchemy, and reads an index range: pages continue after the sort key of the
+    previous page (keyset pagination) instead of skipping rows with an offset.
+
+    Args:
+        db_config (DatabaseConfig): database the pipeline loads.
+        cache (TTLCache): cache of the pages, with a short ttl.
+    """
+
+    def __init__(self, db_config: DatabaseConfig, cache):
+        self.db_config = db_config
+        self.cache = cache
+
+    def _rows(self, statement, **params) -> list:
+        with self.db_config.engine.connect() as conn:
+            return conn.execute(statement, params).all()
+
+    def user_history(self, user_id: int, start: datetime, end: datetime, limit: int, cursor: Optional[str]) -> dict:
+        after_at, after_id = start, 0
+        if cursor is not None:
+            values = decode_cursor(cursor)
+            try:
+                after_at, after_id = datetime.fromisoformat(values[0]), int(values[1])
+            except (IndexError, TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        def compute():
+            rows = self._rows(
+                USER_HISTORY, user_id=user_id, end=end, after_at=after_at, after_id=after_id, limit=limit + 1
+            )
+            items = [
+                {"id": row.id, "track_id": row.track_id, "name": row.name, "artist": row.artist,
+                 "listened_at": row.listened_at}
+                for row in rows[:limit]
+            ]
+            last = items[-1] if len(rows) > limit else None
+            return {"items": items, "next_cursor": encode_cursor(last["listened_at"], last["id"]) if last else None}
+
+        return self.cache.get_or_compute(("history", user_id, start, end, limit, cursor), compute)
+
+    def genre_top_tracks(self, genre_id: int, since: date, until: date, limit: int, cursor: Optional[str]) -> dict:
+        after_plays, after_id = MAX_PLAYS, 0
+        if cursor is not None:
+            values = decode_cursor(cursor)
+            try:
+                after_plays, after_id = int(values[0]), int(values[1])
+            except (IndexError, TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        def compute():
+            rows = self._rows(
+                GENRE_TOP_TRACKS, genre_id=genre_id, since=since, until=until,
+                after_plays=after_plays, after_id=after_id, limit=limit + 1
+            )
+            items = [
+                {"track_id": row.track_id, "name": row.name, "artist": row.artist, "play_count": int(row.plays)}
+                for row in rows[:limit]
+            ]
+            last = items[-1] if len(rows) > limit else None
+            return {"items": items, "next_cursor": encode_cursor(last["play_count"], last["track_id"]) if last else None}
+
+        return self.cache.get_or_compute(("genre", genre_id, since, until, limit, cursor), compute)
+
+    def user_genre_mix(self, user_id: int) -> dict:
+        def compute():
+            rows = self._rows(USER_GENRE_MIX, user_id=user_id)
+            total = sum(row.play_count for row in rows)
+            return {"items": [
+                {"genre_id": row.genre_id, "genre": row.name, "play_count": row.play_count,
+                 "share": row.play_count / total}
+                for row in rows
+            ]}
+
+        return self.cache.get_or_compute(("genre_mix", user_id), compute)
+
+
+class HistoryItem(BaseModel):
+    id: int
+    track_id: int
+    name: str
+    artist: str
+    listened_at: datetime
+
+
+class HistoryPage(BaseModel):
+    user_id: int
+    items: List[HistoryItem]
+    next_cursor: Optional[str]
+
+
+class RankedTrack(BaseModel):
+    track_id: int
+    name: str
+    artist: str
+    play_count: int
+
+
+class TopTracksPage(BaseModel):
+    genre_id: int
+    items: List[RankedTrack]
+    next_cursor: Optional[str]
+
+
+class GenreShare(BaseModel):
+    genre_id: int
+    genre: str
+    play_count: int
+    share: float
+
+
+class GenreMix(BaseModel):
+    user_id: int
+    items: List[GenreShare]
+
+
+def get_store(request: Request) -> AnalyticsStore:
+    return request.app.state.analytics
+
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+
+@router.get("/users/{user_id}/history")
+def user_history(
+    user_id: int,
+    start: datetime = Query(MIN_DATETIME, description="First listen time included"),
+    end: datetime = Query(MAX_DATETIME, description="Listen time excluded"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    store: AnalyticsStore = Depends(get_store),
+) -> HistoryPage:
+    return HistoryPage(user_id=user_id, **store.user_history(user_id, start, end, limit, cursor))
+
+
+@router.get("/genres/{genre_id}/top-tracks")
+def genre_top_tracks(
+    genre_id: int,
+    since: date = Query(MIN_DAY, description="First day included"),
+    until: date = Query(MAX_DAY, description="Last day included"),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    store: AnalyticsStore = Depends(get_store),
+) -> TopTracksPage:
+    return TopTracksPage(genre_id=genre_id, **store.genre_top_tracks(genre_id, since, until, limit, cursor))
+
+
+@router.get("/users/{user_id}/genres")
+def user_genre_mix(user_id: int, store: AnalyticsStore = Depends(get_store)) -> GenreMix:
+    return GenreMix(user_id=user_id, **store.user_genre_mix(user_id))
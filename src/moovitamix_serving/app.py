@@ -0,0 +1,93 @@
+"""
+Read-side API of the pipeline's database: recommendations and analytics served from in-process caches.
+
+Usage:
+    python -m uvicorn src.moovitamix_serving.app:create_app --factory --port 8002
+"""
+
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_serving.analytics import AnalyticsStore, router as analytics_router
+from src.moovitamix_serving.cache import TTLCache
+from src.moovitamix_serving.recommendations import RecommendationStore, router as recommendations_router
+
+
+def create_app(
+    db_config: Optional[DatabaseConfig] = None,
+    cache_size: Optional[int] = None,
+    cache_ttl: Optional[float] = None,
+    refresh_interval: Optional[float] = None,
+    warmup_users: Optional[int] = None,
+    warmup_tracks: Optional[int] = None,
+    analytics_cache_ttl: Optional[float] = None,
+) -> FastAPI:
+    """
+    Create the serving app; settings left to None come from the SERVING_* environment variables.
+
+    Args:
+        db_config (DatabaseConfig, optional): database loaded by the pipeline. Defaults to the DB_* variables.
+        cache_size (int, optional): lists kept in the cache (SERVING_CACHE_SIZE, 100000).
+        cache_ttl (float, optional): lifetime of a cached list in seconds (SERVING_CACHE_TTL, 3600).
+        refresh_interval (float, optional): seconds between checks for published aggregates (SERVING_REFRESH_SECONDS, 30).
+        warmup_users (int, optional): most active users computed on start (SERVING_WARMUP_USERS, 1000).
+        warmup_tracks (int, optional): most played tracks computed on start (SERVING_WARMUP_TRACKS, 1000).
+        analytics_cache_ttl (float, optional): lifetime of a cached analytics page in seconds (SERVING_ANALYTICS_CACHE_TTL, 10).
+
+    """
+    db_config = db_config or DatabaseConfig()
+    cache = TTLCache(
+        maxsize=cache_size or int(os.getenv("SERVING_CACHE_SIZE", "100000")),
+        ttl=cache_ttl or float(os.getenv("SERVING_CACHE_TTL", "3600")),
+    )
+    store = RecommendationStore(
+        db_config,
+        cache,
+        warmup_users=warmup_users if warmup_users is not None else int(os.getenv("SERVING_WARMUP_USERS", "1000")),
+        warmup_tracks=warmup_tracks if warmup_tracks is not None else int(os.getenv("SERVING_WARMUP_TRACKS", "1000")),
+    )
+    analytics = AnalyticsStore(
+        db_config,
+        TTLCache(
+            maxsize=cache_size or int(os.getenv("SERVING_CACHE_SIZE", "100000")),
+            ttl=analytics_cache_ttl or float(os.getenv("SERVING_ANALYTICS_CACHE_TTL", "10")),
+        ),
+    )
+    interval = refresh_interval or float(os.getenv("SERVING_REFRESH_SECONDS", "30"))
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Warm up before accepting requests, then follow the pipeline runs
+        await run_in_threadpool(store.check_published)
+        store.watch(interval)
+        yield
+        store.stop()
+        db_config.dispose_engine()
+
+    app = FastAPI(
+        title="MooVitamix recommendations",
+        description="Recommendations and analytics computed by the MooVitamix ETL pipeline.",
+        version="1.0",
+        lifespan=lifespan,
+    )
+    app.state.recommendations = store
+    app.state.analytics = analytics
+    app.include_router(recommendations_router)
+    app.include_router(analytics_router)
+
+    @app.get("/health", tags=["Health"])
+    async def health(request: Request) -> dict:
+        store = request.app.state.recommendations
+        return {
+            "status": "ok",
+            "published": store.published,
+            "cache": store.cache.stats(),
+            "analytics_cache": request.app.state.analytics.cache.stats(),
+        }
+
+    return app
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire `ttl` seconds after being stored
+
+    Args:
+        maxsize (int, optional): entries kept, the least recently used evicted first. Defaults to 10000.
+        ttl (float, optional): lifetime of an entry in seconds. Defaults to 300.
+        clock (Callable, optional): time source, in seconds. Defaults to time.monotonic.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        if maxsize < 1:
+            raise ValueError("The cache must hold at least one entry")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Incremented by clear, so values computed before a clear are not stored after it
+        self._generation = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Cached value of `key`, computed and stored on a miss
+
+        The lock is not held while computing, so concurrent misses on the same key
+        may compute it more than once; the last value computed is kept, unless the
+        cache was cleared meanwhile.
+        """
+        missing = object()
+        generation = self._generation
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value, generation)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
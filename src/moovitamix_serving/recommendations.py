@@ -0,0 +1,204 @@
+"""
+Per-user recommendations and similar tracks, served from the tables the pipeline precomputes.
+"""
+
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel
+from sqlalchemy import bindparam, func, select
+
+from src.moovitamix_etl.load.aggregates import PUBLISHED
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import DailyTrackPlays, TrackSimilarity, UserTrackPlays
+
+# Items computed and cached per user or track; requests ask for up to this many
+MAX_ITEMS = 50
+
+_plays = UserTrackPlays.__table__
+_similarity = TrackSimilarity.__table__
+_daily = DailyTrackPlays.__table__
+
+# Tracks similar to the ones a user listened to, weighted by play count, minus the ones already listened
+_score = func.sum(_plays.c.play_count * _similarity.c.score).label("score")
+USER_RECOMMENDATIONS = (
+    select(_similarity.c.similar_track_id, _score)
+    .select_from(_plays.join(_similarity, _similarity.c.track_id == _plays.c.track_id))
+    .where(
+        _plays.c.user_id == bindparam("user_id"),
+        _similarity.c.similar_track_id.not_in(
+            select(_plays.c.track_id).where(_plays.c.user_id == bindparam("user_id"))
+        ),
+    )
+    .group_by(_similarity.c.similar_track_id)
+    .order_by(_score.desc(), _similarity.c.similar_track_id)
+    .limit(MAX_ITEMS)
+)
+
+SIMILAR_TRACKS = (
+    select(_similarity.c.similar_track_id, _similarity.c.score)
+    .where(_similarity.c.track_id == bindparam("track_id"))
+    .order_by(_similarity.c.position)
+    .limit(MAX_ITEMS)
+)
+
+_total = func.sum(_daily.c.play_count).label("plays")
+POPULAR_TRACKS = (
+    select(_daily.c.track_id, _total)
+    .group_by(_daily.c.track_id)
+    .order_by(_total.desc(), _daily.c.track_id)
+    .limit(MAX_ITEMS)
+)
+
+_user_plays = func.sum(_plays.c.play_count)
+MOST_ACTIVE_USERS = (
+    select(_plays.c.user_id).group_by(_plays.c.user_id)
+    .order_by(_user_plays.desc(), _plays.c.user_id).limit(bindparam("limit"))
+)
+MOST_PLAYED_TRACKS = (
+    select(_plays.c.track_id).group_by(_plays.c.track_id)
+    .order_by(_user_plays.desc(), _plays.c.track_id).limit(bindparam("limit"))
+)
+
+
+class RecommendationStore:
+    """Read the precomputed recommendations, through an in-process LRU and TTL cache
+
+    Recommendations of a user combine the `track_similarity` rows of the tracks they
+    listened to (`user_track_plays`); users without any fall back to the most played
+    tracks (`daily_track_plays`). The cache is cleared and warmed up again whenever
+    the pipeline publishes new aggregates (see `ETLPipeline._publish`), which `watch`
+    polls for in a background thread.
+
+    Args:
+        db_config (DatabaseConfig): database the pipeline loads.
+        cache (TTLCache): cache of the computed lists.
+        warmup_users (int, optional): most active users computed on warmup. Defaults to 1000.
+        warmup_tracks (int, optional): most played tracks computed on warmup. Defaults to 1000.
+    """
+
+    def __init__(self, db_config: DatabaseConfig, cache, warmup_users: int = 1000, warmup_tracks: int = 1000):
+        self.db_config = db_config
+        self.cache = cache
+        self.warmup_users = warmup_users
+        self.warmup_tracks = warmup_tracks
+        # Run id of the aggregates in the cache, None before any publication
+        self.published: Optional[str] = None
+        self._checked = False
+        self.logger = logging.getLogger(__name__)
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    def _rows(self, statement, **params) -> List[Tuple[int, float]]:
+        with self.db_config.engine.connect() as conn:
+            return [(int(track_id), float(score)) for track_id, score in conn.execute(statement, params)]
+
+    def popular_tracks(self) -> List[Tuple[int, float]]:
+        return self.cache.get_or_compute(("popular",), lambda: self._rows(POPULAR_TRACKS))
+
+    def recommendations(self, user_id: int) -> Tuple[str, List[Tuple[int, float]]]:
+        """Source ("similar" or "popular") and scored tracks recommended to a user"""
+        def compute():
+            items = self._rows(USER_RECOMMENDATIONS, user_id=user_id)
+            return ("similar", items) if items else ("popular", self.popular_tracks())
+        return self.cache.get_or_compute(("user", user_id), compute)
+
+    def similar_tracks(self, track_id: int) -> List[Tuple[int, float]]:
+        return self.cache.get_or_compute(("track", track_id), lambda: self._rows(SIMILAR_TRACKS, track_id=track_id))
+
+    def warmup(self) -> int:
+        """Compute the lists of the most active users and most played tracks, return how many"""
+        with self.db_config.engine.connect() as conn:
+            users = conn.execute(MOST_ACTIVE_USERS, {"limit": self.warmup_users}).scalars().all()
+            tracks = conn.execute(MOST_PLAYED_TRACKS, {"limit": self.warmup_tracks}).scalars().all()
+        self.popular_tracks()
+        for user_id in users:
+            self.recommendations(user_id)
+        for track_id in tracks:
+            self.similar_tracks(track_id)
+        self.logger.info(f"Warmed up the recommendations of {len(users)} users and {len(tracks)} tracks")
+        return len(users) + len(tracks)
+
+    def check_published(self) -> bool:
+        """Clear and warm up the cache when new aggregates were published, tell whether they were"""
+        version = self.db_config.get_state(PUBLISHED)
+        if self._checked and version == self.published:
+            return False
+        if self._checked:
+            self.logger.info(f"Aggregates of run {version} published, invalidating the cache")
+        self.cache.clear()
+        self.published = version
+        self._checked = True
+        self.warmup()
+        return True
+
+    def watch(self, interval: float) -> None:
+        """Check for published aggregates every `interval` seconds in a background thread"""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.check_published()
+                except Exception as e:
+                    self.logger.error(f"Failed to check the published aggregates: {str(e)}")
+
+        self._watcher = threading.Thread(target=run, name="recommendations-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+
+
+class ScoredTrack(BaseModel):
+    track_id: int
+    score: float
+
+
+class UserRecommendations(BaseModel):
+    user_id: int
+    source: str
+    items: List[ScoredTrack]
+
+
+class SimilarTracks(BaseModel):
+    track_id: int
+    items: List[ScoredTrack]
+
+
+def get_store(request: Request) -> RecommendationStore:
+    return request.app.state.recommendations
+
+
+router = APIRouter(prefix="/recommendations", tags=["Recommendations"])
+
+
+@router.get("/users/{user_id}")
+def recommend_tracks(
+    user_id: int,
+    n: int = Query(10, ge=1, le=MAX_ITEMS),
+    store: RecommendationStore = Depends(get_store),
+) -> UserRecommendations:
+    source, items = store.recommendations(user_id)
+    return UserRecommendations(
+        user_id=user_id,
+        source=source,
+        items=[ScoredTrack(track_id=track_id, score=score) for track_id, score in items[:n]],
+    )
+
+
+@router.get("/tracks/{track_id}/similar")
+def similar_tracks(
+    track_id: int,
+    n: int = Query(10, ge=1, le=MAX_ITEMS),
+    store: RecommendationStore = Depends(get_store),
+) -> SimilarTracks:
+    items = store.similar_tracks(track_id)
+    if not items:
+        raise HTTPException(status_code=404, detail=f"No similar tracks for track {track_id}")
+    return SimilarTracks(
+        track_id=track_id,
+        items=[ScoredTrack(track_id=other_id, score=score) for other_id, score in items[:n]],
+    )
@@ -0,0 +1,82 @@
+import tempfile
+import unittest
+from collections import Counter
+from benchmarks.datasets import SyntheticDataset
+from benchmarks.run_benchmarks import serve_dataset
+from src.moovitamix_etl.extract.resources import RESOURCES
+from src.moovitamix_etl.load.aggregates import PUBLISHED
+from src.moovitamix_etl.load.data_loader import DataLoader
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import (
+    DailyTrackPlays, ListenHistory, Track, UserGenrePlays, UserTrackPlays
+)
+from src.moovitamix_etl.pipeline import ETLPipeline
+from src.moovitamix_etl.sharding import load_phases
+from src.moovitamix_etl.transform.data_transformer import DataTransformer
+
+
+def aggregates(db_config):
+    with db_config.get_session() as session:
+        return {
+            'user_track': {(a.user_id, a.track_id): a.play_count for a in session.query(UserTrackPlays)},
+            'user_genre': {(a.user_id, a.genre_id): a.play_count for a in session.query(UserGenrePlays)},
+            'daily_track': {(a.day, a.track_id): a.play_count for a in session.query(DailyTrackPlays)},
+        }
+
+
+def recomputed(db_config):
+    """Aggregates counted from scratch from the listen history"""
+    with db_config.get_session() as session:
+        genres = {track.id: [genre.id for genre in track.genres] for track in session.query(Track)}
+        events = session.query(ListenHistory).all()
+        return {
+            'user_track': dict(Counter((e.user_id, e.track_id) for e in events)),
+            'user_genre': dict(Counter((e.user_id, g) for e in events for g in genres[e.track_id])),
+            'daily_track': dict(Counter((e.listened_at.date(), e.track_id) for e in events)),
+        }
+
+
+class TestAggregates(unittest.TestCase):
+    """Essential test cases for the incrementally maintained aggregates"""
+
+    def test_incremental_loads_match_full_recount(self):
+        """Each load adds its new events once, on the ORM and Core paths"""
+        dataset = SyntheticDataset(400, seed=12)
+        history = dataset.dtos('listen_history')
+        with tempfile.TemporaryDirectory() as tmp:
+            for core in (False, True):
+                db_config = DatabaseConfig(url=f"sqlite:///{tmp}/aggregates_{core}.db")
+                db_config.init_database()
+                # Two runs with the same tracks and users, each bringing half of the listen history
+                for part in (history[:len(history) // 2], history[len(history) // 2:]):
+                    tracks, users, listen_history, genres = DataTransformer().transform_all(
+                        dataset.dtos('tracks'), dataset.dtos('users'), part
+                    )
+                    loader = DataLoader(db_config=db_config, core=core, aggregates=True)
+                    self.assertTrue(loader.load_all(tracks, users, listen_history, genres))
+
+                    self.assertEqual(aggregates(db_config), recomputed(db_config))
+                self.assertEqual(sum(aggregates(db_config)['user_track'].values()), dataset.listen_events)
+                db_config.dispose_engine()
+
+    def test_multi_node_shards_are_finalized(self):
+        """Shards run on several machines leave the aggregates to the finalize step"""
+        dataset = SyntheticDataset(600, seed=13)
+        with tempfile.TemporaryDirectory() as tmp, serve_dataset(dataset) as api_url:
+            db_config = DatabaseConfig(url=f"sqlite:///{tmp}/shards.db")
+            db_config.init_database()
+            options = dict(api_url=api_url, db_url=db_config.database_url, page_size=25, aggregates=True)
+            for phase in load_phases(RESOURCES):
+                for index in range(2):
+                    self.assertTrue(ETLPipeline(shards=2, shard_index=index, resources=phase, **options).run())
+            self.assertFalse(aggregates(db_config)['user_track'])
+
+            self.assertTrue(ETLPipeline(**options).finalize())
+            self.assertEqual(aggregates(db_config), recomputed(db_config))
+            self.assertEqual(sum(aggregates(db_config)['user_track'].values()), dataset.listen_events)
+            self.assertIsNotNone(db_config.get_state(PUBLISHED))
+            db_config.dispose_engine()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import tempfile
+import unittest
+from collections import Counter
+import requests
+from sqlalchemy import select
+from benchmarks.datasets import SyntheticDataset
+from benchmarks.run_benchmarks import serve_app
+from benchmarks.serving_benchmark import prepare_database
+from src.moovitamix_etl.load.model.model import DailyTrackPlays, ListenHistory, track_genres
+from src.moovitamix_serving.analytics import USER_HISTORY
+from src.moovitamix_serving.app import create_app
+
+
+def read_pages(api_url, path, **params):
+    """Items of every page of a paginated endpoint"""
+    items, cursor = [], None
+    while True:
+        body = requests.get(api_url + path, params=dict(params, cursor=cursor)).json()
+        items += body['items']
+        cursor = body['next_cursor']
+        if cursor is None:
+            return items
+
+
+class TestAnalytics(unittest.TestCase):
+    """Essential test cases for the analytics API"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.db_config = prepare_database(SyntheticDataset(1500, seed=4, items_per_user=5), cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db_config.dispose_engine()
+        cls.tmp.cleanup()
+
+    def test_history_query_reads_the_user_index(self):
+        """The history of a user is a range of its (user_id, listened_at, id) index"""
+        sql = str(USER_HISTORY.compile(self.db_config.engine))
+        with self.db_config.engine.connect() as conn:
+            plan = ' '.join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", (1, '9999', '1970', 0, 10, 0)))
+
+        self.assertIn('ix_listen_history_user_listened', plan)
+        self.assertNotIn('SCAN listen_history', plan)
+
+    def test_pages_cover_results_in_order(self):
+        """Keyset pages of the history and top tracks concatenate to the full results"""
+        with self.db_config.engine.connect() as conn:
+            user_id = conn.execute(select(ListenHistory.user_id)).scalars().first()
+            history = conn.execute(
+                select(ListenHistory.id).where(ListenHistory.user_id == user_id)
+                .order_by(ListenHistory.listened_at, ListenHistory.id)
+            ).scalars().all()
+            genre_id = conn.execute(select(track_genres.c.genre_id)).scalars().first()
+            genre_tracks = set(conn.execute(
+                select(track_genres.c.track_id).where(track_genres.c.genre_id == genre_id)
+            ).scalars())
+            plays = Counter()
+            for track_id, count in conn.execute(select(DailyTrackPlays.track_id, DailyTrackPlays.play_count)):
+                if track_id in genre_tracks:
+                    plays[track_id] += count
+
+        app = create_app(self.db_config, warmup_users=0, warmup_tracks=0)
+        with serve_app(app) as api_url:
+            items = read_pages(api_url, f"/analytics/users/{user_id}/history", limit=2)
+            self.assertEqual([item['id'] for item in items], history)
+
+            middle = items[len(items) // 2]['listened_at']
+            ranged = read_pages(api_url, f"/analytics/users/{user_id}/history", limit=1, start=middle)
+            self.assertEqual(ranged, [item for item in items if item['listened_at'] >= middle])
+
+            top = read_pages(api_url, f"/analytics/genres/{genre_id}/top-tracks", limit=3)
+            expected = sorted(plays.items(), key=lambda item: (-item[1], item[0]))
+            self.assertEqual([(item['track_id'], item['play_count']) for item in top], expected)
+
+            mix = requests.get(f"{api_url}/analytics/users/{user_id}/genres").json()['items']
+            self.assertAlmostEqual(sum(item['share'] for item in mix), 1.0)
+            self.assertEqual([item['play_count'] for item in mix], sorted((item['play_count'] for item in mix), reverse=True))
+
+            response = requests.get(f"{api_url}/analytics/users/{user_id}/history", params={'cursor': 'bad'})
+            self.assertEqual(response.status_code, 400)
+            requests.get(f"{api_url}/analytics/users/{user_id}/genres")
+            self.assertGreaterEqual(requests.get(f"{api_url}/health").json()['analytics_cache']['hits'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+import pyarrow.csv
+from benchmarks.datasets import SyntheticDataset
+from benchmarks.run_benchmarks import serve_dataset
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import Genre, ListenHistory, Track, User
+from src.moovitamix_etl.pipeline import ETLPipeline
+from src.moovitamix_etl.transform.columnar import TABLES
+
+
+class TestArrowPipeline(unittest.TestCase):
+    """Essential test cases for the Arrow tables exchanged between phases"""
+
+    def test_arrow_run_loads_same_data_as_object_run(self):
+        """Arrow tables load the same rows and genres as the per-row objects, twice idempotently"""
+        dataset = SyntheticDataset(1000, seed=3)
+        databases = {}
+        with tempfile.TemporaryDirectory() as tmp, serve_dataset(dataset) as api_url:
+            for arrow, runs in ((False, 1), (True, 2)):
+                db_config = DatabaseConfig(url=f"sqlite:///{tmp}/arrow_{arrow}.db")
+                db_config.init_database()
+                for _ in range(runs):
+                    pipeline = ETLPipeline(
+                        streaming=not arrow,
+                        page_size=50,
+                        api_url=api_url,
+                        db_url=db_config.database_url,
+                        arrow=arrow
+                    )
+                    self.assertTrue(pipeline.run())
+                with db_config.get_session() as session:
+                    databases[arrow] = {
+                        'tracks': sorted((t.id, t.name, t.duration, sorted(g.name for g in t.genres))
+                                         for t in session.query(Track)),
+                        'users': sorted((u.id, u.email, sorted(g.name for g in u.favorite_genres))
+                                        for u in session.query(User)),
+                        'genres': sorted(g.name for g in session.query(Genre)),
+                        'listen_history': session.query(ListenHistory).count(),
+                    }
+                db_config.dispose_engine()
+
+        # Loading the same data again updates rows, listen events are appended
+        self.assertEqual(databases[True]['listen_history'], 2 * databases[False]['listen_history'])
+        databases[True]['listen_history'] = databases[False]['listen_history']
+        self.assertEqual(databases[True], databases[False])
+        self.assertEqual(databases[False]['listen_history'], dataset.listen_events)
+
+    def test_bulk_export_into_csv(self):
+        """Tables read from the export endpoints are written as one CSV file per table"""
+        dataset = SyntheticDataset(500, seed=5)
+        with tempfile.TemporaryDirectory() as tmp, serve_dataset(dataset) as api_url:
+            pipeline = ETLPipeline(into_csv=True, csv_folder=tmp, api_url=api_url, arrow=True, bulk_export=True)
+            self.assertTrue(pipeline.run())
+            files = {name.rsplit('_', 2)[0]: name for name in os.listdir(tmp)}
+            self.assertEqual(sorted(files), sorted(TABLES))
+            listen_history = pyarrow.csv.read_csv(os.path.join(tmp, files['listen_history']))
+            tracks = pyarrow.csv.read_csv(os.path.join(tmp, files['tracks']))
+        self.assertEqual(listen_history.num_rows, dataset.listen_events)
+        self.assertEqual(tracks.num_rows, len(dataset.tracks))
+        self.assertEqual(pipeline.metrics.stages['extract'].rows, 2 * len(dataset.users) + len(dataset.tracks))
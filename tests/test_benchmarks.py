@@ -0,0 +1,45 @@
+import unittest
+from benchmarks.datasets import SyntheticDataset
+from benchmarks.run_benchmarks import run_scale
+
+
+class TestBenchmarks(unittest.TestCase):
+    """Essential test cases for the benchmark suite"""
+
+    def test_dataset_is_deterministic(self):
+        """The same seed gives the same rows, another seed different ones"""
+        first = SyntheticDataset(1000, seed=7)
+        second = SyntheticDataset(1000, seed=7)
+        other = SyntheticDataset(1000, seed=8)
+
+        self.assertEqual(first.listen_history[10:20], second.listen_history[10:20])
+        self.assertEqual(first.users[-1], second.users[-1])
+        self.assertNotEqual(first.tracks[0:10], other.tracks[0:10])
+
+    def test_dataset_shape(self):
+        """Every user has one listen history entry referencing existing tracks"""
+        dataset = SyntheticDataset(1000)
+        track_ids = {track['id'] for track in dataset.tracks[:]}
+        user_ids = {user['id'] for user in dataset.users[:]}
+
+        self.assertEqual(len(dataset.users), 200)
+        self.assertEqual(len(user_ids), 200)
+        self.assertEqual(sum(len(h['items']) for h in dataset.listen_history[:]), 1000)
+        self.assertTrue(all(set(h['items']) <= track_ids for h in dataset.listen_history[:]))
+        self.assertEqual({h['user_id'] for h in dataset.listen_history[:]}, user_ids)
+
+    def test_transform_and_load_into_sqlite(self):
+        """A small scale runs transform and load end to end on SQLite"""
+        result = run_scale(500, seed=1, stages=['transform', 'load'], db_url=None, reset_db=False)
+
+        self.assertEqual(result['stages']['load.listen_history']['rows'], 500)
+        self.assertGreater(result['stages']['load']['db_statements'], 0)
+        self.assertGreater(result['stages']['transform']['rows_per_second'], 0)
+
+    def test_parallel_stage_reports_speedups(self):
+        """The parallel stage loads the worker tables and is compared with the serial stages"""
+        result = run_scale(500, seed=1, stages=['transform', 'load', 'parallel'], db_url=None, reset_db=False)
+
+        self.assertEqual(result['stages']['transform.parallel']['rows'], result['stages']['transform.pool_start']['rows'])
+        self.assertEqual(result['stages']['load.tables']['rows'], result['stages']['transform.parallel']['rows'])
+        self.assertEqual(set(result['speedups']), {'transform', 'transform_load'})
@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import patch
+import json
+import os
+import tempfile
+from benchmarks.datasets import SyntheticDataset
+from benchmarks.run_benchmarks import serve_dataset
+from src.moovitamix_etl.checkpoint import Checkpoint
+from src.moovitamix_etl.load.data_loader import DataLoader
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import ListenHistory, Track, User
+from src.moovitamix_etl.pipeline import ETLPipeline
+
+
+class TestCheckpointResume(unittest.TestCase):
+    """Essential test cases for checkpointing and resuming streaming runs"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dataset = SyntheticDataset(1500, seed=9)
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.db_url = f"sqlite:///{tmp.name}/etl.db"
+        self.checkpoint_file = os.path.join(tmp.name, "checkpoint.json")
+        self.db_config = DatabaseConfig(url=self.db_url)
+        self.db_config.init_database()
+        self.addCleanup(self.db_config.dispose_engine)
+
+    def pipeline(self, api_url, resume):
+        return ETLPipeline(
+            streaming=True,
+            page_size=50,
+            api_url=api_url,
+            db_url=self.db_url,
+            checkpoint_file=self.checkpoint_file,
+            resume=resume
+        )
+
+    def test_failed_run_resumes_after_last_committed_page(self):
+        """A run failing on a listen history batch is resumed without reloading anything"""
+        original = DataLoader._load_listen_history
+        calls = []
+
+        def fail_on_fourth_batch(loader, session, listen_history):
+            calls.append(len(listen_history))
+            if len(calls) == 4:
+                raise RuntimeError("bad batch")
+            return original(loader, session, listen_history)
+
+        with serve_dataset(self.dataset) as api_url:
+            with patch.object(DataLoader, '_load_listen_history', fail_on_fourth_batch):
+                with self.assertRaises(RuntimeError):
+                    self.pipeline(api_url, resume=False).run()
+
+            with open(self.checkpoint_file) as f:
+                state = json.load(f)
+            # Remapped ids are resolved through the id aliases of the database
+            self.assertEqual(set(state), {'page_size', 'resources'})
+            progress = state['resources']
+            self.assertEqual(progress['tracks']['load'], 3)
+            self.assertEqual(progress['users']['load'], 6)
+            self.assertEqual(progress['listen_history']['load'], 3)
+            self.assertGreaterEqual(progress['listen_history']['extract'], 4)
+
+            resumed = self.pipeline(api_url, resume=True)
+            self.assertTrue(resumed.run())
+
+        # Only the listen history pages 4 to 6 were extracted again
+        self.assertEqual(resumed.metrics.stages['extract'].rows, 150)
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+        with self.db_config.get_session() as session:
+            self.assertEqual(session.query(ListenHistory).count(), self.dataset.listen_events)
+            self.assertEqual(session.query(User).count(), len(self.dataset.users))
+            self.assertLessEqual(session.query(Track).count(), len(self.dataset.tracks))
+
+    def test_resume_requires_same_page_size(self):
+        """Pages of another size would not line up with the recorded progress"""
+        checkpoint = Checkpoint(self.checkpoint_file, page_size=50)
+        checkpoint.mark_loaded('tracks', 2)
+        with self.assertRaises(ValueError):
+            Checkpoint.load(self.checkpoint_file, page_size=100)
+        restored = Checkpoint.load(self.checkpoint_file, page_size=50)
+        self.assertEqual(restored.start_pages(), {'tracks': 3})
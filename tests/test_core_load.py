@@ -0,0 +1,53 @@
+import tempfile
+import unittest
+from sqlalchemy import inspect
+from benchmarks.datasets import SyntheticDataset
+from src.moovitamix_etl.checkpoint import Checkpoint
+from src.moovitamix_etl.load.data_loader import DataLoader
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import Genre, ListenHistory, Track, User
+from src.moovitamix_etl.transform.data_transformer import DataTransformer
+
+
+def database_content(db_config):
+    with db_config.get_session() as session:
+        return {
+            'tracks': sorted((t.id, t.name, t.album, sorted(g.name for g in t.genres)) for t in session.query(Track)),
+            'users': sorted((u.id, u.email, sorted(g.name for g in u.favorite_genres)) for u in session.query(User)),
+            'genres': sorted(g.name for g in session.query(Genre)),
+            'listen_history': sorted((h.user_id, h.track_id) for h in session.query(ListenHistory)),
+        }
+
+
+class TestCoreLoad(unittest.TestCase):
+    """Essential test cases for the Core load path"""
+
+    def test_core_load_matches_orm_load(self):
+        """Core executemany batches load the same rows as the ORM session, without attaching objects"""
+        dataset = SyntheticDataset(600, seed=9)
+        contents = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for core in (False, True):
+                tracks, users, listen_history, genres = DataTransformer().transform_all(
+                    dataset.dtos('tracks'), dataset.dtos('users'), dataset.dtos('listen_history')
+                )
+                db_config = DatabaseConfig(url=f"sqlite:///{tmp}/core_{core}.db")
+                db_config.init_database()
+                loader = DataLoader(db_config=db_config, core=core, batch_size=40)
+                self.assertTrue(loader.load_all(tracks, users, listen_history, genres))
+                contents[core] = database_content(db_config)
+                db_config.dispose_engine()
+
+                if core:
+                    self.assertTrue(inspect(tracks[0]).transient)
+                    self.assertTrue(inspect(genres[0]).transient)
+
+        self.assertEqual(contents[True], contents[False])
+        self.assertEqual(len(contents[True]['listen_history']), dataset.listen_events)
+
+    def test_core_load_rejects_checkpoints(self):
+        """The Core path commits once, so it cannot record per page progress"""
+        with tempfile.TemporaryDirectory() as tmp:
+            loader = DataLoader(db_config=DatabaseConfig(url=f"sqlite:///{tmp}/x.db"), core=True)
+            with self.assertRaises(ValueError):
+                loader.load_stream([], checkpoint=Checkpoint(f"{tmp}/checkpoint.json", 100))
@@ -0,0 +1,78 @@
+import json
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+import requests
+from benchmarks.datasets import SyntheticDataset
+from benchmarks.run_benchmarks import serve_dataset
+from src.moovitamix_etl.daemon import EtlDaemon
+from src.moovitamix_etl.load.model.model import ListenHistory, Track
+from src.moovitamix_etl.pipeline import ETLPipeline
+from src.moovitamix_etl.scheduler import CronSchedule, IntervalSchedule
+
+
+class TestScheduler(unittest.TestCase):
+    """Essential test cases for the run schedules"""
+
+    def test_cron_next_run_times(self):
+        """Cron expressions match like cron, day of month or day of week"""
+        weekdays = CronSchedule("30 2 * * 1-5")
+        # Friday 2026-10-16 03:00 -> Monday 02:30
+        self.assertEqual(weekdays.next_after(datetime(2026, 10, 16, 3, 0)), datetime(2026, 10, 19, 2, 30))
+        self.assertEqual(CronSchedule("*/15 * * * *").next_after(datetime(2026, 1, 1, 0, 14, 59)), datetime(2026, 1, 1, 0, 15))
+        self.assertEqual(CronSchedule("0 0 29 2 *").next_after(datetime(2026, 3, 1)), datetime(2028, 2, 29))
+        self.assertEqual(CronSchedule("0 0 1 * 7").next_after(datetime(2026, 3, 2)), datetime(2026, 3, 8))
+        with self.assertRaises(ValueError):
+            CronSchedule("61 * * * *")
+        with self.assertRaises(ValueError):
+            IntervalSchedule(0)
+
+
+class TestDaemon(unittest.TestCase):
+    """Essential test cases for the daemon mode"""
+
+    def test_scheduled_runs_reuse_warm_state(self):
+        """Runs follow the interval, reuse the extractor and engine, and are reported by /health and /metrics"""
+        dataset = SyntheticDataset(300, seed=8)
+        with tempfile.TemporaryDirectory() as tmp, serve_dataset(dataset) as api_url:
+            pipeline = ETLPipeline(
+                streaming=True,
+                page_size=50,
+                api_url=api_url,
+                db_url=f"sqlite:///{tmp}/daemon.db",
+                keep_warm=True
+            )
+            pipeline._database_config().init_database()
+            daemon = EtlDaemon(pipeline, IntervalSchedule(0.2), port=0, run_on_start=True)
+            thread = threading.Thread(target=daemon.serve)
+            thread.start()
+            try:
+                deadline = time.time() + 30
+                while daemon.runs < 2 and time.time() < deadline:
+                    time.sleep(0.05)
+                extractor = pipeline._warm['extractor']
+                engine = pipeline._database_config().engine
+
+                health = requests.get(f"{daemon.address}/health", timeout=5)
+                metrics = requests.get(f"{daemon.address}/metrics", timeout=5).text
+            finally:
+                daemon.stop()
+                thread.join(timeout=30)
+
+            self.assertFalse(thread.is_alive())
+            self.assertGreaterEqual(daemon.runs, 2)
+            self.assertEqual(daemon.failures, 0)
+            self.assertEqual(health.status_code, 200)
+            self.assertEqual(json.loads(health.text)['status'], 'ok')
+            self.assertIn('moovitamix_etl_daemon_runs_total', metrics)
+            self.assertIn('moovitamix_etl_stage_rows{stage="extract"}', metrics)
+            # The same HTTP session and engine served every run
+            self.assertIs(pipeline._create_extractor(), extractor)
+            self.assertIs(pipeline._database_config().engine, engine)
+            with pipeline._database_config().get_session() as session:
+                self.assertEqual(session.query(Track).count(), len(dataset.tracks))
+                # Every run appended its listen events, resolved with the warm id mappings
+                self.assertEqual(session.query(ListenHistory).count(), daemon.runs * dataset.listen_events)
+            pipeline._database_config().dispose_engine()
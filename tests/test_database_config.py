@@ -0,0 +1,38 @@
+import tempfile
+import unittest
+from sqlalchemy import insert, select
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import Genre
+from src.moovitamix_etl.pipeline import ETLPipeline
+
+
+class TestDatabaseConfig(unittest.TestCase):
+    """Essential test cases for the connection pool and streamed queries"""
+
+    def test_stream_query_yields_every_row(self):
+        """Rows are streamed in batches, in query order, with bound parameters"""
+        with tempfile.TemporaryDirectory() as tmp:
+            db_config = DatabaseConfig(url=f"sqlite:///{tmp}/stream.db")
+            db_config.init_database()
+            with db_config.engine.begin() as conn:
+                conn.execute(insert(Genre.__table__), [{'name': f"genre {i:04d}"} for i in range(2500)])
+
+            rows = list(db_config.stream_query(select(Genre.id, Genre.name).order_by(Genre.name), batch_size=300))
+            self.assertEqual(len(rows), 2500)
+            self.assertEqual(rows[0].name, "genre 0000")
+            self.assertEqual(rows[-1].name, "genre 2499")
+
+            # Closing the generator early gives its connection back to the pool
+            stream = db_config.stream_query(select(Genre.id), batch_size=10)
+            next(stream)
+            stream.close()
+            self.assertEqual(db_config.engine.pool.checkedout(), 0)
+            db_config.dispose_engine()
+
+    def test_pool_settings_from_options(self):
+        """Pipeline options override the DB_POOL_* defaults of the database config"""
+        pipeline = ETLPipeline(db_url="mysql+pymysql://u:p@localhost/db", db_pool_size=16, db_max_overflow=4)
+        db_config = pipeline._database_config()
+        self.assertEqual(db_config.engine.pool.size(), 16)
+        self.assertEqual(db_config.engine.pool._max_overflow, 4)
+        self.assertTrue(db_config.engine.pool._pre_ping)
@@ -0,0 +1,34 @@
+import unittest
+import gzip
+import json
+from benchmarks.datasets import SyntheticDataset
+from benchmarks.run_benchmarks import serve_dataset
+from src.moovitamix_etl.extract.extractor import Extractor
+from src.moovitamix_fastapi.export import iter_gzip, iter_ndjson
+
+
+class TestBulkExport(unittest.TestCase):
+    """Essential test cases for the streamed NDJSON exports"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dataset = SyntheticDataset(2500, seed=3)
+
+    def test_ndjson_gzip_stream(self):
+        """Chunks compressed separately form a single valid gzip stream"""
+        rows = self.dataset.users
+        body = b"".join(iter_gzip(iter_ndjson(rows, batch_size=64)))
+
+        lines = gzip.decompress(body).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], rows[:])
+
+    def test_extractor_reads_export_incrementally(self):
+        """The export returns the same documents as the paginated endpoint, in batches"""
+        with serve_dataset(self.dataset) as api_url:
+            extractor = Extractor(api_url=api_url)
+            for compress in (True, False):
+                batches = list(extractor.iter_export('listen_history', batch_size=200, compress=compress))
+                self.assertEqual([number for number, _ in batches], [1, 2, 3])
+                exported = [dto for _, dtos in batches for dto in dtos]
+                paginated = [dto for _, dtos in extractor.iter_pages('listen_history') for dto in dtos]
+                self.assertEqual(exported, paginated)
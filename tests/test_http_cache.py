@@ -0,0 +1,94 @@
+import unittest
+import tempfile
+from unittest.mock import patch
+import requests
+from sqlalchemy.exc import SQLAlchemyError
+from benchmarks.datasets import SyntheticDataset
+from benchmarks.run_benchmarks import serve_dataset
+from src.moovitamix_etl.extract.extractor import Extractor
+from src.moovitamix_etl.extract.response_cache import ResponseCache
+from src.moovitamix_etl.load.data_loader import DataLoader
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.metrics import PipelineMetrics
+from src.moovitamix_etl.pipeline import ETLPipeline
+
+
+class TestHttpCache(unittest.TestCase):
+    """Essential test cases for conditional requests and the on-disk response cache"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dataset = SyntheticDataset(1500, seed=5)
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def test_api_answers_304_to_matching_etag(self):
+        """Each page has its own validators, a matching If-None-Match gets an empty 304"""
+        with serve_dataset(self.dataset) as api_url:
+            first = requests.get(f"{api_url}/users?page=1&size=50")
+            second = requests.get(f"{api_url}/users?page=2&size=50")
+            self.assertIn("Last-Modified", first.headers)
+            self.assertNotEqual(first.headers["ETag"], second.headers["ETag"])
+
+            revalidated = requests.get(
+                f"{api_url}/users?page=1&size=50",
+                headers={"If-None-Match": first.headers["ETag"]}
+            )
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertEqual(revalidated.content, b"")
+
+    def test_rerun_is_served_from_cache(self):
+        """A second extraction revalidates every page and returns the same documents"""
+        with serve_dataset(self.dataset) as api_url:
+            first_run = Extractor(api_url=api_url, cache=ResponseCache(self.folder.name))
+            expected = list(first_run.iter_all_resources(size=50))
+            first_run.acknowledge_all()
+
+            metrics = PipelineMetrics()
+            second_run = Extractor(api_url=api_url, metrics=metrics, cache=ResponseCache(self.folder.name))
+            self.assertEqual(list(second_run.iter_all_resources(size=50)), expected)
+            self.assertEqual(metrics.counters["http_not_modified"], len(expected))
+            self.assertEqual(list(second_run.iter_all_resources(size=50, changed_only=True)), [])
+
+    def test_pages_are_cached_once_loaded(self):
+        """Pages whose load was not acknowledged are extracted again, even when changed_only"""
+        with serve_dataset(self.dataset) as api_url:
+            failed_run = Extractor(api_url=api_url, cache=ResponseCache(self.folder.name))
+            pages = list(failed_run.iter_pages('users', size=50))
+            failed_run.acknowledge('users', 1)
+
+            next_run = Extractor(api_url=api_url, cache=ResponseCache(self.folder.name))
+            changed = list(next_run.iter_pages('users', size=50, changed_only=True))
+            self.assertEqual(changed, pages[1:])
+
+            db_url = f"sqlite:///{self.folder.name}/etl.db"
+            DatabaseConfig(url=db_url).init_database()
+            options = dict(api_url=api_url, db_url=db_url, http_cache_dir=self.folder.name, changed_only=True)
+            with patch.object(DataLoader, 'load_all', side_effect=SQLAlchemyError("load failed")):
+                with self.assertRaises(SQLAlchemyError):
+                    ETLPipeline(**options).run()
+            # The pages of the failed run were not cached
+            pipeline = ETLPipeline(**options)
+            self.assertTrue(pipeline.run())
+            self.assertNotIn("http_not_modified", pipeline.metrics.counters)
+            pipeline = ETLPipeline(**options)
+            self.assertTrue(pipeline.run())
+            self.assertEqual(pipeline.metrics.counters["http_not_modified"], 3)
+
+    def test_lru_eviction_under_size_cap(self):
+        """The least recently used entries are evicted first, also after a restart"""
+        cache = ResponseCache(self.folder.name, max_bytes=10_000)
+        payload = "x" * 3000
+        for url in ("a", "b", "c"):
+            cache.put(url, '"etag"', payload)
+        self.assertIsNotNone(cache.get("a"))
+        cache.put("d", '"etag"', payload)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertLessEqual(cache.size, 10_000)
+        reopened = ResponseCache(self.folder.name, max_bytes=7_000)
+        self.assertEqual(len(reopened), 2)
+        self.assertIsNotNone(reopened.get("d"))
+        self.assertIsNone(reopened.get("c"))
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from collections import Counter
+from datetime import datetime
+import numpy as np
+from benchmarks.datasets import SyntheticDataset
+from src.moovitamix_etl.export.interaction_matrix import InteractionMatrixExporter, load_matrix
+from src.moovitamix_etl.load.data_loader import DataLoader
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import ListenHistory
+from src.moovitamix_etl.transform.data_transformer import DataTransformer
+
+
+def cells(arrays):
+    """(user id, track id) -> play count of an exported matrix"""
+    rows = np.repeat(np.arange(len(arrays['user_ids'])), np.diff(arrays['indptr']))
+    return {
+        (int(arrays['user_ids'][row]), int(arrays['track_ids'][col])): int(count)
+        for row, col, count in zip(rows, arrays['indices'], arrays['data'])
+    }
+
+
+class TestInteractionMatrix(unittest.TestCase):
+    """Essential test cases for the CSR interaction matrix export"""
+
+    def test_incremental_export_matches_full_export(self):
+        """Segments appended by each load, merged or compacted, give the matrix of a single export"""
+        dataset = SyntheticDataset(500, seed=5)
+        history = dataset.dtos('listen_history')
+        # Listened long before the first export, loaded after it
+        history[-1].created_at = datetime(2000, 1, 1)
+        with tempfile.TemporaryDirectory() as tmp:
+            db_config = DatabaseConfig(url=f"sqlite:///{tmp}/x.db")
+            db_config.init_database()
+            incremental = InteractionMatrixExporter(db_config, os.path.join(tmp, 'incremental'), batch_size=64)
+            exported = []
+            for part in (history[:len(history) // 2], history[len(history) // 2:]):
+                tracks, users, listen_history, genres = DataTransformer().transform_all(
+                    dataset.dtos('tracks'), dataset.dtos('users'), part
+                )
+                DataLoader(db_config=db_config, core=True).load_all(tracks, users, listen_history, genres)
+                exported.append(incremental.export())
+            self.assertTrue(all(exported))
+            self.assertEqual(sum(exported), dataset.listen_events)
+            self.assertEqual(incremental.export(), 0)
+            with db_config.get_session() as session:
+                expected = Counter((h.user_id, h.track_id) for h in session.query(ListenHistory))
+
+            full = InteractionMatrixExporter(db_config, os.path.join(tmp, 'full'), fmt='npz', batch_size=1000)
+            full.export()
+            db_config.dispose_engine()
+
+            folder = os.path.join(tmp, 'incremental')
+            self.assertEqual(sorted(os.listdir(folder)), ['manifest.json', 'segment_000001', 'segment_000002'])
+            self.assertEqual(cells(load_matrix(folder)), dict(expected))
+            incremental.compact()
+            self.assertEqual(sorted(os.listdir(folder)), ['manifest.json', 'segment_000003'])
+
+            incremental_arrays = load_matrix(folder)
+            self.assertIsInstance(incremental_arrays['indices'], np.memmap)
+            self.assertEqual(cells(incremental_arrays), dict(expected))
+            self.assertEqual(cells(load_matrix(os.path.join(tmp, 'full'))), dict(expected))
+            # Rows keep their order: sorted column indexes within each row
+            for start, end in zip(incremental_arrays['indptr'][:-1], incremental_arrays['indptr'][1:]):
+                self.assertTrue(np.all(np.diff(incremental_arrays['indices'][start:end]) > 0))
+
+if __name__ == '__main__':
+    unittest.main()
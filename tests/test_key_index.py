@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from sqlalchemy import event
+from benchmarks.datasets import SyntheticDataset
+from src.moovitamix_etl.load.data_loader import DataLoader
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.key_index import KeyCache, KeyIndex, MIN_CAPACITY
+from src.moovitamix_etl.transform.data_transformer import DataTransformer
+
+
+class TestKeyIndex(unittest.TestCase):
+    """Essential test cases for the persistent key indexes"""
+
+    def test_index_grows_and_persists(self):
+        """Keys inserted by batches survive growing the table and reopening the file"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'tracks.npy')
+            index = KeyIndex(path)
+            items = [((f"track {i}", f"artist {i % 7}"), i + 1) for i in range(3 * MIN_CAPACITY)]
+            index.update(items)
+            # Within a batch, the last entry of a key wins
+            index.update([(("track 0", "artist 0"), 41), (("track 0", "artist 0"), 42)])
+            index.flush()
+            del index
+
+            index = KeyIndex(path)
+            self.assertEqual(len(index), len(items))
+            keys = [key for key, _ in items[1:]] + [("track 0", "artist 0"), ("unknown", "artist")]
+            self.assertEqual(index.get_many(keys), [db_id for _, db_id in items[1:]] + [42, None])
+
+    def test_second_run_skips_dimension_lookups(self):
+        """Keys indexed by a run are not queried again, until the database is recreated"""
+        dataset = SyntheticDataset(300, seed=4)
+        with tempfile.TemporaryDirectory() as tmp:
+            db_config = DatabaseConfig(url=f"sqlite:///{tmp}/x.db")
+            db_config.init_database()
+            index_dir = os.path.join(tmp, 'keys')
+            statements = []
+            event.listen(db_config.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+            def load():
+                statements.clear()
+                tracks, users, listen_history, genres = DataTransformer().transform_all(
+                    dataset.dtos('tracks'), dataset.dtos('users'), dataset.dtos('listen_history')
+                )
+                loader = DataLoader(db_config=db_config, core=True, batch_size=50, key_index_dir=index_dir)
+                self.assertTrue(loader.load_all(tracks, users, listen_history, genres))
+                return [s for s in statements if s.lstrip().upper().startswith('SELECT') and 'count(' not in s]
+
+            load()
+            generation = db_config.generation()
+            self.assertEqual(len(KeyCache(index_dir, generation)['tracks']), len(dataset.tracks))
+
+            lookups = load()
+            self.assertFalse([s for s in lookups if 'FROM tracks' in s or 'FROM users' in s or 'FROM genres' in s])
+
+            # A recreated database gets a new generation: the indexes are rebuilt from it
+            db_config.drop_database()
+            db_config.init_database()
+            self.assertNotEqual(db_config.generation(), generation)
+            load()
+            cache = KeyCache(index_dir, db_config.generation())
+            self.assertFalse(cache.stale)
+            self.assertEqual(len(cache['users']), len(dataset.users))
+            db_config.dispose_engine()
+
+
+if __name__ == '__main__':
+    unittest.main()
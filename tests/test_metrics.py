@@ -0,0 +1,84 @@
+import unittest
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from sqlalchemy import create_engine, text
+from src.moovitamix_etl.metrics import PipelineMetrics
+
+
+class TestPipelineMetrics(unittest.TestCase):
+    """Essential test cases for the run metrics"""
+
+    def setUp(self):
+        self.metrics = PipelineMetrics(run_id="test")
+        self.test_metrics_folder = Path(__file__).parent / "test_metrics_data"
+
+    def tearDown(self):
+        if self.test_metrics_folder.exists():
+            shutil.rmtree(self.test_metrics_folder)
+
+    def test_nested_stages_count_rows_and_statements(self):
+        """Statements run in a nested step count for the step and its parent stage"""
+        engine = create_engine("sqlite://")
+        self.metrics.instrument_engine(engine)
+
+        with self.metrics.stage('load') as load:
+            with self.metrics.stage('load.tracks') as step, engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                conn.execute(text("SELECT 2"))
+                step.add_rows(10)
+            load.add_rows(10)
+
+        self.assertEqual(self.metrics.stages['load.tracks'].db_statements, 2)
+        self.assertEqual(self.metrics.stages['load'].db_statements, 2)
+        self.assertEqual(self.metrics.stages['load.tracks'].rows, 10)
+        self.assertGreater(self.metrics.stages['load'].wall_time, 0)
+
+    @unittest.skipUnless(os.path.exists('/proc/self/statm'), "resident memory is read from /proc")
+    def test_stage_memory_is_its_own_growth(self):
+        """A stage reports the memory it allocated, not the peak of the stages before it"""
+        with self.metrics.stage('transform'):
+            allocated = b'x' * (64 * 1024 * 1024)
+            # Freed before the end of the stage, only seen by the sampling
+            time.sleep(0.05)
+            del allocated
+        with self.metrics.stage('load'):
+            time.sleep(0.05)
+
+        self.assertGreaterEqual(self.metrics.stages['transform'].peak_rss_delta_bytes, 48 * 1024 * 1024)
+        self.assertLess(self.metrics.stages['load'].peak_rss_delta_bytes, 16 * 1024 * 1024)
+        self.assertIn('stage_peak_rss_delta_bytes{stage="transform"}', self.metrics.to_prometheus())
+
+    def test_latency_histogram_is_cumulative(self):
+        """Each request lands in its bucket and in every bucket above it"""
+        self.metrics.observe_request('/tracks', 0.02)
+        self.metrics.observe_request('/tracks', 0.3)
+        self.metrics.observe_request('/tracks', 60, failed=True)
+
+        buckets = dict(self.metrics.http_latency['/tracks'].cumulative())
+        self.assertEqual(buckets['0.01'], 0)
+        self.assertEqual(buckets['0.025'], 1)
+        self.assertEqual(buckets['0.5'], 2)
+        self.assertEqual(buckets['+Inf'], 3)
+        self.assertEqual(self.metrics.http_errors['/tracks'], 1)
+
+    def test_reports_are_written(self):
+        """The run report and the Prometheus textfile are written side by side"""
+        with self.metrics.stage('extract') as stage:
+            stage.add_rows(100)
+        self.metrics.observe_request('/users', 0.1)
+        self.metrics.finish(success=True)
+
+        report_path = self.metrics.write_json(str(self.test_metrics_folder))
+        prom_path = self.metrics.write_prometheus(str(self.test_metrics_folder))
+
+        report = json.loads(Path(report_path).read_text())
+        self.assertTrue(report['success'])
+        self.assertEqual(report['stages']['extract']['rows'], 100)
+
+        prom = Path(prom_path).read_text()
+        self.assertIn('moovitamix_etl_run_success 1', prom)
+        self.assertIn('moovitamix_etl_stage_rows{stage="extract"} 100', prom)
+        self.assertIn('moovitamix_etl_http_request_duration_seconds_count{endpoint="/users"} 1', prom)
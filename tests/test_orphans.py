@@ -0,0 +1,121 @@
+import tempfile
+import unittest
+from datetime import datetime
+from sqlalchemy import func, insert
+from benchmarks.datasets import SyntheticDataset
+from benchmarks.run_benchmarks import serve_dataset
+from src.moovitamix_etl.load.data_loader import DataLoader
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import DailyTrackPlays, ListenHistory, ParkedListenEvent
+from src.moovitamix_etl.pipeline import ETLPipeline
+from src.moovitamix_etl.transform.data_transformer import DataTransformer
+
+
+def counts(db_config):
+    with db_config.get_session() as session:
+        return session.query(ListenHistory).count(), session.query(ParkedListenEvent).count()
+
+
+class TestOrphans(unittest.TestCase):
+    """Essential test cases for the listen events of missing users or tracks"""
+
+    def test_orphans_are_parked_then_replayed(self):
+        """Orphans are reported once, parked, and loaded once their users arrive"""
+        dataset = SyntheticDataset(600, seed=11)
+        with tempfile.TemporaryDirectory() as tmp:
+            for core in (False, True):
+                tracks, users, listen_history, genres = DataTransformer().transform_all(
+                    dataset.dtos('tracks'), dataset.dtos('users'), dataset.dtos('listen_history')
+                )
+                late_users = users[:20]
+                late_ids = {user.id for user in late_users}
+                orphans = sum(1 for event in listen_history if event.user_id in late_ids)
+                db_config = DatabaseConfig(url=f"sqlite:///{tmp}/orphans_{core}.db")
+                db_config.init_database()
+
+                loader = DataLoader(db_config=db_config, core=core, park_orphans=True)
+                with self.assertLogs('src.moovitamix_etl.load.data_loader', level='WARNING') as logs:
+                    self.assertTrue(loader.load_all(tracks, users[20:], listen_history, genres))
+                self.assertEqual(len(logs.records), 1)
+                self.assertIn(f"Parking {orphans} listen history records", logs.output[0])
+                self.assertEqual(loader.metrics.counters['orphan_listen_events'], orphans)
+                self.assertEqual(counts(db_config), (len(listen_history) - orphans, orphans))
+                self.assertEqual(loader.replay_parked(), 0)
+
+                # The users arrive with a later run
+                loader = DataLoader(db_config=db_config, core=core, park_orphans=True)
+                self.assertTrue(loader.load_all([], late_users, [], genres))
+                self.assertEqual(loader.replay_parked(), orphans)
+                self.assertEqual(counts(db_config), (len(listen_history), 0))
+                db_config.dispose_engine()
+
+    def test_replay_follows_remapped_ids(self):
+        """Parked events of users loaded into an existing row are replayed through their aliases"""
+        dataset = SyntheticDataset(600, seed=13)
+        with tempfile.TemporaryDirectory() as tmp:
+            for core in (False, True):
+                tracks, users, listen_history, genres = DataTransformer().transform_all(
+                    dataset.dtos('tracks'), dataset.dtos('users'), dataset.dtos('listen_history')
+                )
+                late_users = users[:20]
+                late_ids = {user.id for user in late_users}
+                orphans = sum(1 for event in listen_history if event.user_id in late_ids)
+                # The late users share their email with users loaded first under other ids
+                emails = [user.email for user in users[20:40]]
+                db_config = DatabaseConfig(url=f"sqlite:///{tmp}/aliases_{core}.db")
+                db_config.init_database()
+                loader = DataLoader(db_config=db_config, core=core, park_orphans=True)
+                self.assertTrue(loader.load_all(tracks, users[20:], listen_history, genres))
+
+                for user, email in zip(late_users, emails):
+                    user.email = email
+                loader = DataLoader(db_config=db_config, core=core, park_orphans=True)
+                self.assertTrue(loader.load_all([], late_users, [], genres))
+                self.assertEqual(loader.replay_parked(), orphans)
+                self.assertEqual(counts(db_config), (len(listen_history), 0))
+                db_config.dispose_engine()
+
+    def test_runs_replay_parked_events_once_loaded(self):
+        """Runs, local pools of shards included, replay the parked events once their load committed"""
+        dataset = SyntheticDataset(500, seed=12)
+        history = dataset.listen_history[0]
+        parked = [
+            {'user_id': history['user_id'], 'track_id': history['items'][0], 'listened_at': datetime(2024, 5, 1)},
+            {'user_id': 10 ** 9, 'track_id': history['items'][0], 'listened_at': datetime(2024, 5, 1)},
+        ]
+        with tempfile.TemporaryDirectory() as tmp, serve_dataset(dataset) as api_url:
+            db_config = DatabaseConfig(url=f"sqlite:///{tmp}/replay.db")
+            db_config.init_database()
+            pipeline = ETLPipeline(api_url=api_url, db_url=db_config.database_url, arrow=True, park_orphans=True)
+            self.assertTrue(pipeline.run())
+            loaded, _ = counts(db_config)
+            with db_config.engine.begin() as conn:
+                conn.execute(insert(ParkedListenEvent.__table__), parked)
+
+            self.assertTrue(pipeline.run())
+            self.assertEqual(counts(db_config), (2 * loaded + 1, 1))
+            self.assertEqual(pipeline.metrics.stages['load.parked'].rows, 1)
+            db_config.dispose_engine()
+
+            # Shards leave the replay to the parent, once the users and tracks of the run committed
+            db_config = DatabaseConfig(url=f"sqlite:///{tmp}/replay_workers.db")
+            db_config.init_database()
+            with db_config.engine.begin() as conn:
+                conn.execute(insert(ParkedListenEvent.__table__), parked)
+            pipeline = ETLPipeline(
+                streaming=True, api_url=api_url, db_url=db_config.database_url,
+                resources=['tracks', 'users'], workers=2, aggregates=True, park_orphans=True
+            )
+            self.assertTrue(pipeline.run())
+            self.assertEqual(counts(db_config), (1, 1))
+            self.assertEqual(pipeline.metrics.stages['load.parked'].rows, 1)
+            with db_config.get_session() as session:
+                self.assertEqual(session.query(func.sum(DailyTrackPlays.play_count)).scalar(), 1)
+            db_config.dispose_engine()
+
+        with self.assertRaises(ValueError):
+            ETLPipeline(into_csv=True, park_orphans=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
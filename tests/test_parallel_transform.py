@@ -0,0 +1,106 @@
+import tempfile
+import unittest
+from benchmarks.datasets import SyntheticDataset
+from benchmarks.run_benchmarks import serve_dataset
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import Genre, ListenHistory, Track, User
+from src.moovitamix_etl.pipeline import ETLPipeline
+from src.moovitamix_etl.transform.columnar import TABLES, genre_names, source_table
+from src.moovitamix_etl.transform.data_transformer import DataTransformer
+from src.moovitamix_etl.transform.parallel_transformer import ParallelTransformer
+
+
+def track_rows(tracks):
+    return [
+        (t.id, t.name, t.artist, t.duration, t.created_at, [g.name for g in t.genres])
+        for t in tracks
+    ]
+
+
+def user_rows(users):
+    return [(u.id, u.email, u.updated_at, [g.name for g in u.favorite_genres]) for u in users]
+
+
+def history_rows(listen_history):
+    return [(h.user_id, h.track_id, h.listened_at) for h in listen_history]
+
+
+class TestParallelTransform(unittest.TestCase):
+    """Essential test cases for the process pool transform"""
+
+    def test_same_output_as_data_transformer(self):
+        """Batches transformed by worker processes give the same models, in the same order"""
+        dataset = SyntheticDataset(1000, seed=7)
+        dtos = [dataset.dtos(resource) for resource in ('tracks', 'users', 'listen_history')]
+
+        expected = DataTransformer().transform_all(*dtos)
+        result = ParallelTransformer(workers=2, batch_size=64).transform_all(*dtos)
+
+        self.assertEqual(track_rows(result[0]), track_rows(expected[0]))
+        self.assertEqual(user_rows(result[1]), user_rows(expected[1]))
+        self.assertEqual(history_rows(result[2]), history_rows(expected[2]))
+        self.assertEqual([g.name for g in result[3]], [g.name for g in expected[3]])
+        # Tracks and users share the Genre objects of the run
+        self.assertTrue(any(genre is result[0][0].genres[0] for genre in result[3]))
+
+    def test_tables_from_a_kept_pool(self):
+        """The pool is kept between calls, which return the tables of the Arrow pipeline"""
+        dataset = SyntheticDataset(500, seed=8)
+        dtos = [dataset.dtos(resource) for resource in ('tracks', 'users', 'listen_history')]
+        expected = DataTransformer().transform_tables(
+            *(source_table(resource, getattr(dataset, resource)[:]) for resource in ('tracks', 'users', 'listen_history'))
+        )
+        transformer = ParallelTransformer(workers=2, batch_size=100)
+        self.addCleanup(transformer.close)
+
+        first = transformer.transform_dtos(*dtos)
+        pool = transformer._executor
+        second = transformer.transform_dtos(*dtos)
+
+        self.assertIs(transformer._executor, pool)
+        self.assertEqual(set(first), set(TABLES))
+        for name in TABLES:
+            self.assertTrue(first[name].equals(expected[name]), name)
+            self.assertTrue(second[name].equals(expected[name]), name)
+
+    def test_worker_genre_ids_agree_across_batches(self):
+        """Every batch numbers the genres with the dictionary of the pool, restarted for new genres"""
+        dataset = SyntheticDataset(400, seed=10)
+        tracks, users, listen_history = (dataset.dtos(resource) for resource in ('tracks', 'users', 'listen_history'))
+        transformer = ParallelTransformer(workers=2, batch_size=16)
+        self.addCleanup(transformer.close)
+
+        for new_genre in (None, 'Zydeco'):
+            if new_genre:
+                tracks[-1].genres = f"{tracks[-1].genres}, {new_genre}"
+            tables = transformer.transform_dtos(tracks, users, listen_history)
+            genres = dict(zip(tables['genres'].column('id').to_pylist(), tables['genres'].column('name').to_pylist()))
+            self.assertEqual(len(set(genres.values())), len(genres))
+            for dtos, edges, owner, column in (
+                (tracks, 'track_genres', 'track_id', 'genres'),
+                (users, 'user_favorite_genres', 'user_id', 'favorite_genres')
+            ):
+                names = {}
+                for owner_id, genre_id in zip(tables[edges].column(owner).to_pylist(), tables[edges].column('genre_id').to_pylist()):
+                    names.setdefault(owner_id, set()).add(genres[genre_id])
+                for dto in dtos:
+                    self.assertEqual(names[dto.id], genre_names([getattr(dto, column)]))
+        self.assertIn('Zydeco', genres.values())
+
+    def test_batch_run_loads_the_worker_tables(self):
+        """A batch run with transform workers loads the same rows as a serial one"""
+        dataset = SyntheticDataset(600, seed=9)
+        with tempfile.TemporaryDirectory() as tmp, serve_dataset(dataset) as api_url:
+            counts = []
+            for workers in (1, 2):
+                db_config = DatabaseConfig(url=f"sqlite:///{tmp}/workers_{workers}.db")
+                db_config.init_database()
+                pipeline = ETLPipeline(api_url=api_url, db_url=db_config.database_url, transform_workers=workers)
+                self.assertTrue(pipeline.run())
+                with db_config.get_session() as session:
+                    counts.append([session.query(model).count() for model in (Genre, Track, User, ListenHistory)])
+                db_config.dispose_engine()
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertTrue(all(counts[1]))
+
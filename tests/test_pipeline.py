@@ -3,6 +3,7 @@ from unittest.mock import Mock, patch
 from datetime import datetime
 import os
 import shutil
+import tempfile
 from src.moovitamix_etl.transform.data_transformer import DataTransformer
 from src.moovitamix_etl.load.data_loader import DataLoader
 from src.moovitamix_etl.load.database_config import DatabaseConfig
@@ -51,8 +52,7 @@ class TestETLPipeline(unittest.TestCase):
     )
         
         # Create test directory for CSV output
-        self.test_csv_folder = Path(__file__).parent / "test_csv_data"
-        self.test_csv_folder.mkdir(exist_ok=True)
+        self.test_csv_folder = Path(tempfile.mkdtemp())
     
     def tearDown(self):
         """Clean up after tests"""
@@ -106,7 +106,7 @@ class TestETLPipeline(unittest.TestCase):
             mock_extract.return_value = mock_data
             
             # Execute full pipeline
-            pipeline = ETLPipeline(into_csv=True)
+            pipeline = ETLPipeline(into_csv=True, csv_folder=str(self.test_csv_folder))
             
             try:
                 result = pipeline.run()
@@ -0,0 +1,51 @@
+import unittest
+import pstats
+import shutil
+import time
+from pathlib import Path
+from src.moovitamix_etl.profiling import StageProfiler
+
+
+def busy_work():
+    return sorted(str(i) for i in range(20000))
+
+
+class TestStageProfiler(unittest.TestCase):
+    """Essential test cases for the per stage profiles"""
+
+    def setUp(self):
+        self.test_profile_folder = Path(__file__).parent / "test_profile_data"
+
+    def tearDown(self):
+        if self.test_profile_folder.exists():
+            shutil.rmtree(self.test_profile_folder)
+
+    def test_cpu_and_memory_profiles_per_stage(self):
+        """Both modes write a loadable pstats file and a memory report per stage"""
+        profiler = StageProfiler.from_mode('both', str(self.test_profile_folder), 'test')
+        profiler.start()
+        with profiler.stage('transform'):
+            busy_work()
+        files = profiler.stop()
+
+        names = {Path(f).name for f in files}
+        self.assertIn('cpu_test_transform.pstats', names)
+        self.assertIn('memory_test_transform.txt', names)
+        stats = pstats.Stats(str(self.test_profile_folder / 'cpu_test_transform.pstats'))
+        self.assertTrue(any(func[2] == 'busy_work' for func in stats.stats))
+        report = (self.test_profile_folder / 'memory_test_transform.txt').read_text()
+        self.assertIn('Peak traced memory', report)
+
+    def test_sampling_mode_writes_collapsed_stacks(self):
+        """Sampling mode records the stacks of the profiled thread only"""
+        profiler = StageProfiler.from_mode('cpu', str(self.test_profile_folder), 'test',
+                                           sampling=True, interval=0.001)
+        profiler.start()
+        with profiler.stage('extract'):
+            deadline = time.monotonic() + 0.2
+            while time.monotonic() < deadline:
+                busy_work()
+        profiler.stop()
+
+        folded = (self.test_profile_folder / 'cpu_test_extract.folded').read_text()
+        self.assertIn('busy_work', folded)
@@ -0,0 +1,153 @@
+import unittest
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import requests
+from benchmarks.datasets import SyntheticDataset
+from src.moovitamix_etl.extract.extractor import Extractor
+from src.moovitamix_etl.extract.resilience import AdaptiveLimiter, RetryPolicy, parse_retry_after
+from src.moovitamix_etl.metrics import PipelineMetrics
+
+
+class FaultyApi:
+    """Stand-in for the API serving tracks pages, with scripted faults per page.
+
+    `faults[page]` is a list of faults consumed one per request: an HTTP status
+    (answered with `Retry-After: retry_after`) or ('sleep', seconds) before answering.
+    """
+
+    def __init__(self, tracks, faults=None, retry_after="0", delay=0.0):
+        self.tracks = tracks
+        self.faults = faults or {}
+        self.retry_after = retry_after
+        self.delay = delay
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def handle(self, handler):
+        query = parse_qs(urlparse(handler.path).query)
+        page, size = int(query["page"][0]), int(query["size"][0])
+        with self._lock:
+            self.requests.append(page)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fault = self.faults.get(page, []).pop(0) if self.faults.get(page) else None
+        try:
+            time.sleep(self.delay)
+            if isinstance(fault, tuple):
+                time.sleep(fault[1])
+            elif fault is not None:
+                handler.send_response(fault)
+                handler.send_header("Retry-After", self.retry_after)
+                handler.send_header("Content-Length", "0")
+                handler.end_headers()
+                return
+            pages = -(-len(self.tracks) // size)
+            body = json.dumps({
+                "items": self.tracks[(page - 1) * size:page * size],
+                "total": len(self.tracks), "page": page, "size": size, "pages": pages
+            }).encode()
+            handler.send_response(200)
+            handler.send_header("Content-Type", "application/json")
+            handler.send_header("Content-Length", str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def __enter__(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                api.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestResilientExtraction(unittest.TestCase):
+    """Essential test cases for timeouts, retries and the adaptive limiter"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tracks = SyntheticDataset(5000, seed=2).tracks[:]
+        cls.fast_retry = RetryPolicy(max_retries=3, backoff_base=0.01)
+
+    def extract(self, api_url, **kwargs):
+        extractor = Extractor(api_url=api_url, **kwargs)
+        return [dto for _, dtos in extractor.iter_pages('tracks', size=50) for dto in dtos]
+
+    def test_retries_5xx_and_429(self):
+        """Transient errors are retried until the page is served"""
+        api = FaultyApi(self.tracks, faults={1: [503, 500], 2: [429]})
+        metrics = PipelineMetrics()
+        with api as api_url:
+            tracks = self.extract(api_url, metrics=metrics, retry=self.fast_retry)
+        self.assertEqual([track.id for track in tracks], [track["id"] for track in self.tracks])
+        self.assertEqual(metrics.counters["http_retries"], 3)
+        self.assertEqual(metrics.http_errors["/tracks"], 3)
+
+    def test_honors_retry_after(self):
+        """The delay before a throttled request is retried is at least Retry-After"""
+        api = FaultyApi(self.tracks, faults={1: [429]}, retry_after="0.3")
+        with api as api_url:
+            start = time.perf_counter()
+            self.extract(api_url, retry=self.fast_retry)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.3)
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+
+    def test_read_timeout_is_retried(self):
+        """A page slower than the read timeout is requested again"""
+        api = FaultyApi(self.tracks, faults={3: [("sleep", 1.0)]})
+        with api as api_url:
+            tracks = self.extract(api_url, timeout=(1.0, 0.2), retry=self.fast_retry)
+        self.assertEqual(len(tracks), len(self.tracks))
+        self.assertEqual(api.requests.count(3), 2)
+
+    def test_gives_up_after_max_retries(self):
+        """A page failing on every attempt fails the extraction"""
+        api = FaultyApi(self.tracks, faults={2: [502] * 10})
+        with api as api_url:
+            with self.assertRaises(requests.HTTPError):
+                self.extract(api_url, retry=self.fast_retry)
+        self.assertEqual(api.requests.count(2), 4)
+
+    def test_concurrent_pages_keep_order_and_limit(self):
+        """Pages are fetched in parallel, yielded in order, never above the limit"""
+        api = FaultyApi(self.tracks, faults={4: [503]}, delay=0.02)
+        with api as api_url:
+            tracks = self.extract(api_url, retry=self.fast_retry, max_concurrency=4)
+        self.assertEqual([track.id for track in tracks], [track["id"] for track in self.tracks])
+        self.assertLessEqual(api.max_in_flight, 4)
+        self.assertGreater(api.max_in_flight, 1)
+
+    def test_limiter_adapts_to_errors_and_latency(self):
+        """The limit halves on errors or slow requests and grows back on success"""
+        limiter = AdaptiveLimiter(max_limit=8, target_latency=0.5)
+        limiter.acquire()
+        limiter.release(0.01, overloaded=True)
+        limiter.acquire()
+        limiter.release(2.0)
+        self.assertEqual(limiter.limit, 2)
+        for _ in range(20):
+            limiter.acquire()
+            limiter.release(0.01)
+        self.assertGreater(limiter.limit, 5)
+        self.assertLessEqual(limiter.limit, 8)
@@ -0,0 +1,96 @@
+import tempfile
+import time
+import unittest
+import requests
+from sqlalchemy import select
+from benchmarks.datasets import SyntheticDataset
+from benchmarks.run_benchmarks import serve_app
+from benchmarks.serving_benchmark import prepare_database, run_load
+from src.moovitamix_etl.load.aggregates import PUBLISHED
+from src.moovitamix_etl.load.model.model import TrackSimilarity, UserTrackPlays
+from src.moovitamix_serving.app import create_app
+from src.moovitamix_serving.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestServing(unittest.TestCase):
+    """Essential test cases for the recommendations API"""
+
+    def test_cache_evicts_least_recently_used_and_expired(self):
+        """Entries are evicted beyond maxsize, oldest use first, and expire after ttl"""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        clock.now = 10
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_cache_drops_values_computed_before_clear(self):
+        """A value computed while the cache is cleared is returned but not stored"""
+        cache = TTLCache()
+
+        def compute():
+            cache.clear()
+            return 'stale'
+
+        self.assertEqual(cache.get_or_compute('key', compute), 'stale')
+        self.assertEqual(cache.get_or_compute('key', lambda: 'fresh'), 'fresh')
+        self.assertEqual(cache.get('key'), 'fresh')
+
+    def test_api_serves_recommendations_and_follows_publications(self):
+        """Recommendations exclude listened tracks, and a publication invalidates the cache"""
+        dataset = SyntheticDataset(600, seed=5, items_per_user=6)
+        with tempfile.TemporaryDirectory() as tmp:
+            db_config = prepare_database(dataset, tmp)
+            with db_config.engine.connect() as conn:
+                plays = conn.execute(select(UserTrackPlays.user_id, UserTrackPlays.track_id)).all()
+                similar = conn.execute(
+                    select(TrackSimilarity.similar_track_id)
+                    .where(TrackSimilarity.track_id == plays[0].track_id)
+                    .order_by(TrackSimilarity.position)
+                ).scalars().all()
+            user_id = plays[0].user_id
+            listened = {track_id for user, track_id in plays if user == user_id}
+
+            app = create_app(db_config, refresh_interval=0.05, warmup_users=5, warmup_tracks=5)
+            with serve_app(app) as api_url:
+                body = requests.get(f"{api_url}/recommendations/users/{user_id}?n=50").json()
+                scores = [item['score'] for item in body['items']]
+                self.assertEqual(body['source'], 'similar')
+                self.assertTrue(body['items'])
+                self.assertEqual(scores, sorted(scores, reverse=True))
+                self.assertFalse({item['track_id'] for item in body['items']} & listened)
+
+                body = requests.get(f"{api_url}/recommendations/tracks/{plays[0].track_id}/similar?n=50").json()
+                self.assertEqual([item['track_id'] for item in body['items']], similar)
+                self.assertEqual(requests.get(f"{api_url}/recommendations/users/0").json()['source'], 'popular')
+                self.assertEqual(requests.get(f"{api_url}/recommendations/tracks/0/similar").status_code, 404)
+
+                self.assertGreater(requests.get(f"{api_url}/health").json()['cache']['size'], 0)
+                db_config.set_state(PUBLISHED, 'next-run')
+                deadline = time.monotonic() + 5
+                while requests.get(f"{api_url}/health").json()['published'] != 'next-run':
+                    self.assertLess(time.monotonic(), deadline)
+                    time.sleep(0.05)
+
+                latencies = run_load(api_url, [f"/recommendations/users/{user_id}"] * 20, clients=4)
+                self.assertEqual(latencies['requests'], 20)
+                self.assertLessEqual(latencies['p50_ms'], latencies['p99_ms'])
+            db_config.dispose_engine()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import tempfile
+from benchmarks.datasets import SyntheticDataset
+from benchmarks.run_benchmarks import serve_dataset
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import Genre, ListenHistory, Track, User
+from src.moovitamix_etl.pipeline import ETLPipeline
+from src.moovitamix_etl.sharding import load_phases, shard_range
+
+
+class TestSharding(unittest.TestCase):
+    """Essential test cases for sharded execution"""
+
+    def test_shard_ranges_cover_every_page_once(self):
+        """Page ranges are contiguous, disjoint and balanced"""
+        for pages, shards in ((10, 3), (7, 7), (2, 4), (0, 2)):
+            covered = []
+            for index in range(shards):
+                first, last = shard_range(pages, shards, index)
+                covered.extend(range(first, last + 1))
+            self.assertEqual(covered, list(range(1, pages + 1)))
+        self.assertEqual(shard_range(10, 3, 0), (1, 4))
+        self.assertEqual(load_phases(['listen_history', 'tracks']), [['tracks'], ['listen_history']])
+
+    def test_workers_load_same_data_as_single_process(self):
+        """Shards run in parallel processes load the same rows as a single run"""
+        dataset = SyntheticDataset(2000, seed=4)
+        databases = {}
+        with tempfile.TemporaryDirectory() as tmp, serve_dataset(dataset) as api_url:
+            for workers in (1, 3):
+                db_config = DatabaseConfig(url=f"sqlite:///{tmp}/workers_{workers}.db")
+                db_config.init_database()
+                pipeline = ETLPipeline(
+                    streaming=True,
+                    page_size=25,
+                    api_url=api_url,
+                    db_url=db_config.database_url,
+                    workers=workers
+                )
+                self.assertTrue(pipeline.run())
+                with db_config.get_session() as session:
+                    databases[workers] = {
+                        model.__tablename__: session.query(model).count()
+                        for model in (Genre, Track, User, ListenHistory)
+                    }
+                db_config.dispose_engine()
+
+            self.assertEqual(databases[3], databases[1])
+            self.assertEqual(databases[3]['listen_history'], dataset.listen_events)
+            self.assertEqual(pipeline.metrics.stages['extract'].rows, 2 * len(dataset.users) + len(dataset.tracks))
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from benchmarks.datasets import SyntheticDataset
+from src.moovitamix_etl.export.interaction_matrix import InteractionMatrixExporter, load_matrix
+from src.moovitamix_etl.export.similarity import SimilarityBuilder
+from src.moovitamix_etl.load.data_loader import DataLoader
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import TrackSimilarity
+from src.moovitamix_etl.transform.data_transformer import DataTransformer
+
+
+def dense_top_k(arrays, metric, k):
+    """Top-K similar tracks computed on the dense matrix"""
+    n_users, n_tracks = len(arrays['user_ids']), len(arrays['track_ids'])
+    matrix = np.zeros((n_users, n_tracks))
+    rows = np.repeat(np.arange(n_users), np.diff(arrays['indptr']))
+    matrix[rows, arrays['indices']] = arrays['data']
+    if metric == 'jaccard':
+        matrix = (matrix > 0).astype(float)
+        inter = matrix.T @ matrix
+        sizes = matrix.sum(axis=0)
+        scores = inter / (sizes[:, None] + sizes[None, :] - inter)
+    else:
+        norms = np.linalg.norm(matrix, axis=0)
+        scores = (matrix.T @ matrix) / np.outer(norms, norms)
+    top = {}
+    for track in range(n_tracks):
+        candidates = [(-scores[track, other], other) for other in range(n_tracks) if other != track and scores[track, other] > 0]
+        top[track] = [(other, round(-score, 9)) for score, other in sorted(candidates)[:k]]
+    return top
+
+
+class TestSimilarity(unittest.TestCase):
+    """Essential test cases for the item-item similarities"""
+
+    def test_blocks_match_dense_similarities(self):
+        """Small memory caps split the tracks in blocks without changing the top-K"""
+        dataset = SyntheticDataset(600, seed=8, items_per_user=6)
+        with tempfile.TemporaryDirectory() as tmp:
+            db_config = DatabaseConfig(url=f"sqlite:///{tmp}/x.db")
+            db_config.init_database()
+            tracks, users, listen_history, genres = DataTransformer().transform_all(
+                dataset.dtos('tracks'), dataset.dtos('users'), dataset.dtos('listen_history')
+            )
+            DataLoader(db_config=db_config, core=True).load_all(tracks, users, listen_history, genres)
+            InteractionMatrixExporter(db_config, os.path.join(tmp, 'matrix')).export()
+            arrays = load_matrix(os.path.join(tmp, 'matrix'))
+
+            for metric in ('cosine', 'jaccard'):
+                expected = dense_top_k(arrays, metric, 5)
+                for memory_mb in (0.01, 256):
+                    builder = SimilarityBuilder(db_config, metric=metric, top_k=5, memory_mb=memory_mb)
+                    blocks = list(builder.iter_blocks(arrays))
+                    if memory_mb < 1:
+                        self.assertGreater(len(blocks), 10)
+                    found = {track: [] for track in expected}
+                    for track, other, scores, ranks in blocks:
+                        for t, o, score, rank in zip(track, other, scores, ranks):
+                            found[t].append((o, round(score, 9)))
+                            self.assertEqual(rank, len(found[t]))
+                    self.assertEqual(found, expected)
+
+            written = SimilarityBuilder(db_config, top_k=3).build(arrays)
+            with db_config.get_session() as session:
+                self.assertEqual(session.query(TrackSimilarity).count(), written)
+                best = session.query(TrackSimilarity).filter(TrackSimilarity.position == 1).first()
+                self.assertNotEqual(best.track_id, best.similar_track_id)
+            db_config.dispose_engine()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# Modules the CLI must not import before a stage needs them
+DEFERRED_MODULES = ('pandas', 'numpy', 'sqlalchemy', 'pyarrow', 'requests', 'dotenv')
+
+# Import time budget of `--help`, in seconds, several times what it takes on a laptop
+IMPORT_BUDGET = 0.5
+
+
+def import_times(*args):
+    """Module -> self import time in seconds, from `python -X importtime`"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(self_us) / 1e6
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    """Essential test cases for the CLI startup time"""
+
+    def test_help_defers_heavy_imports(self):
+        """Parsing the command line imports neither the data nor the database libraries"""
+        times = import_times('-m', 'src.moovitamix_etl.pipeline', '--help')
+        imported = {module.split('.')[0] for module in times}
+        self.assertEqual(imported & set(DEFERRED_MODULES), set())
+        self.assertLess(sum(times.values()), IMPORT_BUDGET)
+
+    def test_database_config_has_no_import_side_effects(self):
+        """Importing the database configuration neither reads .env nor builds a configuration"""
+        times = import_times('-c', 'import src.moovitamix_etl.load.database_config as m; '
+                                   'assert not hasattr(m, "default_db_config")')
+        self.assertNotIn('dotenv', times)
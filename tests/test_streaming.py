@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import patch
+from datetime import datetime
+import itertools
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from src.moovitamix_etl.streaming import StreamingRunner
+from src.moovitamix_etl.pipeline import ETLPipeline
+from src.moovitamix_etl.extract.dtos.track_dto import TrackDto
+from src.moovitamix_etl.extract.dtos.user_dto import UserDto
+from src.moovitamix_etl.extract.dtos.listen_history import ListenHistoryDto
+
+
+class TestStreamingRunner(unittest.TestCase):
+    """Essential test cases for the streaming execution mode"""
+
+    def test_chunks_flow_in_order(self):
+        """Every chunk reaches the sink, in order, after being transformed"""
+        runner = StreamingRunner(queue_size=2)
+
+        result = runner.run(
+            source=lambda: range(50),
+            transform=lambda n: [n, -n],
+            sink=list
+        )
+
+        expected = [x for n in range(50) for x in (n, -n)]
+        self.assertEqual(result, expected)
+
+    def test_source_error_is_propagated(self):
+        """An extraction failure aborts the run with the original exception"""
+        def failing_source():
+            yield 1
+            raise ConnectionError("source down")
+
+        runner = StreamingRunner(queue_size=1)
+        with self.assertRaises(ConnectionError):
+            runner.run(source=failing_source, transform=lambda n: [n], sink=list)
+
+    def test_sink_error_stops_upstream_stages(self):
+        """A loading failure shuts down producers blocked by backpressure"""
+        def sink(chunks):
+            for chunk in chunks:
+                if chunk == 3:
+                    raise ValueError("bad batch")
+
+        runner = StreamingRunner(queue_size=1)
+        start = time.monotonic()
+        with self.assertRaises(ValueError):
+            # An endless source would block forever on the full queue if not aborted
+            runner.run(source=itertools.count, transform=lambda n: [n], sink=sink)
+        self.assertLess(time.monotonic() - start, 5)
+
+
+class TestStreamingPipeline(unittest.TestCase):
+    """End to end run of the streaming pipeline into CSV files"""
+
+    def setUp(self):
+        now = datetime.now()
+        self.pages = [
+            ('tracks', 1, [TrackDto(1, "Track", "Artist", "Writer", "03:30", "Rock, Pop", "Album", now, now)]),
+            ('users', 1, [UserDto(1, "John", "Doe", "john@example.com", "Male", "Rock, Jazz", now, now)]),
+            ('listen_history', 1, [ListenHistoryDto(1, [1], now, now)]),
+        ]
+        self.test_csv_folder = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        if self.test_csv_folder.exists():
+            shutil.rmtree(self.test_csv_folder)
+
+    def test_streaming_pipeline_into_csv(self):
+        """Genres discovered on the fly are written along with every resource"""
+        with patch('src.moovitamix_etl.extract.extractor.Extractor.iter_all_resources') as mock_extract:
+            mock_extract.return_value = iter(self.pages)
+
+            pipeline = ETLPipeline(into_csv=True, csv_folder=str(self.test_csv_folder), streaming=True)
+            self.assertTrue(pipeline.run())
+
+        files = {path.name.split('_2')[0]: path for path in self.test_csv_folder.glob('*.csv')}
+        self.assertEqual(set(files), {'genres', 'tracks', 'users', 'listen_history'})
+        genres = files['genres'].read_text().splitlines()[1:]
+        self.assertEqual(sorted(genres), ['Jazz', 'Pop', 'Rock'])
@@ -0,0 +1,101 @@
+import csv
+import os
+import tempfile
+import unittest
+from benchmarks.datasets import SyntheticDataset
+from benchmarks.run_benchmarks import serve_dataset
+from src.moovitamix_etl.load.database_config import DatabaseConfig
+from src.moovitamix_etl.load.model.model import ListenHistory, Track, User, track_genres
+from src.moovitamix_etl.pipeline import ETLPipeline
+from src.moovitamix_etl.transform.data_transformer import DataTransformer
+from src.moovitamix_etl.transform.data_validator import DataValidator
+
+
+def corrupt(rows, name, position, value):
+    """Serve `value` as the `name` field of one row of a synthetic resource"""
+    column = rows.columns[name]
+
+    def corrupted(start, stop):
+        values = column(start, stop)
+        if start <= position < stop:
+            values[position - start] = value
+        return values
+
+    rows.columns[name] = corrupted
+    return rows[position]
+
+
+class TestValidation(unittest.TestCase):
+    """Essential test cases for the data quality checks"""
+
+    def test_rejects_carry_every_reason(self):
+        """A row failing several rules is rejected once, with all its reason codes"""
+        dataset = SyntheticDataset(300, seed=2)
+        tracks, users, listen_history, genres = DataTransformer().transform_all(
+            dataset.dtos('tracks'), dataset.dtos('users'), dataset.dtos('listen_history')
+        )
+        tracks[0].duration = '3:07'
+        users[0].email = 'not an email'
+        users[0].created_at = None
+        listen_history[0].track_id = tracks[0].id
+        validator = DataValidator()
+
+        valid = validator.validate_all(tracks, users, listen_history, genres)
+
+        self.assertEqual([len(valid[0]), len(valid[1])], [len(tracks) - 1, len(users) - 1])
+        rejects = {(resource, key): reasons for resource, key, reasons in validator.rejects}
+        self.assertEqual(rejects[('tracks', str(tracks[0].id))], 'invalid_duration')
+        self.assertEqual(rejects[('users', str(users[0].id))], 'invalid_email|invalid_timestamp')
+        events = sum(1 for event in listen_history if event.user_id == users[0].id or event.track_id == tracks[0].id)
+        self.assertEqual(len(valid[2]), len(listen_history) - events)
+        self.assertTrue(all(
+            set(reasons.split('|')) <= {'unknown_user', 'unknown_track'}
+            for (resource, _), reasons in rejects.items() if resource == 'listen_history'
+        ))
+
+    def test_runs_load_valid_rows_and_write_reject_file(self):
+        """Batch and Arrow runs skip the rejected rows and their events instead of failing"""
+        dataset = SyntheticDataset(1000, seed=6)
+        user = corrupt(dataset.users, 'email', 3, 'broken.example.com')
+        track = corrupt(dataset.tracks, 'duration', 5, '7 minutes')
+        corrupt(dataset.tracks, 'created_at', 8, '1990-01-01T00:00:00')
+        bad_tracks = {track['id'], dataset.tracks[8]['id']}
+        events = sum(
+            1 for history in dataset.listen_history[:] for item in history['items']
+            if history['user_id'] == user['id'] or item in bad_tracks
+        )
+        with tempfile.TemporaryDirectory() as tmp, serve_dataset(dataset) as api_url:
+            for arrow in (False, True):
+                db_config = DatabaseConfig(url=f"sqlite:///{tmp}/validate_{arrow}.db")
+                db_config.init_database()
+                reject_dir = os.path.join(tmp, f"rejects_{arrow}")
+                pipeline = ETLPipeline(
+                    api_url=api_url, db_url=db_config.database_url, arrow=arrow, validate=True, reject_dir=reject_dir
+                )
+                self.assertTrue(pipeline.run())
+
+                with db_config.get_session() as session:
+                    self.assertIsNone(session.get(User, user['id']))
+                    self.assertFalse(session.query(Track).filter(Track.id.in_(bad_tracks)).count())
+                    self.assertFalse(session.query(track_genres).filter(track_genres.c.track_id.in_(bad_tracks)).count())
+                    self.assertFalse(session.query(ListenHistory).filter(
+                        (ListenHistory.user_id == user['id']) | ListenHistory.track_id.in_(bad_tracks)
+                    ).count())
+                    self.assertTrue(session.query(ListenHistory).count())
+                db_config.dispose_engine()
+
+                [name] = os.listdir(reject_dir)
+                with open(os.path.join(reject_dir, name)) as f:
+                    rows = list(csv.DictReader(f))
+                keys = [row['key'].split(':', 2) for row in rows if row['resource'] == 'listen_history']
+                self.assertTrue(all(int(user_id) == user['id'] or int(track_id) in bad_tracks for user_id, track_id, _ in keys))
+                # The batch extraction only reads the first page of each resource
+                if arrow:
+                    self.assertEqual(len(keys), events)
+                self.assertIn({'resource': 'users', 'key': str(user['id']), 'reasons': 'invalid_email'}, rows)
+                self.assertIn({'resource': 'tracks', 'key': str(track['id']), 'reasons': 'invalid_duration'}, rows)
+                self.assertEqual(pipeline.metrics.counters['rejected_invalid_timestamp'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
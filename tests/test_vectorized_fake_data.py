@@ -0,0 +1,64 @@
+from src.moovitamix_fastapi.classes_out import TracksOut, UsersOut, ListenHistoryOut, gender_list, genre_list
+from src.moovitamix_fastapi.vectorized_fake_data import LazyFakeDataGenerator, VectorizedFakeDataGenerator
+
+
+# Testing that generated rows match the API models
+def test_vectorized_rows_match_api_models():
+    tracks, users, listen_history = VectorizedFakeDataGenerator(200, seed=1).generate_fake_data()
+    track_ids = {TracksOut(**track).id for track in tracks[:]}
+    for user in users[:]:
+        user = UsersOut(**user)
+        assert user.gender in gender_list()
+        assert user.favorite_genres in genre_list()
+    for history in listen_history[:]:
+        history = ListenHistoryOut(**history)
+        assert len(set(history.items)) == 5
+        assert set(history.items) <= track_ids
+        assert history.created_at <= history.updated_at
+
+
+# Testing reproducibility from the seed
+def test_vectorized_generation_is_seeded():
+    first = VectorizedFakeDataGenerator(1000, seed=3).generate_fake_data()
+    second = VectorizedFakeDataGenerator(1000, seed=3).generate_fake_data()
+    other = VectorizedFakeDataGenerator(1000, seed=4).generate_fake_data()
+    assert [rows[100:200] for rows in first] == [rows[100:200] for rows in second]
+    assert first[1][100:200] != other[1][100:200]
+
+
+# Testing scale beyond the 100k unique ids of the Faker generator
+def test_vectorized_ids_are_unique_at_scale():
+    tracks, users, _ = VectorizedFakeDataGenerator(300_000, seed=5).generate_fake_data()
+    assert len(users) == 300_000
+    assert len({user["id"] for user in users[:]}) == 300_000
+    assert users[-1]["email"] != users[-2]["email"]
+    assert len({(track["name"], track["artist"]) for track in tracks[:]}) == len(tracks)
+
+
+# Testing on demand generation of a huge virtual dataset
+def test_lazy_pages_are_reproducible_in_any_order():
+    generator = LazyFakeDataGenerator(100_000_000, seed=7, block_size=100)
+    tracks, users, listen_history = generator.generate_fake_data()
+    assert len(users) == 100_000_000
+    late_page = listen_history[99_999_950:100_000_000]
+    early_page = listen_history[0:50]
+
+    _, _, fresh_history = LazyFakeDataGenerator(100_000_000, seed=7, block_size=100).generate_fake_data()
+    assert fresh_history[99_999_950:100_000_000] == late_page
+    assert fresh_history[0:50] == early_page
+    # Pages spanning two blocks are stitched from both
+    assert fresh_history[90:110] == fresh_history[90:100] + fresh_history[100:110]
+    for history in late_page:
+        ListenHistoryOut(**history)
+        assert all(1 <= item <= 100_000_000 for item in history["items"])
+
+
+# Testing that lazy ids are a permutation and that served blocks are cached
+def test_lazy_ids_are_unique_and_blocks_cached():
+    generator = LazyFakeDataGenerator(5_000, seed=1, block_size=1000, cache_blocks=2)
+    tracks, users, _ = generator.generate_fake_data()
+    assert sorted(user["id"] for user in users[:]) == list(range(1, 5_001))
+    users[0:10]
+    users[10:20]
+    assert users.block.cache_info().hits >= 1
+    assert users.block.cache_info().currsize <= 2